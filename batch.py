@@ -0,0 +1,115 @@
+"""
+批量分析
+
+parse_many() 对一组表达式逐个分析，按输入顺序返回每个表达式的结果。
+分析表在当前进程中只构造一次，多进程分析时随进程池初始化传给各个工作进程，
+输入按块分发，每块在工作进程中连续分析，以减少进程间通信的开销。
+"""
+import itertools
+import multiprocessing
+import os
+from collections import namedtuple
+
+from ll1_parser import LL1Parser
+from lr_codegen import build_class
+from lr_parser import LRParser
+from pratt_parser import PrattParser
+from recursive_descent import RecursiveDescentParser
+
+# accepted 是否分析成功；error_pos 为出错单词在表达式中的位置，error 为错误信息（成功时均为 None）；
+# productions 为使用的产生式编号序列（编号含义取决于分析器，见各分析器的 format_production）
+ParseResult = namedtuple('ParseResult', ['accepted', 'error_pos', 'error', 'productions'])
+
+# lrgen 为 lr_codegen 由LR分析表生成的专用分析程序，pratt 为算符优先分析（见 pratt_parser 模块）
+PARSER_KINDS = ('lr', 'll1', 'rd', 'lrgen', 'pratt')
+
+DEFAULT_CHUNKSIZE = 256
+
+
+def make_parser(kind, cache_dir=None, grammar=None):
+    """
+    构造并返回不打印信息的分析器，递归下降分析器与表达式绑定，返回 None
+    grammar 为文法文件载入的 grammar_loader.Grammar 时使用它的分析器（只支持 lr、ll1、rd）
+    """
+    if grammar is not None:
+        return grammar.parser(kind, cache_dir)
+    if kind == 'lr':
+        parser = LRParser(verbose=False, cache_dir=cache_dir)
+    elif kind == 'll1':
+        parser = LL1Parser(verbose=False, cache_dir=cache_dir)
+    elif kind == 'rd':
+        return None
+    elif kind == 'lrgen':
+        parser = LRParser(verbose=False, cache_dir=cache_dir)
+        parser.construct_table()
+        return build_class(parser)(verbose=False, cache_dir=cache_dir)
+    elif kind == 'pratt':
+        return PrattParser()
+    else:
+        raise ValueError(f"未知的分析器: {kind!r}，可选值为 {', '.join(PARSER_KINDS)}")
+    parser.construct_table()
+    return parser
+
+
+def parse_one(parser, expr):
+    """用已构造好分析表的分析器（递归下降分析时为 None）分析一个表达式"""
+    if parser is None:
+        parser = RecursiveDescentParser(expr)
+        accepted = parser.parse(trace='off')
+    else:
+        accepted = parser.parse(expr, trace='off')
+    return ParseResult(accepted, parser.error_pos, parser.error, tuple(parser.production_ids))
+
+
+# 工作进程中的分析器，由 _init_worker 设置
+_worker_parser = None
+
+
+def _init_worker(parser):
+    global _worker_parser
+    _worker_parser = parser
+
+
+def _parse_chunk(chunk):
+    parser = _worker_parser
+    return [parse_one(parser, expr) for expr in chunk]
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_parse_many(expressions, parser='lr', workers=None, chunksize=DEFAULT_CHUNKSIZE, cache_dir=None,
+                    grammar=None):
+    """
+    与 parse_many 相同，但按输入顺序逐个产生结果，不在内存中保存全部结果
+    expressions 可以是任意可迭代对象（如逐行读取的文件）
+    """
+    table_parser = make_parser(parser, cache_dir, grammar)
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    if not workers or workers == 1:
+        for expr in expressions:
+            yield parse_one(table_parser, expr)
+        return
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(table_parser,)) as pool:
+        for results in pool.imap(_parse_chunk, _chunks(expressions, chunksize)):
+            yield from results
+
+
+def parse_many(expressions, parser='lr', workers=None, chunksize=DEFAULT_CHUNKSIZE, cache_dir=None,
+               grammar=None):
+    """
+    批量分析表达式，按输入顺序返回 ParseResult 列表
+    parser 为 PARSER_KINDS 中的一种；workers 为进程数，None 或 1 表示在当前进程中分析，
+    0 表示使用全部CPU核心；chunksize 为每次分发给工作进程的表达式个数；
+    grammar 为文法文件载入的文法（见 grammar_loader 模块），默认为内置的表达式文法
+    """
+    return list(iter_parse_many(expressions, parser, workers, chunksize, cache_dir, grammar))
@@ -0,0 +1,368 @@
+"""
+语法分析器性能测试
+
+按规模（10 到 10^7 个单词）、括号嵌套深度、运算符组成和错误位置生成表达式，
+测量递归下降、LL(1)、LR 三种分析器的吞吐量（单词/秒）、小表达式的延迟分位数和峰值内存；
+另外对比大文法上原来的不动点迭代与位集工作表算法计算 FIRST/FOLLOW 集的时间。
+结果可以保存为 JSON 基线，之后与基线比较，吞吐量下降或内存增长超过阈值的项目报告为性能回退。
+
+用法：
+    python benchmark.py                          # 快速测试（最大 10^5 个单词）
+    python benchmark.py --profile full           # 完整测试（最大 10^7 个单词）
+    python benchmark.py --save baseline.json     # 保存为基线
+    python benchmark.py --compare baseline.json  # 与基线比较，有回退时退出码为 1
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+from batch import PARSER_KINDS, make_parser
+from ll1_parser import LL1Parser
+from recursive_descent import RecursiveDescentParser
+
+BASELINE_VERSION = 1
+
+# name 为结果中的项目名，category 为生成方式，tokens 为单词个数（不含结束符），expected 为是否应当分析成功
+Case = namedtuple('Case', ['name', 'category', 'expr', 'tokens', 'expected'])
+
+PROFILES = {
+    'quick': {
+        'sizes': [10, 100, 1000, 10 ** 4, 10 ** 5],
+        'depths': [10, 1000, 10 ** 5],
+        'mix_tokens': 10 ** 4,
+        'invalid_tokens': 10 ** 4,
+        'latency_count': 2000,
+        'grammar_rules': [100, 500],
+        'min_time': 0.2,
+    },
+    'full': {
+        'sizes': [10, 100, 1000, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7],
+        'depths': [10, 1000, 10 ** 5, 10 ** 6],
+        'mix_tokens': 10 ** 6,
+        'invalid_tokens': 10 ** 6,
+        'latency_count': 20000,
+        'grammar_rules': [100, 500, 2000],
+        'min_time': 1.0,
+    },
+}
+
+# 运算符组成：(运算符及权重, 括号出现的概率)
+OPERATOR_MIXES = {
+    'add': ('+-', 0.0),
+    'mul': ('*/', 0.0),
+    'mixed': ('+-*/', 0.0),
+    'paren': ('+-*/', 0.3),
+}
+
+# 重复使用的表达式片段的单词数，大规模表达式由片段拼接而成，生成很快且不占太多内存
+_BLOCK_TOKENS = 999
+
+DEFAULT_THRESHOLD = 0.2
+
+
+def _operand(rng, paren_rate, ops, budget):
+    """生成一个操作数，返回 (文本片段列表, 单词数)"""
+    if budget >= 5 and rng.random() < paren_rate:
+        inner, n = _flat(rng, ops, paren_rate, min(budget - 2, rng.randrange(3, 12)))
+        return ['('] + inner + [')'], n + 2
+    return [str(rng.randrange(1, 1000))], 1
+
+
+def _flat(rng, ops, paren_rate, n_tokens):
+    """生成大约 n_tokens 个单词的合法表达式"""
+    parts, n = _operand(rng, paren_rate, ops, n_tokens)
+    while n + 2 <= n_tokens:
+        operand, m = _operand(rng, paren_rate, ops, n_tokens - n - 1)
+        parts.append(rng.choice(ops))
+        parts.extend(operand)
+        n += m + 1
+    return parts, n
+
+
+def generate(n_tokens, ops='+-*/', paren_rate=0.0, seed=0):
+    """生成大约 n_tokens 个单词的合法表达式，返回 (表达式, 单词数)"""
+    rng = random.Random(seed)
+    if n_tokens <= _BLOCK_TOKENS:
+        parts, n = _flat(rng, ops, paren_rate, n_tokens)
+        return ''.join(parts), n
+    parts, n = _flat(rng, ops, paren_rate, _BLOCK_TOKENS)
+    block = ''.join(parts)
+    copies = max(1, (n_tokens + 1) // (n + 1))
+    return ops[0].join([block] * copies), copies * (n + 1) - 1
+
+
+def generate_nested(depth):
+    """嵌套 depth 层括号的表达式，如 depth=2 时为 ((1))"""
+    return '(' * depth + '1' + ')' * depth, 2 * depth + 1
+
+
+def generate_invalid(n_tokens, position, seed=0):
+    """在大约 position（0 到 1）处插入多余的右括号，返回 (表达式, 单词数)"""
+    left_tokens = int(n_tokens * position)
+    left, n_left = generate(left_tokens, seed=seed) if left_tokens else ('', 0)
+    right, n_right = generate(max(1, n_tokens - n_left - 3), seed=seed + 1)
+    if left:
+        return left + '+)+' + right, n_left + 3 + n_right
+    return ')+' + right, 2 + n_right
+
+
+def size_cases(sizes):
+    for n in sizes:
+        expr, tokens = generate(n)
+        yield Case(f"size/{n}", 'size', expr, tokens, True)
+
+
+def depth_cases(depths):
+    for depth in depths:
+        expr, tokens = generate_nested(depth)
+        yield Case(f"depth/{depth}", 'depth', expr, tokens, True)
+
+
+def mix_cases(n_tokens):
+    for name, (ops, paren_rate) in OPERATOR_MIXES.items():
+        expr, tokens = generate(n_tokens, ops, paren_rate)
+        yield Case(f"mix/{name}", 'mix', expr, tokens, True)
+
+
+def invalid_cases(n_tokens, positions=(0.0, 0.5, 1.0)):
+    for position in positions:
+        expr, tokens = generate_invalid(n_tokens, position)
+        yield Case(f"invalid/{position:g}", 'invalid', expr, tokens, False)
+
+
+def latency_inputs(count, seed=0):
+    """用于测量延迟的小表达式（10 到 40 个单词，部分带括号）"""
+    rng = random.Random(seed)
+    return [generate(rng.randrange(10, 41), paren_rate=0.2, seed=rng.random())[0] for _ in range(count)]
+
+
+def chain_grammar(n_rules):
+    """
+    n_rules 个产生式的文法 N0 -> N1 a | b N0，N1 -> N2 a | b N1，…，
+    FIRST/FOLLOW 沿链逐个传递，按文法顺序扫描的不动点迭代每轮只能前进一步
+    """
+    n = max(1, n_rules // 2)
+    grammar = {f"N{i}": [[f"N{i + 1}", 'a'], ['b', f"N{i}"]] for i in range(n)}
+    grammar[f"N{n}"] = [['c'], ['ε']]
+    return grammar, {'a', 'b', 'c', '$'}
+
+
+def _best_time(func, min_time):
+    """与 measure_case 相同：至少运行 3 次且累计不少于 min_time 秒（单次超过 min_time 时只运行一次），取最短时间"""
+    best = None
+    total = 0.0
+    runs = 0
+    while runs < 3 or total < min_time:
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+        runs += 1
+        if elapsed > min_time:
+            break
+    return best, runs
+
+
+def measure_first_follow(n_rules, min_time):
+    """在链式文法上对比两种算法计算 FIRST/FOLLOW 集的时间（各自多次运行取最短），并检查结果相同"""
+    grammar, terminals = chain_grammar(n_rules)
+    parser = LL1Parser(verbose=False)
+    parser.grammar = grammar
+    parser.terminals = terminals
+    parser.non_terminals = set(grammar)
+
+    def naive():
+        parser.first, parser.follow = {}, {}
+        parser.compute_first_naive()
+        parser.compute_follow_naive()
+
+    def worklist():
+        parser.compute_first()
+        parser.compute_follow()
+
+    naive_seconds, _ = _best_time(naive, min_time)
+    expected = (parser.first, parser.follow)
+    seconds, runs = _best_time(worklist, min_time)
+    if (parser.first, parser.follow) != expected:
+        raise AssertionError(f"first_follow/{n_rules}: 两种算法的结果不同")
+    return {
+        'rules': sum(len(prods) for prods in grammar.values()),
+        'naive_seconds': naive_seconds,
+        'worklist_seconds': seconds,
+        'runs': runs,
+        'speedup': naive_seconds / seconds if seconds > 0 else float('inf'),
+    }
+
+
+def _parse_function(kind):
+    """返回只分析、不打印的函数 f(expr) -> 是否成功"""
+    parser = make_parser(kind)
+    if parser is None:
+        return lambda expr: RecursiveDescentParser(expr).parse(trace='off')
+    return lambda expr: parser.parse(expr, trace='off')
+
+
+def measure_case(parse, case, min_time):
+    """测量一个表达式：多次分析取最短时间，再单独用 tracemalloc 测量一次峰值内存"""
+    best = None
+    total = 0.0
+    runs = 0
+    while runs < 3 or total < min_time:
+        start = time.perf_counter()
+        accepted = parse(case.expr)
+        elapsed = time.perf_counter() - start
+        if accepted != case.expected:
+            raise AssertionError(f"{case.name}: 分析结果为 {accepted}，预期为 {case.expected}")
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+        runs += 1
+        if elapsed > min_time:
+            break
+
+    tracemalloc.start()
+    try:
+        parse(case.expr)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'tokens': case.tokens,
+        'seconds': best,
+        'runs': runs,
+        'tokens_per_sec': case.tokens / best if best > 0 else float('inf'),
+        'peak_bytes': peak,
+    }
+
+
+def _percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure_latency(parse, exprs):
+    """逐个分析小表达式，给出每个表达式分析时间的分位数（微秒）"""
+    timer = time.perf_counter_ns
+    samples = []
+    for expr in exprs:
+        start = timer()
+        parse(expr)
+        samples.append(timer() - start)
+    samples.sort()
+    return {
+        'count': len(samples),
+        'p50_us': _percentile(samples, 0.50) / 1000,
+        'p90_us': _percentile(samples, 0.90) / 1000,
+        'p99_us': _percentile(samples, 0.99) / 1000,
+        'p999_us': _percentile(samples, 0.999) / 1000,
+        'mean_us': sum(samples) / len(samples) / 1000,
+    }
+
+
+def run_suite(parsers=PARSER_KINDS, profile='quick', categories=None, log=print):
+    """运行性能测试，返回可以保存为 JSON 的结果"""
+    settings = PROFILES[profile]
+    generators = {
+        'size': lambda: size_cases(settings['sizes']),
+        'depth': lambda: depth_cases(settings['depths']),
+        'mix': lambda: mix_cases(settings['mix_tokens']),
+        'invalid': lambda: invalid_cases(settings['invalid_tokens']),
+    }
+    categories = categories or list(generators) + ['latency', 'first_follow']
+    results = {}
+    if 'first_follow' in categories:
+        for n_rules in settings['grammar_rules']:
+            metrics = measure_first_follow(n_rules, settings['min_time'])
+            results[f"first_follow/{n_rules}"] = metrics
+            log(f"{'FIRST/FOLLOW':<21} {metrics['rules']:5} 个产生式  不动点迭代 {metrics['naive_seconds']:8.4f} 秒  "
+                f"工作表 {metrics['worklist_seconds']:8.4f} 秒  ({metrics['speedup']:.0f} 倍)")
+    for kind in parsers:
+        parse = _parse_function(kind)
+        for category in categories:
+            if category == 'first_follow':
+                continue
+            if category == 'latency':
+                metrics = measure_latency(parse, latency_inputs(settings['latency_count']))
+                results[f"{kind}/latency"] = metrics
+                log(f"{kind:<5} {'latency':<16} p50 {metrics['p50_us']:9.1f} us  p99 {metrics['p99_us']:9.1f} us")
+                continue
+            for case in generators[category]():
+                metrics = measure_case(parse, case, settings['min_time'])
+                results[f"{kind}/{case.name}"] = metrics
+                log(f"{kind:<5} {case.name:<16} {metrics['tokens_per_sec']:12,.0f} 单词/秒  "
+                    f"峰值内存 {metrics['peak_bytes'] / 1024:10,.1f} KiB")
+    return {
+        'version': BASELINE_VERSION,
+        'profile': profile,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    与基线比较，返回回退项目列表 [(项目, 指标, 基线值, 当前值)]
+    吞吐量下降、延迟或峰值内存增长超过 threshold（比例）时视为回退
+    """
+    regressions = []
+    old_results = baseline.get('results', {})
+    for name, metrics in current['results'].items():
+        old = old_results.get(name)
+        if old is None:
+            continue
+        checks = [('tokens_per_sec', False), ('peak_bytes', True), ('p50_us', True), ('p99_us', True),
+                  ('worklist_seconds', True)]
+        for metric, lower_is_better in checks:
+            if metric not in metrics or metric not in old or not old[metric]:
+                continue
+            ratio = metrics[metric] / old[metric]
+            if (ratio > 1 + threshold) if lower_is_better else (ratio < 1 - threshold):
+                regressions.append((name, metric, old[metric], metrics[metric]))
+    return regressions
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="语法分析器性能测试")
+    arg_parser.add_argument('--profile', choices=sorted(PROFILES), default='quick')
+    arg_parser.add_argument('--parsers', default=','.join(PARSER_KINDS),
+                            help="逗号分隔的分析器列表，可选 " + ', '.join(PARSER_KINDS))
+    arg_parser.add_argument('--categories', default=None,
+                            help="逗号分隔的测试类别，可选 size, depth, mix, invalid, latency, first_follow")
+    arg_parser.add_argument('--save', metavar='FILE', help="把结果保存为 JSON 基线")
+    arg_parser.add_argument('--compare', metavar='FILE', help="与 JSON 基线比较")
+    arg_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help="判定为回退的变化比例（默认 0.2）")
+    args = arg_parser.parse_args(argv)
+
+    parsers = [p.strip() for p in args.parsers.split(',') if p.strip()]
+    categories = [c.strip() for c in args.categories.split(',')] if args.categories else None
+    current = run_suite(parsers, args.profile, categories)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if not regressions:
+            print(f"\n与基线 {args.compare} 相比没有性能回退")
+            return 0
+        print(f"\n与基线 {args.compare} 相比的性能回退（阈值 {args.threshold:.0%}）:")
+        for name, metric, old, new in regressions:
+            print(f"  {name:<24} {metric:<16} {old:14,.1f} -> {new:14,.1f}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""
+可重入的分析接口：不可变的已编译文法 + 每次分析的上下文
+
+LRParser、LL1Parser 等分析器把最近一次分析的结果保存在自身的属性中，递归下降分析器还与一个表达式绑定，
+同一个对象不能同时分析两个表达式。这里把两者分开：
+
+  CompiledGrammar  构造时建好分析表（紧凑数组，可以从缓存加载），之后只读，不再修改，
+                   多个线程可以同时用同一个对象分析（不依赖全局解释器锁，自由线程的 Python 中同样成立）；
+  ParseContext     一次分析的全部可变状态：分析栈、产生式序列、错误信息和语义值，
+                   可以反复使用，分析栈和产生式数组的空间在多次分析之间保留；
+  ContextPool      上下文对象池，并发分析时每个请求从池中取一个上下文，用完放回，不必每次新建。
+
+各分析器的主循环都是只读取分析表的模块级函数（run_lr、run_ll1、run_pratt、run_rd），
+CompiledGrammar 与原来的分析器类调用的是同一个函数，分析结果完全相同。
+
+    grammar = CompiledGrammar('lr')
+    pool = ContextPool(grammar)
+    result = pool.parse("1+2*3")      # 可以在多个线程中同时调用，返回 batch.ParseResult
+"""
+import threading
+from array import array
+
+from batch import ParseResult
+from derivation import LEFTMOST, REVERSE_RIGHTMOST, Derivation, ReductionRecorder
+from ll1_parser import LL1Parser, run_ll1
+from lr_parser import LRParser, run_lr
+from pratt_parser import run_pratt
+from pratt_parser import RULES as PRATT_RULES
+from recursive_descent import RULES as RD_RULES
+from recursive_descent import run_rd
+from scanner import END, scan
+
+# 可以编译的分析器种类（lrgen 生成的分析程序本身就是专用代码，不在其中）
+COMPILED_KINDS = ('lr', 'll1', 'rd', 'pratt')
+
+DEFAULT_POOL_SIZE = 64
+
+
+class ParseContext:
+    """
+    一次分析的状态和结果，由 CompiledGrammar.new_context() 创建
+    再次用于分析时，上一次的 production_ids 会被清空复用，需要保留时请先复制（如 ParseContext.result()）
+    """
+    __slots__ = ('source', 'accepted', 'error', 'error_pos', 'production_ids', 'semantic_value', 'stack')
+
+    def __init__(self, stack):
+        self.source = None
+        self.accepted = False
+        self.error = None
+        self.error_pos = None  # 出错单词在源串中的位置
+        self.production_ids = array('H')
+        self.semantic_value = None
+        self.stack = stack  # 分析栈，类型取决于分析器
+
+    def reset(self, source):
+        self.source = source
+        self.accepted = False
+        self.error = None
+        self.error_pos = None
+        del self.production_ids[:]
+        self.semantic_value = None
+        del self.stack[:]
+
+    def result(self):
+        """复制出与 batch.parse_one 相同的 ParseResult，之后上下文可以放回对象池"""
+        return ParseResult(self.accepted, self.error_pos, self.error, tuple(self.production_ids))
+
+
+class CompiledGrammar:
+    """
+    kind 为 COMPILED_KINDS 中的一种；cache_dir 为分析表缓存目录（见 table_cache 模块）；
+    method 为LR分析表的构造方法（'lalr' 或 'slr'）。构造完成后对象不能再修改
+    """
+    __slots__ = ('kind', 'rules', 'table', 'semantic', 'derivation_order')
+
+    def __init__(self, kind='lr', cache_dir=None, method='lalr'):
+        table = semantic = None
+        if kind == 'lr':
+            parser = LRParser(verbose=False, cache_dir=cache_dir)
+            parser.construct_table(method)
+            rules, table, order = parser.grammar, parser.table, REVERSE_RIGHTMOST
+        elif kind == 'll1':
+            parser = LL1Parser(verbose=False, cache_dir=cache_dir)
+            parser.construct_table()
+            rules, table, order = parser.productions, parser.table, LEFTMOST
+            semantic = parser.semantic_tables
+        elif kind == 'rd':
+            # 递归下降分析记录的顺序不是规范推导的顺序，推导由语义动作重新得到（见 derivation 模块）
+            rules, order = RD_RULES, None
+        elif kind == 'pratt':
+            rules, order = PRATT_RULES, REVERSE_RIGHTMOST
+        else:
+            raise ValueError(f"未知的分析器: {kind!r}，可选值为 {', '.join(COMPILED_KINDS)}")
+        set_field = object.__setattr__
+        set_field(self, 'kind', kind)
+        set_field(self, 'rules', tuple((lhs, tuple(rhs)) for lhs, rhs in rules))
+        set_field(self, 'table', table)
+        set_field(self, 'semantic', semantic)
+        set_field(self, 'derivation_order', order)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledGrammar 构造后不能修改")
+
+    def __delattr__(self, name):
+        raise AttributeError("CompiledGrammar 构造后不能修改")
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        # 随进程池初始化传给工作进程时按原样恢复
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
+    def new_context(self):
+        # 递归下降分析的返回栈每层只占一个字节
+        return ParseContext(bytearray() if self.kind == 'rd' else [])
+
+    def parse(self, expr, context=None, actions=None):
+        """
+        分析 expr，结果写入 context（为 None 时新建）并返回 context
+        actions 为语义动作（接口见 expr_tree 模块），语义值保存在 context.semantic_value 中
+        """
+        if context is None:
+            context = self.new_context()
+        context.reset(expr)
+        tokens = scan(expr)
+        stack = context.stack
+        production_ids = context.production_ids
+        kind = self.kind
+        if kind == 'lr':
+            stack.append(0)
+            index, error, value = run_lr(self.table, self.rules, tokens, stack, production_ids, None, actions)
+        elif kind == 'll1':
+            stack.extend((self.table.end, self.table.start))
+            index, error, value, _ = run_ll1(self.table, tokens, stack, production_ids, None, actions,
+                                             self.semantic)
+        elif kind == 'pratt':
+            index, _, error, value = run_pratt(tokens, stack, production_ids, actions)
+        else:
+            values = [] if actions is not None else None
+            if actions is not None:
+                actions.bind(self.rules)
+            ok, index, error = run_rd(tokens, stack, production_ids, actions, values)
+            if ok and tokens.kinds[index] != END:
+                error = "语法错误: 输入未完全处理"
+            value = values[-1] if ok and values else None
+        context.accepted = error is None
+        context.error = error
+        context.semantic_value = value
+        if error is not None:
+            context.error_pos = tokens.starts[index]
+        return context
+
+    def derivation(self, context):
+        """context 中最近一次分析的推导（见 derivation 模块），产生式序列会被复制"""
+        if self.derivation_order is None:
+            recorder = ReductionRecorder()
+            self.parse(context.source, actions=recorder)
+            return Derivation(self.rules, recorder.production_ids, REVERSE_RIGHTMOST)
+        return Derivation(self.rules, array('H', context.production_ids), self.derivation_order)
+
+    def format_production(self, prod_idx):
+        lhs, rhs = self.rules[prod_idx]
+        return f"{lhs} -> {' '.join(rhs)}"
+
+
+class ContextPool:
+    """
+    CompiledGrammar 的上下文对象池，可以在多个线程中同时使用
+    max_size 为池中最多保留的空闲上下文个数
+    """
+
+    def __init__(self, grammar, max_size=DEFAULT_POOL_SIZE):
+        self.grammar = grammar
+        self.max_size = max_size
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return self.grammar.new_context()
+
+    def release(self, context):
+        with self._lock:
+            if len(self._free) < self.max_size:
+                self._free.append(context)
+
+    def parse(self, expr, actions=None):
+        """分析 expr，返回 ParseResult（与 batch.parse_one 相同）"""
+        context = self.acquire()
+        try:
+            return self.grammar.parse(expr, context, actions).result()
+        finally:
+            self.release(context)
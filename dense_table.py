@@ -0,0 +1,103 @@
+"""
+整数编码的紧凑分析表
+
+符号先编号为小整数：终结符的编号就是词法分析器的单词种别码（scanner.KIND_NAMES 的下标），
+非终结符依次编号。分析表存成一维 array，分析程序每一步只做一次整数下标访问：
+
+LR 的 ACTION 表 action[state * n_terminals + kind]：
+    0       出错
+    s + 1   移进并转到状态 s（正数）
+    -(p+1)  用产生式 p 规约（负数），其中 -1 即"用扩展产生式规约"，表示接受
+LR 的 GOTO 表 goto[state * n_non_terminals + nt]，-1 表示未定义。
+
+LL(1) 的预测分析表 table[nt * n_terminals + kind]：0 表示出错，否则为产生式编号 + 1。
+"""
+from array import array
+
+from scanner import KIND_NAMES
+
+ERROR = 0
+ACCEPT = -1
+
+
+def _compact_array(values):
+    """数值范围允许时使用 2 字节元素，否则使用 4 字节元素"""
+    if all(-32768 <= v <= 32767 for v in values):
+        return array('h', values)
+    return array('i', values)
+
+
+def _terminal_ids(terminal_names, terminals):
+    ids = {name: i for i, name in enumerate(terminal_names)}
+    missing = sorted(set(terminals) - set(ids))
+    if missing:
+        raise ValueError(f"词法分析器不能产生这些终结符: {', '.join(missing)}")
+    return ids
+
+
+class DenseLRTable:
+    __slots__ = ('n_terminals', 'n_states', 'non_terminals', 'nt_id',
+                 'action', 'goto', 'prod_lhs', 'prod_len')
+
+    def __init__(self, grammar, action, goto, non_terminals, terminal_names=KIND_NAMES):
+        term_id = _terminal_ids(terminal_names, {t for row in action.values() for t in row})
+        self.non_terminals = sorted(non_terminals)
+        self.nt_id = {nt: i for i, nt in enumerate(self.non_terminals)}
+        self.n_terminals = n_t = len(terminal_names)
+        self.n_states = n_states = max(list(action) + list(goto)) + 1
+        n_nt = len(self.non_terminals)
+
+        action_cells = [ERROR] * (n_states * n_t)
+        for state, row in action.items():
+            for term, (action_type, value) in row.items():
+                if action_type == 'shift':
+                    code = value + 1
+                elif action_type == 'reduce':
+                    code = -(value + 1)
+                else:
+                    code = ACCEPT
+                action_cells[state * n_t + term_id[term]] = code
+
+        goto_cells = [-1] * (n_states * n_nt)
+        for state, row in goto.items():
+            for nt, target in row.items():
+                goto_cells[state * n_nt + self.nt_id[nt]] = target
+
+        self.action = _compact_array(action_cells)
+        self.goto = _compact_array(goto_cells)
+        # 规约时需要的产生式左部编号和右部长度（ε 不计入长度）
+        self.prod_lhs = array('H', [self.nt_id[lhs] for lhs, _ in grammar])
+        self.prod_len = array('H', [len([s for s in rhs if s != 'ε']) for _, rhs in grammar])
+
+
+class DenseLL1Table:
+    """
+    productions 为 (非终结符, 右部) 的产生式列表，下标即产生式编号；
+    符号编号中终结符在前（即单词种别码），非终结符编号为 n_terminals + 序号。
+    """
+    __slots__ = ('n_terminals', 'symbols', 'symbol_id', 'table', 'rhs_reversed', 'start', 'end')
+
+    def __init__(self, productions, parse_table, start_symbol, terminal_names=KIND_NAMES):
+        non_terminals = list(dict.fromkeys(nt for nt, _ in productions))
+        self.n_terminals = n_t = len(terminal_names)
+        self.symbols = tuple(terminal_names) + tuple(non_terminals)
+        self.symbol_id = {s: i for i, s in enumerate(self.symbols)}
+        term_id = _terminal_ids(terminal_names, {t for row in parse_table.values() for t in row})
+
+        # 分析表项为 (产生式在该非终结符下的序号, 右部)，产生式编号 = 该非终结符的第一个产生式编号 + 序号
+        offsets = {}
+        for p, (nt, _) in enumerate(productions):
+            offsets.setdefault(nt, p)
+        cells = [0] * (len(non_terminals) * n_t)
+        for nt, row in parse_table.items():
+            base = (self.symbol_id[nt] - n_t) * n_t
+            for term, entry in row.items():
+                if entry is not None:
+                    cells[base + term_id[term]] = offsets[nt] + entry[0] + 1
+        self.table = _compact_array(cells)
+
+        # 右部反向存放，展开时直接压栈
+        self.rhs_reversed = tuple(
+            tuple(self.symbol_id[s] for s in reversed(rhs) if s != 'ε') for _, rhs in productions)
+        self.start = self.symbol_id[start_symbol]
+        self.end = self.symbol_id['$']
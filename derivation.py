@@ -0,0 +1,194 @@
+"""
+推导（产生式编号序列）
+
+各分析器把使用的产生式按编号记录在 array('H') 中（每个产生式两个字节），不再逐个拼接字符串。
+Derivation 把这样的序列和文法放在一起，只在需要时格式化为文本，并可以按最左推导或最右推导
+的顺序重新排列。分析器记录产生式的顺序有两种：
+
+  REVERSE_RIGHTMOST  最右推导的逆序，即语法树的后序（LR分析、算符优先分析）；
+  LEFTMOST           最左推导，即语法树的前序（LL(1)分析，文法为消除左递归之后的文法）。
+
+递归下降分析用循环代替直接左递归，记录的顺序两者都不是，而且只由产生式序列不能确定右括号的位置，
+因此它的推导由语义动作 ReductionRecorder 重新得到规约序列（最右推导的逆序）。
+
+重新排列时先由序列建立语法树（只保存每个结点的产生式编号、第一个子结点和下一个兄弟结点，
+终结符不建结点），再用显式栈遍历，不受 Python 递归深度限制。
+"""
+from array import array
+
+REVERSE_RIGHTMOST, LEFTMOST = 'reverse-rightmost', 'leftmost'
+ORDERS = (REVERSE_RIGHTMOST, LEFTMOST)
+
+_NONE = -1
+
+
+class Derivation:
+    """
+    rules 为按产生式编号排列的 (左部, 右部) 序列，production_ids 为分析器记录的产生式编号序列，
+    order 为记录的顺序（ORDERS 中的一种）
+    """
+
+    def __init__(self, rules, production_ids, order):
+        if order not in ORDERS:
+            raise ValueError(f"未知的推导顺序: {order!r}，可选值为 {', '.join(ORDERS)}")
+        self.rules = rules
+        self.production_ids = production_ids
+        self.order = order
+        non_terminals = {lhs for lhs, _ in rules}
+        # 各产生式右部中非终结符的个数，即语法树中该结点的子结点数
+        self._arity = [sum(1 for symbol in rhs if symbol in non_terminals) for _, rhs in rules]
+        self._tree = None
+
+    def __len__(self):
+        return len(self.production_ids)
+
+    def __iter__(self):
+        """按分析器记录的顺序产生产生式编号"""
+        return iter(self.production_ids)
+
+    def format_production(self, prod_idx):
+        lhs, rhs = self.rules[prod_idx]
+        return f"{lhs} -> {' '.join(rhs)}"
+
+    def lines(self, ids=None):
+        """逐个格式化产生式（默认按记录的顺序），用到时才生成字符串"""
+        format_production = self.format_production
+        for prod_idx in (self.production_ids if ids is None else ids):
+            yield format_production(prod_idx)
+
+    def __str__(self):
+        return '\n'.join(self.lines())
+
+    def leftmost(self):
+        """按最左推导的顺序产生产生式编号"""
+        if self.order == LEFTMOST:
+            return iter(self.production_ids)
+        return self._preorder(leftmost=True)
+
+    def rightmost(self):
+        """按最右推导的顺序产生产生式编号"""
+        if self.order == REVERSE_RIGHTMOST:
+            return reversed(self.production_ids)
+        return self._preorder(leftmost=False)
+
+    def sentential_forms(self, leftmost=True):
+        """
+        逐步产生推导中的句型（符号列表），从开始符号到句子
+        每个句型都要复制一次，只适合较短的输入
+        """
+        rules = self.rules
+        non_terminals = {lhs for lhs, _ in rules}
+        form = None
+        for prod_idx in (self.leftmost() if leftmost else self.rightmost()):
+            lhs, rhs = rules[prod_idx]
+            if form is None:
+                form = [lhs]
+                yield list(form)
+            # 被替换的是最左（最右）的非终结符
+            positions = range(len(form)) if leftmost else range(len(form) - 1, -1, -1)
+            pos = next((p for p in positions if form[p] in non_terminals), None)
+            if pos is None or form[pos] != lhs:
+                raise ValueError("产生式序列不是合法的推导")
+            form[pos:pos + 1] = [symbol for symbol in rhs if symbol != 'ε']
+            yield list(form)
+
+    def _preorder(self, leftmost):
+        """遍历语法树，leftmost 为 True 时先访问左边的子结点"""
+        prods, first_child, next_sibling, root = self.tree()
+        stack = [root]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            node = pop()
+            yield prods[node]
+            child = first_child[node]
+            if leftmost:
+                # 右边的子结点先入栈
+                children = []
+                while child != _NONE:
+                    children.append(child)
+                    child = next_sibling[child]
+                stack.extend(reversed(children))
+            else:
+                while child != _NONE:
+                    push(child)
+                    child = next_sibling[child]
+
+    def tree(self):
+        """
+        返回语法树 (prods, first_child, next_sibling, root)：结点 n 的产生式为 prods[n]，
+        没有子结点或兄弟结点时为 -1。产生式序列不是完整的推导时（如分析出错）抛出 ValueError
+        """
+        if self._tree is None:
+            if self.order == REVERSE_RIGHTMOST:
+                self._tree = self._build_postorder()
+            else:
+                self._tree = self._build_preorder()
+        return self._tree
+
+    def _build_postorder(self):
+        arity = self._arity
+        prods = array('H', self.production_ids)
+        n = len(prods)
+        first_child = array('i', [_NONE]) * n
+        next_sibling = array('i', [_NONE]) * n
+        stack = []
+        for node in range(n):
+            k = arity[prods[node]]
+            if k:
+                if k > len(stack):
+                    raise ValueError("产生式序列不是完整的推导")
+                children = stack[len(stack) - k:]
+                del stack[len(stack) - k:]
+                first_child[node] = children[0]
+                for left, right in zip(children, children[1:]):
+                    next_sibling[left] = right
+            stack.append(node)
+        if len(stack) != 1:
+            raise ValueError("产生式序列不是完整的推导")
+        return prods, first_child, next_sibling, stack[0]
+
+    def _build_preorder(self):
+        arity = self._arity
+        prods = array('H', self.production_ids)
+        n = len(prods)
+        first_child = array('i', [_NONE]) * n
+        next_sibling = array('i', [_NONE]) * n
+        last_child = array('i', [_NONE]) * n
+        remaining = array('i', [0]) * n
+        open_nodes = []  # 还有子结点未建立的结点
+        for node in range(n):
+            if node:
+                if not open_nodes:
+                    raise ValueError("产生式序列不是完整的推导")
+                owner = open_nodes[-1]
+                if last_child[owner] == _NONE:
+                    first_child[owner] = node
+                else:
+                    next_sibling[last_child[owner]] = node
+                last_child[owner] = node
+                remaining[owner] -= 1
+                if not remaining[owner]:
+                    open_nodes.pop()
+            remaining[node] = arity[prods[node]]
+            if remaining[node]:
+                open_nodes.append(node)
+        if not n or open_nodes:
+            raise ValueError("产生式序列不是完整的推导")
+        return prods, first_child, next_sibling, 0
+
+
+class ReductionRecorder:
+    """只记录规约序列的语义动作（接口见 expr_tree 模块），规约序列保存在 production_ids 中"""
+
+    def __init__(self):
+        self.production_ids = array('H')
+
+    def bind(self, productions):
+        self.production_ids = array('H')
+
+    def shift(self, kind, start, end):
+        return None
+
+    def reduce(self, prod_idx, values):
+        self.production_ids.append(prod_idx)
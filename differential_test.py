@@ -0,0 +1,852 @@
+"""
+不需要交互的差分测试：用随机生成的有效和无效表达式比较各分析器、驱动程序与 LRParser 的结果
+
+    python differential_test.py          # 或 python -m pytest differential_test.py
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import tempfile
+from array import array
+from collections import Counter
+
+from batch import ParseResult, make_parser, parse_many, parse_one
+from lr_parser import LRParser
+
+SEED = 20240501
+
+
+def random_expression(rng, depth=0):
+    """随机生成一个有效的表达式"""
+    r = rng.random()
+    if depth > 6 or r < 0.3:
+        return str(rng.randint(0, 999))
+    if r < 0.45:
+        return '(' + random_expression(rng, depth + 1) + ')'
+    return random_expression(rng, depth + 1) + rng.choice('+-*/') + random_expression(rng, depth + 1)
+
+
+def random_formula(rng, depth=0):
+    """随机生成 grammars/formula.bnf 公式语言中的一个有效公式"""
+    r = rng.random()
+    if depth > 5 or r < 0.3:
+        return rng.choice(('1', '25', '2.5', '.5e3', '3E-2', 'x', 'foo_1'))
+    if r < 0.4:
+        return '(' + random_formula(rng, depth + 1) + ')'
+    if r < 0.5:
+        return '-' + random_formula(rng, depth + 1)
+    if r < 0.6:
+        return random_formula(rng, depth + 1) + '^' + random_formula(rng, depth + 1)
+    if r < 0.7:
+        args = ', '.join(random_formula(rng, depth + 1) for _ in range(rng.randint(0, 3)))
+        return rng.choice(('f', 'max')) + '(' + args + ')'
+    return random_formula(rng, depth + 1) + rng.choice('+-*/') + random_formula(rng, depth + 1)
+
+
+def corrupt(rng, expr, chars='+-*/() 7x'):
+    """在有效表达式中随机插入或删除一两个字符（插入的字符取自 chars），多数结果是无效的表达式"""
+    text = list(expr)
+    for _ in range(rng.randint(1, 2)):
+        if text and rng.random() < 0.5:
+            del text[rng.randrange(len(text))]
+        else:
+            text.insert(rng.randrange(len(text) + 1), rng.choice(chars))
+    return ''.join(text)
+
+
+def make_lr_parser():
+    parser = LRParser(verbose=False)
+    parser.construct_table()
+    return parser
+
+
+def make_expressions(count=300, seed=SEED):
+    """count 个有效表达式、对它们随机改动得到的（多数无效的）表达式，以及几个边界情况"""
+    rng = random.Random(seed)
+    valid = [random_expression(rng) for _ in range(count)]
+    return valid + [corrupt(rng, expr) for expr in valid] + ['', ' ', '()', '1 2', '((1)', ')', '1+', 'x', '(((7)))']
+
+
+def lr_results(expressions):
+    parser = make_lr_parser()
+    return [parse_one(parser, expr) for expr in expressions]
+
+
+def check_against_lr(results, expected, expressions, productions=True):
+    """
+    逐个比较分析结果与 LRParser 的结果：结论和出错位置必须相同；
+    productions 为 True 时（产生式编号与 LRParser 相同的分析器）分析成功时的产生式序列也必须相同
+    """
+    results = list(results)
+    assert len(results) == len(expected)
+    for expr, result, reference in zip(expressions, results, expected):
+        assert (result.accepted, result.error_pos) == (reference.accepted, reference.error_pos), expr
+        if productions and reference.accepted:
+            assert tuple(result.productions) == reference.productions, expr
+
+
+def _states(node):
+    """链表状态栈中的状态，从栈顶到栈底"""
+    states = []
+    while node is not None:
+        states.append(node[0])
+        node = node[1]
+    return states
+
+
+def check_checkpoints(inc, reference):
+    """
+    检查增量分析器的检查点：单词下标严格递增，且每个检查点的状态栈和产生式个数
+    与 reference（在同一源串上完整分析、每个单词都设检查点的增量分析器）中同一位置的相同
+    """
+    index = inc.checkpoint_index
+    assert len(index) == len(inc.checkpoint_stack) == len(inc.checkpoint_productions)
+    assert all(a < b for a, b in zip(index, index[1:])), "检查点的单词下标不是严格递增的"
+    expected = {i: (stack, productions) for i, stack, productions in
+                zip(reference.checkpoint_index, reference.checkpoint_stack, reference.checkpoint_productions)}
+    for i, stack, productions in zip(index, inc.checkpoint_stack, inc.checkpoint_productions):
+        assert i in expected, f"单词 {i} 处的检查点在完整分析中不存在"
+        assert _states(stack) == _states(expected[i][0]), f"单词 {i} 处检查点的状态栈不同"
+        assert productions == expected[i][1], f"单词 {i} 处检查点的产生式个数不同"
+
+
+def test_incremental_checkpoints_stable_on_repeated_edits():
+    """在检查点边界反复做不改变单词序列的编辑，检查点个数不变"""
+    parser = make_lr_parser()
+    inc = parser.incremental_parser(4)
+    inc.parse('+'.join(['(1*2)'] * 20))
+    count = len(inc.checkpoint_index)
+    for _ in range(50):
+        assert inc.edit(0, 0, ' ')
+        assert len(inc.checkpoint_index) == count
+    inc.edit(0, 50, '')
+    inc.parse(inc.source)
+    count = len(inc.checkpoint_index)
+    for _ in range(50):
+        inc.edit(len(inc.source), len(inc.source), ' ')
+        assert len(inc.checkpoint_index) == count
+
+
+def test_incremental_matches_full_parse():
+    """随机编辑后增量分析的结果和检查点与完整分析相同"""
+    rng = random.Random(SEED)
+    parser = make_lr_parser()
+    for interval in (1, 3, 16):
+        inc = parser.incremental_parser(interval)
+        source = '+'.join(random_expression(rng) for _ in range(20))
+        inc.parse(source)
+        for _ in range(200):
+            start = rng.randrange(len(inc.source) + 1)
+            end = min(len(inc.source), start + rng.choice((0, 0, 1, 2, 5)))
+            text = rng.choice(('', ' ', '1', '+', '(', ')', '*2', '(3)', '9+9'))
+            inc.edit(start, end, text)
+
+            full = parser.incremental_parser(1)
+            full.parse(inc.source)
+            assert (inc.accepted, inc.error_pos) == (full.accepted, full.error_pos), inc.source
+            assert inc.production_ids == full.production_ids, inc.source
+            check_checkpoints(inc, full)
+
+            lr_accepted = parser.parse(inc.source, trace='off')
+            assert inc.accepted == lr_accepted
+            if lr_accepted:
+                assert inc.production_ids == parser.production_ids
+
+
+def test_prevalidate_parse_many_labels_rejected_inputs():
+    """预检查的结论和出错位置与 LRParser 相同，被拒绝的结果标明来源且不含产生式序列"""
+    import prevalidate
+    if prevalidate.np is None:
+        return
+    rng = random.Random(SEED)
+    valid = [random_expression(rng) for _ in range(300)]
+    expressions = valid + [corrupt(rng, expr) for expr in valid] + ['', '()', '1 2', '((1)']
+    parser = make_lr_parser()
+    for expr, result in zip(expressions, prevalidate.parse_many(expressions, 'lr')):
+        accepted = parser.parse(expr, trace='off')
+        assert (result.accepted, result.error_pos) == (accepted, parser.error_pos), expr
+        if accepted:
+            assert result.productions == tuple(parser.production_ids)
+            assert getattr(result, 'error_source', None) is None
+        elif isinstance(result, prevalidate.PrevalidatedResult):
+            assert result.error_source == 'prevalidate' and result.productions == ()
+
+
+def test_engines_match_lr():
+    """LL(1)、递归下降、算符优先分析器和生成的LR分析器与 LRParser 的结论和出错位置相同"""
+    expressions = make_expressions()
+    expected = lr_results(expressions)
+    for kind in ('ll1', 'rd', 'pratt', 'lrgen'):
+        parser = make_parser(kind)
+        # 只有生成的LR分析器与 LRParser 使用同一套产生式编号
+        check_against_lr((parse_one(parser, expr) for expr in expressions), expected, expressions,
+                         productions=kind == 'lrgen')
+
+
+def test_compiled_grammar_matches_lr():
+    """CompiledGrammar 与 ContextPool 的结果与对应的分析器相同"""
+    from compiled_grammar import COMPILED_KINDS, CompiledGrammar, ContextPool
+    expressions = make_expressions(100)
+    expected = lr_results(expressions)
+    for kind in COMPILED_KINDS:
+        pool = ContextPool(CompiledGrammar(kind))
+        results = [pool.parse(expr) for expr in expressions]
+        check_against_lr(results, expected, expressions, productions=kind == 'lr')
+        parser = make_parser(kind)
+        assert results == [parse_one(parser, expr) for expr in expressions], kind
+
+
+def test_batch_workers_match_sequential():
+    """多进程批量分析与在当前进程中逐个分析的结果相同"""
+    expressions = make_expressions(100)
+    expected = lr_results(expressions)
+    assert parse_many(expressions, 'lr') == expected
+    assert parse_many(expressions, 'lr', workers=2, chunksize=7) == expected
+    assert parse_many(expressions, 'rd', workers=2, chunksize=7) == parse_many(expressions, 'rd')
+
+
+def test_lrgen_workers_under_spawn():
+    """生成的LR分析器可以序列化，在 spawn 方式启动的工作进程中批量分析的结果与当前进程中相同"""
+    import pickle
+    import subprocess
+    import sys
+    parser = make_parser('lrgen')
+    restored = pickle.loads(pickle.dumps(parser))
+    assert type(restored) is type(parser)
+    assert parse_one(restored, '(1+2)*3') == parse_one(parser, '(1+2)*3')
+    # 启动方式是全局设置，在子进程中测试
+    script = (
+        "import multiprocessing\n"
+        "from batch import parse_many\n"
+        "if __name__ == '__main__':\n"
+        "    multiprocessing.set_start_method('spawn')\n"
+        "    expressions = ['1+2', '3*', '(4)*5', ')']\n"
+        "    assert parse_many(expressions, 'lrgen', workers=2) == parse_many(expressions, 'lr')\n"
+    )
+    directory = os.path.dirname(os.path.abspath(__file__))
+    subprocess.run([sys.executable, '-c', script], cwd=directory, check=True)
+
+
+def test_push_parser_matches_lr():
+    """把输入切成随机大小的块送入推式分析器，结果与 LRParser 相同"""
+    rng = random.Random(SEED)
+    expressions = make_expressions(100)
+    expected = lr_results(expressions)
+    parser = make_lr_parser()
+    results = []
+    for expr in expressions:
+        push = parser.push_parser(record=True)
+        pos = 0
+        while pos < len(expr):
+            end = min(len(expr), pos + rng.randint(1, 4))
+            if not push.feed(expr, pos, end):
+                break
+            pos = end
+        push.finish()
+        results.append(ParseResult(push.accepted, push.error_pos, push.error, tuple(push.production_ids)))
+    check_against_lr(results, expected, expressions)
+
+
+def test_cached_parser_matches_lr():
+    """缓存命中时的结果（出错位置按单词重新计算）与 LRParser 相同"""
+    from parse_cache import CachedParser
+    rng = random.Random(SEED)
+    expressions = make_expressions(100)
+    # 改变空白得到单词序列相同而出错位置不同的表达式，让缓存命中
+    expressions += [rng.choice(('', ' ')) + expr.replace('+', ' + ') for expr in expressions]
+    expected = lr_results(expressions)
+    cached = CachedParser('lr')
+    check_against_lr([cached.parse(expr) for expr in expressions], expected, expressions)
+    assert cached.cache.hits > 0
+
+
+def test_mapped_file_matches_lr():
+    """用 mmap 分析整个文件或逐行分析，结果与 LRParser 相同"""
+    from mapped_file import parse_file, parse_lines
+    expressions = [expr for expr in make_expressions(100) if expr.strip()]
+    expected = lr_results(expressions)
+    parser = make_lr_parser()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'expressions.txt')
+        with open(path, 'w') as f:
+            f.write('\n'.join(expressions) + '\n')
+        check_against_lr(parse_lines(path, window=64), expected, expressions)
+
+        for expr, reference in zip(expressions[::10], expected[::10]):
+            with open(path, 'w') as f:
+                f.write(expr)
+            result = parse_file(path, parser, window=3, record=True)
+            check_against_lr([result], [reference], [expr])
+
+
+def test_split_parser_matches_lr():
+    """在顶层运算符处切分后多进程分析，结果（含产生式序列）与 LRParser 相同"""
+    from split_parse import SplitParser
+    rng = random.Random(SEED)
+    sources = ['+'.join(random_expression(rng) for _ in range(200)) for _ in range(4)]
+    sources += [corrupt(rng, source) for source in sources]
+    expected = lr_results(sources)
+    with SplitParser(workers=2, chunks_per_worker=3, min_split=64) as split:
+        results = [split.parse(source) for source in sources]
+        assert split.last_segments > 1
+    check_against_lr(results, expected, sources)
+
+
+def test_parse_server_matches_lr():
+    """通过 Unix 套接字向分析服务发送请求，响应与 LRParser 相同"""
+    from parse_server import ParseClient, ParseServer
+    expressions = make_expressions(100)
+    expected = lr_results(expressions)
+
+    async def run(path):
+        server = ParseServer('lr', executor='thread', workers=2, max_batch=16)
+        await server.start(path=path)
+        try:
+            client = await ParseClient.connect(path=path)
+            try:
+                return await asyncio.gather(*(client.parse(expr) for expr in expressions))
+            finally:
+                await client.close()
+        finally:
+            await server.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        responses = asyncio.run(run(os.path.join(directory, 'parse.sock')))
+    for expr, response, reference in zip(expressions, responses, expected):
+        assert (response['accepted'], response['error_pos'], response['error']) == \
+            (reference.accepted, reference.error_pos, reference.error), expr
+
+
+def test_parse_server_close_does_not_block_loop():
+    """关闭服务时等待工作进程退出不阻塞事件循环，其他协程照常运行"""
+    import time
+    from parse_server import ParseClient, ParseServer
+
+    async def run(path):
+        server = ParseServer('lr', executor='process', workers=1)
+        await server.start(path=path)
+        client = await ParseClient.connect(path=path)
+        assert (await client.parse('1+2'))['accepted']
+        await client.close()
+
+        # 让关闭执行器变慢，检查期间事件循环仍在处理其他任务
+        shutdown = server.executor.shutdown
+
+        def slow_shutdown(*args, **kwargs):
+            time.sleep(0.3)
+            shutdown(*args, **kwargs)
+
+        server.executor.shutdown = slow_shutdown
+        ticks = 0
+        stop = False
+
+        async def heartbeat():
+            nonlocal ticks
+            while not stop:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(heartbeat())
+        await asyncio.sleep(0)
+        await server.close()
+        stop = True
+        await task
+        return ticks
+
+    with tempfile.TemporaryDirectory() as directory:
+        assert asyncio.run(run(os.path.join(directory, 'parse.sock'))) >= 10
+
+
+def test_derivations_agree():
+    """各分析器的推导以表达式的单词序列结束，使用同一文法的分析器给出同一棵语法树"""
+    from recursive_descent import RecursiveDescentParser
+    expressions = [expr for expr in make_expressions(50) if len(expr) < 60]
+    lr = make_lr_parser()
+    ll1 = make_parser('ll1')
+    pratt = make_parser('pratt')
+    for expr in expressions:
+        if not lr.parse(expr, trace='off'):
+            continue
+        derivation = lr.derivation()
+        # 各分析器的产生式编号不同，比较格式化后的产生式
+        leftmost = list(derivation.lines(derivation.leftmost()))
+        sentence = list(derivation.sentential_forms())[-1]
+        assert list(derivation.sentential_forms(leftmost=False))[-1] == sentence
+
+        assert pratt.parse(expr, trace='off')
+        other = pratt.derivation()
+        assert list(other.lines(other.leftmost())) == leftmost, expr
+        rd = RecursiveDescentParser(expr)
+        assert rd.parse(trace='off')
+        other = rd.derivation()
+        assert list(other.lines(other.leftmost())) == leftmost, expr
+        # LL(1) 分析使用消除左递归之后的文法，只比较推导出的句子
+        assert ll1.parse(expr, trace='off')
+        assert list(ll1.derivation().sentential_forms())[-1] == sentence, expr
+
+
+def test_grammar_loader_matches_builtin():
+    """由 grammars/expr.bnf 生成的分析器与内置的分析器结果相同"""
+    from grammar_loader import load_grammar
+    grammar = load_grammar(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grammars', 'expr.bnf'))
+    expressions = make_expressions(100)
+    expected = lr_results(expressions)
+    for kind in ('lr', 'll1', 'rd'):
+        results = parse_many(expressions, kind, grammar=grammar)
+        check_against_lr(results, expected, expressions, productions=kind != 'll1')
+        if kind != 'rd':
+            assert results == parse_many(expressions, kind), kind
+
+
+def test_prevalidate_control_whitespace_matches_lr():
+    """str 中的 \\x1c-\\x1f 对分析器是空白，对字节串不是，预检查的结论与 LRParser 相同"""
+    import prevalidate
+    if prevalidate.np is None:
+        return
+    parser = make_lr_parser()
+    for char in '\x1c\x1d\x1e\x1f\t\v':
+        texts = [f'1{char}+2', f'{char}(3){char}', f'4{char}5', f'{char}', f'6+{char}']
+        expressions = texts + [text.encode('ascii') for text in texts]
+        # 全部为 str、含非 ASCII 字符的 str 以及 str 与字节串混合的批都要一致
+        for batch in (texts, texts + ['７'], expressions):
+            for expr, result in zip(batch, prevalidate.parse_many(batch, 'lr')):
+                accepted = parser.parse(expr, trace='off')
+                assert (result.accepted, result.error_pos) == (accepted, parser.error_pos), repr(expr)
+
+
+class _ReductionLines:
+    """把规约序列记录为格式化的产生式，用于比较产生式编号不同的分析器"""
+
+    def __init__(self):
+        self.lines = []
+        self._rules = None
+
+    def bind(self, productions):
+        self._rules = productions
+        self.lines = []
+
+    def shift(self, kind, start, end):
+        return None
+
+    def reduce(self, prod_idx, values):
+        lhs, rhs = self._rules[prod_idx]
+        self.lines.append(f"{lhs} -> {' '.join(rhs)}")
+
+
+def _load_formula_grammar():
+    from grammar_loader import load_grammar
+    return load_grammar(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grammars', 'formula.bnf'))
+
+
+def test_formula_grammar_parsers_agree():
+    """公式语言的 LR、LL(1) 和生成的递归下降分析器的结论、出错位置和规约序列相同"""
+    grammar = _load_formula_grammar()
+    lr, ll1, rd = (grammar.parser(kind) for kind in ('lr', 'll1', 'rd'))
+    rng = random.Random(SEED)
+    valid = [random_formula(rng) for _ in range(300)]
+    formulas = valid + [corrupt(rng, formula, '+-*/^(),. 7x#') for formula in valid]
+    formulas += ['', 'f(', 'f(,)', 'f(1,)', '2^', '--1', '1.', '.', '1e', 'x y', '2^-1', 'max()']
+    assert all(parse_one(lr, formula).accepted for formula in valid)
+    for formula in formulas:
+        expected = parse_one(lr, formula)
+        for parser in (ll1, rd):
+            result = parse_one(parser, formula)
+            assert (result.accepted, result.error_pos) == (expected.accepted, expected.error_pos), formula
+        if expected.accepted:
+            assert parse_one(rd, formula).productions == expected.productions, formula
+            # LL(1) 分析使用消除左递归之后的文法，由语义动作得到原文法的规约序列再比较
+            reductions = _ReductionLines()
+            assert ll1.parse(formula, trace='off', actions=reductions)
+            assert reductions.lines == [lr.format_production(i) for i in expected.productions], formula
+
+
+def test_formula_rd_falls_back_to_lr_on_deep_nesting():
+    """嵌套深度超过递归深度限制时，生成的递归下降分析器改用LR分析，结果与 LRParser 相同"""
+    import sys
+    grammar = _load_formula_grammar()
+    lr, rd = grammar.parser('lr'), grammar.parser('rd')
+    n = 3 * sys.getrecursionlimit()
+    formulas = ['(' * n + 'x' + ')' * n, '-' * n + '1', 'x^' * n + '2', 'f(' * n + ')' * n,
+                '(' * n + 'x' + ')' * (n - 1), '-' * n + '+1', 'x^' * n]
+    tokens = grammar.lexer.scan(formulas[0])
+    try:
+        grammar.rd_module().parse(tokens.kinds, array('H').append)
+    except RecursionError:
+        pass
+    else:
+        raise AssertionError("嵌套不够深，没有触发 RecursionError")
+    for formula in formulas:
+        expected = parse_one(lr, formula)
+        assert parse_one(rd, formula) == expected, formula[:20]
+    assert parse_one(rd, '-(1+x)^2') == parse_one(lr, '-(1+x)^2')
+
+
+def _parse_with_actions(kind, expr, actions):
+    """用 kind 分析器和语义动作 actions 分析 expr，返回是否成功"""
+    if kind == 'rd':
+        from recursive_descent import RecursiveDescentParser
+        return RecursiveDescentParser(expr).parse(trace='off', actions=actions)
+    return _ACTION_PARSERS.setdefault(kind, make_parser(kind)).parse(expr, trace='off', actions=actions)
+
+
+_ACTION_PARSERS = {}
+ACTION_KINDS = ('lr', 'll1', 'pratt', 'rd')
+
+
+def _same_float(a, b):
+    """浮点数结果相同（都为 nan 时也视为相同）"""
+    return a == b or (math.isnan(a) and math.isnan(b))
+
+
+def test_tree_and_rpn_agree_across_engines():
+    """四种分析器构造的语法树和生成的逆波兰程序相同，逆波兰程序与由语法树编译的相同"""
+    from expr_tree import TreeBuilder
+    from rpn import RPNCompiler, compile_tree, evaluate
+    expressions = make_expressions(150)
+    for expr in expressions:
+        outputs = set()
+        for kind in ACTION_KINDS:
+            builder = TreeBuilder(expr)
+            accepted = _parse_with_actions(kind, expr, builder)
+            compiler = RPNCompiler(expr)
+            assert _parse_with_actions(kind, expr, compiler) == accepted
+            if not accepted:
+                outputs.add(None)
+                continue
+            program = compiler.program
+            from_tree = compile_tree(builder.tree)
+            assert (from_tree.ops, from_tree.consts, from_tree.max_depth) == \
+                (program.ops, program.consts, program.max_depth), (kind, expr)
+            outputs.add((builder.tree.to_tuple(), builder.tree.format(), program.format()))
+        assert len(outputs) == 1, expr
+
+    cases = {'1+2*3': 7.0, '(1+2)*3': 9.0, '7-2-1': 4.0, '8/2/2': 2.0, '1/0': math.inf, '(0-1)/0': -math.inf}
+    for expr, value in cases.items():
+        compiler = RPNCompiler(expr)
+        assert _parse_with_actions('lr', expr, compiler)
+        assert evaluate(compiler.program) == value, expr
+
+
+def _compile_all(expressions):
+    """编译一批表达式，语法错误的为 None"""
+    from rpn import compile_expression
+    parser = make_lr_parser()
+    return [compile_expression(parser, expr) for expr in expressions]
+
+
+# 除以零、无穷大和 nan 参与运算的表达式
+SPECIAL_VALUES = ['1/0', '0/0', '(0-1)/0', '1/0-1/0', '1/0*0', '1/(1/0)', '0-1/0', '(1/0)/(1/0)',
+                  '0/0+1', '1/(0-0)', '2*(3-3)/0', '1/0+1/0', '7']
+
+
+def test_rpn_batch_special_values():
+    """除以零、inf 和 nan 参与运算时，RPNBatch 与逐个 evaluate() 的结果相同"""
+    import rpn
+    if rpn.np is None:
+        return
+    programs = _compile_all(SPECIAL_VALUES)
+    results = rpn.evaluate_batch(programs).tolist()
+    for expr, program, result in zip(SPECIAL_VALUES, programs, results):
+        assert _same_float(result, rpn.evaluate(program)), expr
+    values = dict(zip(SPECIAL_VALUES, results))
+    assert values['1/0'] == math.inf and values['(0-1)/0'] == values['0-1/0'] == -math.inf
+    assert all(math.isnan(values[expr]) for expr in ('0/0', '1/0-1/0', '1/0*0', '(1/0)/(1/0)', '0/0+1'))
+    assert values['1/(1/0)'] == 0.0 and values['7'] == 7.0
+
+
+def test_rpn_batch_matches_scalar_evaluation():
+    """混有语法错误的批只打包编译成功的程序，RPNBatch 反复求值的结果都与逐个 evaluate() 相同"""
+    import rpn
+    if rpn.np is None:
+        return
+    rng = random.Random(SEED)
+    expressions = make_expressions(200) + SPECIAL_VALUES
+    rng.shuffle(expressions)
+    compiled = _compile_all(expressions)
+    assert None in compiled
+    programs = [program for program in compiled if program is not None]
+    expected = [rpn.evaluate(program) for program in programs]
+    batch = rpn.RPNBatch(programs)
+    assert len(batch) == len(programs)
+    for results in (batch.evaluate(), batch.evaluate(), rpn.evaluate_batch(programs), rpn.evaluate_batch(batch)):
+        assert len(results) == len(programs)
+        for program, result, value in zip(programs, results.tolist(), expected):
+            assert _same_float(result, value), program.format()
+
+
+def test_rpn_batch_empty_and_single():
+    """空批和只有一个程序的批"""
+    import rpn
+    if rpn.np is None:
+        return
+    assert len(rpn.RPNBatch([])) == 0
+    assert rpn.RPNBatch([]).evaluate().tolist() == []
+    assert len(rpn.evaluate_batch([])) == 0
+    assert rpn.evaluate_batch(_compile_all(['(2+3)*4'])).tolist() == [20.0]
+
+
+class _DepthTrackingStack(list):
+    """记录最大长度的返回栈，用来核对递归下降分析器统计的栈深度"""
+    max_depth = 0
+
+    def append(self, item):
+        super().append(item)
+        self.max_depth = max(self.max_depth, len(self))
+
+
+def _parse_with_stats(kind, expr):
+    """用带 ParseStats 的 kind 分析器分析 expr，返回 (分析器, 本次的 ParseRecord, ParseStats)"""
+    from ll1_parser import LL1Parser
+    from parse_stats import ParseStats
+    from pratt_parser import PrattParser
+    from recursive_descent import RecursiveDescentParser
+    stats = ParseStats()
+    records = []
+    stats.add_observer(records.append)
+    if kind == 'rd':
+        parser = RecursiveDescentParser(expr, stats=stats)
+        parser.parse(trace='off')
+    else:
+        if kind == 'pratt':
+            parser = PrattParser(stats=stats)
+        else:
+            parser = (LRParser if kind == 'lr' else LL1Parser)(verbose=False, stats=stats)
+            parser.construct_table()
+        parser.parse(expr, trace='off')
+    assert len(records) == 1
+    return parser, records[0], stats
+
+
+def test_parse_stats_records():
+    """各分析器的 ParseRecord：单词数、读过的单词数（出错时到出错单词为止）、规约次数、查表次数和栈的最大深度"""
+    from recursive_descent import _CALL_E, run_rd
+    from scanner import scan
+    # (表达式, 分析器) -> (读过的单词数, 规约次数, 查表次数, 栈的最大深度)，均为手工核对的值
+    expected = {
+        ('(1+2)*3', 'lr'): (7, 11, 30, 5), ('(1+2)*3', 'll1'): (7, 16, 16, 7),
+        ('(1+2)*3', 'pratt'): (7, 11, 0, 3), ('(1+2)*3', 'rd'): (7, 11, 0, 5),
+        ('1+(2*', 'lr'): (5, 5, 16, 6), ('1+(2*', 'll1'): (5, 11, 12, 8),
+        ('1+(2*', 'pratt'): (5, 5, 0, 4), ('1+(2*', 'rd'): (5, 10, 0, 5),
+        ('1+*2', 'lr'): (2, 3, 9, 3), ('1+*2', 'll1'): (2, 5, 6, 4),
+        ('1+*2', 'pratt'): (2, 3, 0, 2), ('1+*2', 'rd'): (2, 5, 0, 2),
+    }
+    for (expr, kind), (shifts, reductions, lookups, depth) in expected.items():
+        parser, record, stats = _parse_with_stats(kind, expr)
+        assert record.parser == kind
+        assert record.accepted == (parser.error is None) == (expr == '(1+2)*3')
+        assert record.tokens == len(scan(expr)) - 1
+        assert (record.shifts, record.reductions, record.table_lookups, record.max_stack_depth) == \
+            (shifts, reductions, lookups, depth), (expr, kind, record)
+        assert record.production_counts == Counter(parser.production_ids)
+        assert (stats.parses, stats.accepted, stats.shifts, stats.max_stack_depth) == \
+            (1, record.accepted, shifts, depth)
+
+    # 读过的单词数为出错单词的下标；递归下降分析的最大深度 2 + 3 * 括号嵌套层数与实际的返回栈相同
+    for expr in make_expressions(100):
+        tokens = scan(expr)
+        for kind in ACTION_KINDS:
+            parser, record, _ = _parse_with_stats(kind, expr)
+            consumed = len(tokens) - 1 if record.accepted else tokens.starts.index(parser.error_pos)
+            assert record.shifts == consumed, (kind, expr)
+            assert record.reductions == len(parser.production_ids) == sum(record.production_counts.values())
+        returns = _DepthTrackingStack()
+        run_rd(tokens, returns, array('H'), call=_CALL_E)
+        assert _parse_with_stats('rd', expr)[1].max_stack_depth == returns.max_depth, expr
+
+
+def _raises_value_error(func):
+    try:
+        func()
+    except ValueError:
+        return True
+    return False
+
+
+def test_derivation_orders():
+    """LR（最右推导的逆序）、LL(1)（最左推导）和递归下降（由语义动作重新得到）分析器的推导"""
+    from recursive_descent import RecursiveDescentParser
+    from scanner import KIND_NAMES, scan
+    lr = make_lr_parser()
+    ll1 = make_parser('ll1')
+
+    assert lr.parse('1+2*3', trace='off')
+    derivation = lr.derivation()
+    assert list(derivation.lines(derivation.leftmost())) == [
+        'E -> E + T', 'E -> T', 'T -> F', 'F -> num', 'T -> T * F', 'T -> F', 'F -> num', 'F -> num']
+    assert list(derivation.lines(derivation.rightmost())) == [
+        'E -> E + T', 'T -> T * F', 'F -> num', 'T -> F', 'F -> num', 'E -> T', 'T -> F', 'F -> num']
+    assert [' '.join(form) for form in derivation.sentential_forms(leftmost=False)] == [
+        'E', 'E + T', 'E + T * F', 'E + T * num', 'E + F * num', 'E + num * num',
+        'T + num * num', 'F + num * num', 'num + num * num']
+
+    assert ll1.parse('1+2', trace='off')
+    derivation = ll1.derivation()
+    assert list(derivation.leftmost()) == list(ll1.production_ids)
+    assert [' '.join(form) for form in derivation.sentential_forms()] == [
+        'E', "T E'", "F T' E'", "num T' E'", "num E'", "num + T E'", "num + F T' E'", "num + num T' E'",
+        "num + num E'", 'num + num']
+    assert list(derivation.lines(derivation.rightmost())) == [
+        "E -> T E'", "E' -> + T E'", "E' -> ε", "T -> F T'", "T' -> ε", 'F -> num', "T -> F T'", "T' -> ε",
+        'F -> num']
+
+    for expr in make_expressions(60):
+        if not lr.parse(expr, trace='off'):
+            continue
+        sentence = [KIND_NAMES[kind] for kind in scan(expr).kinds[:-1]]
+        derivation = lr.derivation()
+        assert list(derivation.rightmost()) == list(reversed(lr.production_ids))
+        leftmost = list(derivation.lines(derivation.leftmost()))
+        assert sorted(leftmost) == sorted(derivation.lines())
+        for forms in (list(derivation.sentential_forms()), list(derivation.sentential_forms(leftmost=False))):
+            assert forms[0] == ['E'] and forms[-1] == sentence and len(forms) == len(derivation) + 1, expr
+
+        assert ll1.parse(expr, trace='off')
+        derivation = ll1.derivation()
+        assert list(derivation.leftmost()) == list(ll1.production_ids)
+        assert sorted(derivation.rightmost()) == sorted(ll1.production_ids)
+        assert list(derivation.sentential_forms())[-1] == sentence, expr
+        assert list(derivation.sentential_forms(leftmost=False))[-1] == sentence, expr
+
+        rd = RecursiveDescentParser(expr)
+        assert rd.parse(trace='off')
+        derivation = rd.derivation()
+        assert list(derivation.lines(derivation.leftmost())) == leftmost, expr
+        assert list(derivation.sentential_forms())[-1] == sentence, expr
+
+
+def test_derivation_rejects_truncated_sequences():
+    """出错时的产生式序列不是完整的推导，需要建立语法树重新排列时抛出 ValueError"""
+    from derivation import LEFTMOST, REVERSE_RIGHTMOST, Derivation
+    from recursive_descent import RecursiveDescentParser
+    lr = make_lr_parser()
+    ll1 = make_parser('ll1')
+    # 出错时已经完成的部分可能恰好是一棵完整的子树（如 '(1' 的规约序列就是 '1' 的推导），
+    # 这样的序列无法与完整的推导区分，这里只用出错时还有未完成的运算的表达式
+    for expr in ('1+(2*', '1+(2', '', '1*(2+3', '1*2+3*('):
+        assert not lr.parse(expr, trace='off')
+        derivation = lr.derivation()
+        assert _raises_value_error(lambda: list(derivation.leftmost())), expr
+        assert _raises_value_error(lambda: list(derivation.sentential_forms())), expr
+
+        assert not ll1.parse(expr, trace='off')
+        derivation = ll1.derivation()
+        assert _raises_value_error(lambda: list(derivation.rightmost())), expr
+        assert _raises_value_error(lambda: list(derivation.sentential_forms(leftmost=False))), expr
+
+        rd = RecursiveDescentParser(expr)
+        assert not rd.parse(trace='off')
+        derivation = rd.derivation()
+        assert _raises_value_error(lambda: list(derivation.leftmost())), expr
+
+    # 完整推导去掉最后一个产生式
+    assert lr.parse('1+2', trace='off')
+    truncated = Derivation(lr.grammar, lr.production_ids[:-1], REVERSE_RIGHTMOST)
+    assert _raises_value_error(lambda: list(truncated.leftmost()))
+    assert ll1.parse('1+2', trace='off')
+    truncated = Derivation(ll1.derivation().rules, ll1.production_ids[:-1], LEFTMOST)
+    assert _raises_value_error(lambda: list(truncated.rightmost()))
+    assert _raises_value_error(lambda: Derivation(lr.grammar, (), LEFTMOST).tree())
+
+
+def _run_cli(argv):
+    """用命令行参数 argv 运行批处理模式，返回输出的各行"""
+    import main as cli
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, 'out.txt')
+        cli.run_batch(cli.parse_args(argv + ['--output', output]))
+        with open(output, encoding='utf-8') as f:
+            return f.read().splitlines()
+
+
+def _check_cli_output(lines, output_format, expected):
+    """核对 jsonl 或 tsv 输出（带 --productions）与 ParseResult 列表一致"""
+    assert len(lines) == len(expected)
+    for line_no, (line, result) in enumerate(zip(lines, expected), 1):
+        if output_format == 'jsonl':
+            record = {'line': line_no, 'accepted': result.accepted, 'productions': list(result.productions)}
+            if not result.accepted:
+                record.update(error_pos=result.error_pos, error=result.error)
+            assert json.loads(line) == record, line
+        else:
+            fields = [str(line_no), 'OK' if result.accepted else 'ERROR']
+            if not result.accepted:
+                fields += [str(result.error_pos), result.error.replace('\t', ' ')]
+            fields.append(' '.join(map(str, result.productions)))
+            assert line.split('\t') == fields, line
+
+
+def test_cli_batch_mode():
+    """批处理模式对每种分析器、两种输出格式以及 --mmap、--whole、--grammar 的输出与 batch.parse_one 一致"""
+    from batch import PARSER_KINDS
+    expressions = make_expressions(40)
+    grammar_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grammars', 'expr.bnf')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'input.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(expressions) + '\n')
+        for kind in PARSER_KINDS:
+            parser = make_parser(kind)
+            expected = [parse_one(parser, expr) for expr in expressions]
+            for output_format in ('jsonl', 'tsv'):
+                for extra in ([], ['--mmap']):
+                    argv = ['--parser', kind, '--input', path, '--format', output_format, '--productions']
+                    _check_cli_output(_run_cli(argv + extra), output_format, expected)
+        for kind in ('lr', 'll1', 'rd'):
+            expected = [parse_one(make_parser(kind), expr) for expr in expressions]
+            argv = ['--parser', kind, '--input', path, '--grammar', grammar_path, '--productions']
+            results = [json.loads(line) for line in _run_cli(argv)]
+            assert [(r['accepted'], r.get('error_pos')) for r in results] == \
+                [(e.accepted, e.error_pos) for e in expected], kind
+
+        parser = make_lr_parser()
+        for expr in ('(1+2)*3', '1+(2*', ''):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(expr)
+            expected = [parse_one(parser, expr)]
+            for output_format in ('jsonl', 'tsv'):
+                argv = ['--parser', 'lr', '--input', path, '--whole', '--format', output_format, '--productions']
+                _check_cli_output(_run_cli(argv), output_format, expected)
+
+
+def test_cli_argument_errors():
+    """不支持的参数组合报错退出"""
+    import contextlib
+    import io
+    import main as cli
+    invalid = [
+        ['--parser', 'pratt', '--grammar', 'grammars/expr.bnf'],
+        ['--parser', 'lrgen', '--grammar', 'grammars/expr.bnf'],
+        ['--parser', 'lr', '--grammar', 'grammars/expr.bnf', '--input', 'x.txt', '--mmap'],
+        ['--parser', 'll1', '--input', 'x.txt', '--whole'],
+        ['--parser', 'rd', '--input', 'x.txt', '--whole'],
+        ['--parser', 'lr', '--whole'],
+        ['--parser', 'lr', '--mmap'],
+        ['--parser', 'nope'],
+    ]
+    for argv in invalid:
+        stderr = io.StringIO()
+        try:
+            with contextlib.redirect_stderr(stderr):
+                cli.parse_args(argv)
+        except SystemExit as e:
+            assert e.code == 2, argv
+        else:
+            raise AssertionError(f"参数 {argv} 没有报错")
+        assert 'error' in stderr.getvalue() or '错误' in stderr.getvalue(), argv
+    assert cli.parse_args(['--parser', 'lr', '--input', 'x.txt', '--whole']).whole
+    assert cli.parse_args(['--parser', 'rd', '--grammar', 'grammars/expr.bnf']).grammar
+
+
+def main():
+    tests = [(name, func) for name, func in sorted(globals().items())
+             if name.startswith('test_') and callable(func)]
+    for name, func in tests:
+        func()
+        print(f"{name}: 通过")
+    print(f"全部 {len(tests)} 项测试通过")
+
+
+if __name__ == "__main__":
+    main()
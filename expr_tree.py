@@ -0,0 +1,136 @@
+"""
+紧凑的表达式语法树
+
+ExprTree 把所有结点平铺在三个平行数组中：第 i 个结点为 (op[i], left[i], right[i])。
+运算结点的 left/right 为左右子结点的下标；数字叶子结点不保存子串或整数对象，
+left/right 为该数字在源串中的起止位置，需要时才用 value() 取值。每个结点只占几个字节。
+
+TreeBuilder 实现分析器的语义动作接口，在规约时构造语法树：
+    bind(productions)          分析开始前调用，productions 为分析器规约时使用的 (左部, 右部) 列表
+    shift(kind, start, end)    移进（或匹配）一个单词，返回该单词的语义值
+    reduce(prod_idx, values)   用产生式 prod_idx 规约，values 为右部各符号的语义值，返回左部的语义值
+三种分析器的 parse 方法都接受 actions 参数，并按与LR分析相同的顺序调用这些方法。
+"""
+from array import array
+
+from scanner import NUM
+
+OP_NUM = 0
+OP_ADD = 1
+OP_SUB = 2
+OP_MUL = 3
+OP_DIV = 4
+
+OP_SYMBOLS = ('num', '+', '-', '*', '/')
+_BINARY_OPS = {'+': OP_ADD, '-': OP_SUB, '*': OP_MUL, '/': OP_DIV}
+
+# 规约时构造结点的方式
+PLAN_PASS = 0     # A -> B，语义值直接传递
+PLAN_PAREN = 1    # A -> ( B )，取括号中的语义值
+PLAN_BINARY = 2   # A -> A op B，构造运算结点
+
+
+def plan_productions(productions):
+    """为每个 (左部, 右部) 产生式确定规约时的处理方式，返回 [(方式, 运算结点操作码)]"""
+    plans = []
+    for lhs, rhs in productions:
+        rhs = [s for s in rhs if s != 'ε']
+        if len(rhs) == 3 and rhs[0] == '(' and rhs[2] == ')':
+            plans.append((PLAN_PAREN, None))
+        elif len(rhs) == 3 and rhs[1] in _BINARY_OPS:
+            plans.append((PLAN_BINARY, _BINARY_OPS[rhs[1]]))
+        elif len(rhs) == 1:
+            plans.append((PLAN_PASS, None))
+        else:
+            raise ValueError(f"无法为产生式 {lhs} -> {' '.join(rhs)} 构造语法树结点")
+    return plans
+
+
+class ExprTree:
+    __slots__ = ('source', 'op', 'left', 'right', 'root')
+
+    def __init__(self, source):
+        self.source = source
+        offset_type = 'I' if len(source) < 2 ** 32 else 'Q'
+        self.op = array('B')
+        self.left = array(offset_type)
+        self.right = array(offset_type)
+        self.root = None
+
+    def __len__(self):
+        return len(self.op)
+
+    def add_leaf(self, start, end):
+        self.op.append(OP_NUM)
+        self.left.append(start)
+        self.right.append(end)
+        return len(self.op) - 1
+
+    def add_node(self, op, left, right):
+        self.op.append(op)
+        self.left.append(left)
+        self.right.append(right)
+        return len(self.op) - 1
+
+    def text(self, i):
+        """数字叶子结点在源串中的文本"""
+        text = self.source[self.left[i]:self.right[i]]
+        return text if isinstance(text, str) else bytes(text).decode('ascii')
+
+    def value(self, i):
+        """数字叶子结点的整数值"""
+        return int(self.text(i))
+
+    def to_tuple(self, i=None):
+        """转换为嵌套元组 (运算符, 左子树, 右子树)，叶子结点为整数，主要用于调试和测试"""
+        return self._fold(i, self.value, lambda op, a, b: (OP_SYMBOLS[op], a, b))
+
+    def format(self, i=None):
+        """转换为带完整括号的中缀表达式"""
+        return self._fold(i, self.text, lambda op, a, b: f"({a} {OP_SYMBOLS[op]} {b})")
+
+    def _fold(self, i, leaf, combine):
+        """后序遍历子树，用显式栈避免深层嵌套时的递归"""
+        if i is None:
+            i = self.root
+        op, left, right = self.op, self.left, self.right
+        results = []
+        work = [(i, False)]
+        while work:
+            node, expanded = work.pop()
+            if op[node] == OP_NUM:
+                results.append(leaf(node))
+            elif expanded:
+                b = results.pop()
+                a = results.pop()
+                results.append(combine(op[node], a, b))
+            else:
+                work.append((node, True))
+                work.append((right[node], False))
+                work.append((left[node], False))
+        return results[0]
+
+
+class TreeBuilder:
+    """在分析过程中构造 ExprTree 的语义动作，分析成功后语法树保存在 tree 中"""
+
+    def __init__(self, source):
+        self.tree = ExprTree(source)
+        self.plans = ()
+
+    def bind(self, productions):
+        self.plans = plan_productions(productions)
+
+    def shift(self, kind, start, end):
+        return self.tree.add_leaf(start, end) if kind == NUM else None
+
+    def reduce(self, prod_idx, values):
+        plan, op = self.plans[prod_idx]
+        if plan == PLAN_PASS:
+            node = values[0]
+        elif plan == PLAN_PAREN:
+            node = values[1]
+        else:
+            node = self.tree.add_node(op, values[0], values[2])
+        self.tree.root = node
+        return node
@@ -0,0 +1,216 @@
+"""
+FIRST 集与 FOLLOW 集的计算
+
+文法先编码为整数：符号 0 .. n_terminals-1 为终结符，其余为非终结符；产生式为左部编号和
+右部编号元组（不含 ε）。终结符集合用整数位集表示，第 t 位表示终结符 t。
+
+  可空性   工作表算法：每个产生式记录右部中尚未确定可空的符号个数，某个非终结符变为可空时
+           只更新右部含有它的产生式
+  FIRST    A -> α B β 且 α 可空时 FIRST(A) ⊇ FIRST(B)，按这一依赖关系建图，
+           用 digraph 算法沿强连通分量一次求出，每条边只做一次位集并运算
+  后缀     每个产生式右部各后缀的 FIRST 和可空性从右向左求一次并缓存
+  FOLLOW   A -> α B β 时 FOLLOW(B) ⊇ FIRST(β)，β 可空时 FOLLOW(B) ⊇ FOLLOW(A)，同样用 digraph 求出
+
+不再像逐轮扫描全部产生式的不动点迭代那样反复计算，总时间与文法大小基本成线性关系。
+FirstFollow 接受 LL1Parser 使用的 {非终结符: [右部, ...]} 形式的文法，结果与原来的集合完全相同。
+"""
+
+
+def digraph(edges, base):
+    """
+    DeRemer-Pennello 的 digraph 算法（非递归实现）：
+    求 F(x) = base(x) ∪ {F(y) | x -> y}，同一强连通分量中的结点共享结果，每条边只做一次并运算。
+    """
+    n = len(base)
+    result = list(base)
+    depth = [0] * n
+    stack = []
+    done = n + 1
+    for root in range(n):
+        if depth[root]:
+            continue
+        stack.append(root)
+        depth[root] = len(stack)
+        work = [(root, len(stack), iter(edges[root]))]
+        while work:
+            x, d, children = work[-1]
+            descended = False
+            for y in children:
+                if depth[y] == 0:
+                    stack.append(y)
+                    depth[y] = len(stack)
+                    work.append((y, len(stack), iter(edges[y])))
+                    descended = True
+                    break
+                if depth[y] < depth[x]:
+                    depth[x] = depth[y]
+                result[x] |= result[y]
+            if descended:
+                continue
+            work.pop()
+            if depth[x] == d:
+                value = result[x]
+                while True:
+                    top = stack.pop()
+                    depth[top] = done
+                    result[top] = value
+                    if top == x:
+                        break
+            if work:
+                parent = work[-1][0]
+                if depth[x] < depth[parent]:
+                    depth[parent] = depth[x]
+                result[parent] |= result[x]
+    return result
+
+
+def compute_nullable(n_symbols, n_terminals, prod_lhs, prod_rhs):
+    nullable = [False] * n_symbols
+    remaining = [len(rhs) for rhs in prod_rhs]
+    occurs = [[] for _ in range(n_symbols)]
+    for p, rhs in enumerate(prod_rhs):
+        for s in rhs:
+            if s >= n_terminals:
+                occurs[s].append(p)
+
+    work = []
+    for p, rhs in enumerate(prod_rhs):
+        if not rhs and not nullable[prod_lhs[p]]:
+            nullable[prod_lhs[p]] = True
+            work.append(prod_lhs[p])
+    while work:
+        a = work.pop()
+        for p in occurs[a]:
+            remaining[p] -= 1
+            lhs = prod_lhs[p]
+            if remaining[p] == 0 and not nullable[lhs]:
+                nullable[lhs] = True
+                work.append(lhs)
+    return nullable
+
+
+def compute_first(n_symbols, n_terminals, prod_lhs, prod_rhs, nullable):
+    """返回各符号的 FIRST 位集（不含 ε，可空性另见 nullable），终结符的 FIRST 为其本身"""
+    base = [1 << s if s < n_terminals else 0 for s in range(n_symbols)]
+    edges = [set() for _ in range(n_symbols)]
+    for p, rhs in enumerate(prod_rhs):
+        a = prod_lhs[p]
+        for s in rhs:
+            if s < n_terminals:
+                base[a] |= 1 << s
+                break
+            if s != a:
+                edges[a].add(s)
+            if not nullable[s]:
+                break
+    return digraph(edges, base)
+
+
+def compute_suffix_first(prod_rhs, first, nullable):
+    """
+    返回 (suffix_first, suffix_nullable)：suffix_first[p][i] 为产生式 p 右部从第 i 个符号起的后缀的 FIRST，
+    i 可以等于右部长度（空后缀）
+    """
+    suffix_first = []
+    suffix_nullable = []
+    for rhs in prod_rhs:
+        bits = [0] * (len(rhs) + 1)
+        empty = [True] * (len(rhs) + 1)
+        acc = 0
+        acc_nullable = True
+        for i in range(len(rhs) - 1, -1, -1):
+            s = rhs[i]
+            if nullable[s]:
+                acc |= first[s]
+            else:
+                acc = first[s]
+                acc_nullable = False
+            bits[i] = acc
+            empty[i] = acc_nullable
+        suffix_first.append(bits)
+        suffix_nullable.append(empty)
+    return suffix_first, suffix_nullable
+
+
+def compute_follow(n_symbols, n_terminals, prod_lhs, prod_rhs, suffix_first, suffix_nullable, start, end_bit):
+    """返回各符号的 FOLLOW 位集，start 为开始符号，end_bit 为输入结束符 $ 的位"""
+    base = [0] * n_symbols
+    base[start] |= end_bit
+    edges = [set() for _ in range(n_symbols)]
+    for p, rhs in enumerate(prod_rhs):
+        a = prod_lhs[p]
+        for i, s in enumerate(rhs):
+            if s < n_terminals:
+                continue
+            base[s] |= suffix_first[p][i + 1]
+            if suffix_nullable[p][i + 1] and s != a:
+                edges[s].add(a)
+    return digraph(edges, base)
+
+
+class FirstFollow:
+    """
+    grammar 为 {非终结符: [右部符号列表, ...]}，ε 产生式的右部为 ['ε']，第一个非终结符为开始符号；
+    terminals 为终结符集合（含 $）
+    """
+
+    def __init__(self, grammar, terminals):
+        self.grammar = grammar
+        self.terminal_list = sorted(terminals)
+        self.non_terminal_list = list(grammar)
+        self.n_terminals = n_t = len(self.terminal_list)
+        self.symbol_id = {s: i for i, s in enumerate(self.terminal_list + self.non_terminal_list)}
+        self.n_symbols = len(self.symbol_id)
+
+        self.prod_lhs = []
+        self.prod_rhs = []
+        self.prod_index = {}  # (非终结符, 序号) -> 产生式编号
+        for nt, prods in grammar.items():
+            for i, prod in enumerate(prods):
+                self.prod_index[(nt, i)] = len(self.prod_lhs)
+                self.prod_lhs.append(self.symbol_id[nt])
+                self.prod_rhs.append(tuple(self.symbol_id[s] for s in prod if s != 'ε'))
+
+        self.nullable = compute_nullable(self.n_symbols, n_t, self.prod_lhs, self.prod_rhs)
+        self.first = compute_first(self.n_symbols, n_t, self.prod_lhs, self.prod_rhs, self.nullable)
+        self.suffix_first, self.suffix_nullable = compute_suffix_first(self.prod_rhs, self.first, self.nullable)
+        self._follow = None
+
+    @property
+    def follow(self):
+        if self._follow is None:
+            end_bit = 1 << self.symbol_id['$'] if '$' in self.symbol_id else 0
+            start = self.n_terminals
+            self._follow = compute_follow(self.n_symbols, self.n_terminals, self.prod_lhs, self.prod_rhs,
+                                          self.suffix_first, self.suffix_nullable, start, end_bit)
+        return self._follow
+
+    def terminal_set(self, bits):
+        """把位集还原为终结符集合"""
+        names = self.terminal_list
+        result = set()
+        while bits:
+            low = bits & -bits
+            result.add(names[low.bit_length() - 1])
+            bits ^= low
+        return result
+
+    def first_sets(self):
+        """与 LL1Parser 原来的 FIRST 集格式相同：终结符、非终结符和 'ε' 都有一项，可空时含 'ε'"""
+        sets = {t: {t} for t in self.terminal_list}
+        for nt in self.non_terminal_list:
+            a = self.symbol_id[nt]
+            sets[nt] = self.terminal_set(self.first[a])
+            if self.nullable[a]:
+                sets[nt].add('ε')
+        sets['ε'] = {'ε'}
+        return sets
+
+    def follow_sets(self):
+        follow = self.follow
+        return {nt: self.terminal_set(follow[self.symbol_id[nt]]) for nt in self.non_terminal_list}
+
+    def production_first(self, nt, i):
+        """非终结符 nt 的第 i 个产生式右部的 FIRST 集（不含 ε）及右部是否可空"""
+        p = self.prod_index[(nt, i)]
+        return self.terminal_set(self.suffix_first[p][0]), self.suffix_nullable[p][0]
@@ -0,0 +1,598 @@
+"""
+文法文件的载入
+
+内置的表达式文法在 LL1Parser、LRParser 和 RecursiveDescentParser 中各写了一遍，单词也固定在
+共用的词法分析器中。这里从文法文件读入单词定义和产生式，一次完成全部预处理，供三种分析方法共用：
+
+  词法    由单词定义构造 scanner.Lexer（单个预编译的正则），单词序列的形式与内置语言相同；
+  LR      LRParser(grammar=...) 用 LRTableBuilder 构造分析表，产生式编号即文件中的顺序；
+  LL(1)   LL1Parser(grammar=...) 消除直接左递归后构造预测分析表；
+  递归下降 由 FIRST/FOLLOW 集生成专用的 Python 代码，每个非终结符一个函数，直接左递归改为循环，
+          按产生式的预测集选择候选式，记录的规约序列与LR分析完全相同（最右推导的逆序）。
+
+文法文件的格式：
+
+    # 注释到行尾
+    %token NUM /\\d+(\\.\\d*)?/     命名单词及其正则，终结符名即单词名
+    %skip  /\\/\\/[^\\n]*/          额外跳过的内容（如注释），空白总是被跳过
+    %start expr                   开始符号，默认为第一条规则的左部
+
+    expr : expr '+' term | term ;
+    term : NUM | '(' expr ')' ;
+    opt  : 'x' | ε ;              ε 或空的候选式表示空产生式
+
+引号中的字面量自动成为单词，终结符名即字面量本身。扫描时跳过的内容优先，然后字面量优先于命名单词，
+较长的字面量优先，命名单词也能匹配的字面量（关键字）不匹配更长单词的前缀；命名单词按声明顺序匹配。
+单词种别码依次为命名单词（声明顺序）和字面量（首次出现的顺序），最后是 $ 和无法识别的字符。
+
+    grammar = load_grammar('grammars/formula.bnf')
+    parser = grammar.parser('rd')        # 'lr'、'll1' 或 'rd'
+    parser.parse("sin(x)^2 + -1.5e3", trace='off')
+"""
+import argparse
+import copy
+import re
+import sys
+import types
+from array import array
+from collections import Counter
+
+from derivation import REVERSE_RIGHTMOST, Derivation
+from first_follow import FirstFollow
+from ll1_parser import LL1Parser
+from lr_parser import LRParser, run_lr
+from parse_stats import ParseRecord, clock
+from scanner import Lexer
+from step_trace import TRACE_PRINT, check_trace_mode
+
+# Grammar.parser 可以构造的分析器种类
+GRAMMAR_PARSER_KINDS = ('lr', 'll1', 'rd')
+
+EPSILON = 'ε'
+AUGMENTED_START = "S'"
+
+# 文法文件的单词，换行只用于计算行号
+_DSL_TOKEN_RE = re.compile(r"""
+    (?P<space>[ \t\r\f\v]+|\#[^\n]*)
+  | (?P<newline>\n)
+  | (?P<directive>%[A-Za-z_]+)
+  | (?P<regex>/(?:\\.|[^/\\\n])+/)
+  | (?P<literal>'(?:\\.|[^'\\\n])+'|"(?:\\.|[^"\\\n])+")
+  | (?P<name>[^\W\d]\w*)
+  | (?P<punct>[:|;])
+  | (?P<error>.)
+""", re.VERBOSE)
+
+
+class RDMismatch(Exception):
+    """生成的递归下降分析程序遇到不能接受的单词：index 为单词下标，expected 为期望的单词种别码"""
+
+    def __init__(self, index, expected):
+        super().__init__(index, expected)
+        self.index = index
+        self.expected = expected
+
+
+def _sequence_first(first, symbols):
+    """符号串的 FIRST 集（不含 ε）及是否可空，first 为 FirstFollow.first_sets() 的结果"""
+    result = set()
+    for symbol in symbols:
+        result |= first[symbol] - {EPSILON}
+        if EPSILON not in first[symbol]:
+            return result, False
+    return result, True
+
+
+def _kind_test(kinds):
+    """判断 k 是否属于单词种别集合 kinds 的表达式"""
+    kinds = sorted(kinds)
+    if len(kinds) == 1:
+        return f"k == {kinds[0]}"
+    if kinds[-1] - kinds[0] == len(kinds) - 1:
+        return f"{kinds[0]} <= k <= {kinds[-1]}"
+    return f"k in {{{', '.join(map(str, kinds))}}}"
+
+
+class Grammar:
+    """
+    文法文件载入的文法，构造时完成全部预处理，之后只读：
+      rules         [(左部, 右部)]，第 0 个为扩展产生式 S' -> 开始符号，其余按文件中的顺序编号，
+                    ε 产生式的右部为 ('ε',)；编号与 LRParser、生成的递归下降分析程序记录的编号相同
+      start         开始符号
+      non_terminals 非终结符（不含 S'），按首次定义的顺序
+      terminals     终结符名，下标即单词种别码
+      lexer         scanner.Lexer
+      bnf           LL1Parser 使用的 {非终结符: [右部, ...]} 形式，开始符号在前，ε 产生式右部为 ['ε']
+      first/follow  FIRST 集和 FOLLOW 集（格式与 LL1Parser 相同）
+    token_patterns 为 [(单词名, 正则)]，literals 为字面量（首次出现的顺序），skip_patterns 为跳过内容的正则
+    """
+
+    def __init__(self, token_patterns, literals, skip_patterns, productions, start, name='<grammar>'):
+        self.name = name
+        self.start = start
+        self.token_patterns = tuple(token_patterns)
+        self.literals = tuple(literals)
+        self.skip_patterns = tuple(skip_patterns)
+        self.terminals = tuple(token for token, _ in token_patterns) + self.literals
+        self.lexer = self.build_lexer()
+
+        self.non_terminals = tuple(dict.fromkeys(lhs for lhs, _ in productions))
+        self.rules = ((AUGMENTED_START, (start,)),) + tuple(
+            (lhs, tuple(rhs) or (EPSILON,)) for lhs, rhs in productions)
+        bnf = {start: []}
+        for lhs, rhs in productions:
+            bnf.setdefault(lhs, []).append(list(rhs) or [EPSILON])
+        self.bnf = bnf
+
+        sets = FirstFollow(bnf, set(self.terminals) | {'$'})
+        self.first = sets.first_sets()
+        self.follow = sets.follow_sets()
+
+        self.rd_conflicts = []
+        self._rd_source = None
+        self._rd_module = None
+        self._parsers = {}  # (种类, 缓存目录) -> 已构造分析表的分析器，parser() 返回它的副本
+
+    def __getstate__(self):
+        # 生成的模块不能序列化，在工作进程中按需重新生成
+        state = dict(self.__dict__)
+        state['_rd_module'] = None
+        state['_parsers'] = {}
+        return state
+
+    def build_lexer(self):
+        """
+        构造词法分析器：跳过的内容、字面量（较长的在前）、命名单词依次作为正则的候选项，
+        最后一个分组匹配任意无法识别的非空白字符
+        """
+        kinds = {name: kind for kind, name in enumerate(self.terminals)}
+        parts = []
+        group_kinds = [None]
+        if self.skip_patterns:
+            parts.append('(?:' + '|'.join(f'(?:{p})' for p in self.skip_patterns) + ')')
+            group_kinds.extend([None] * sum(re.compile(p).groups for p in self.skip_patterns))
+
+        def add_group(pattern, kind):
+            parts.append(f'({pattern})')
+            group_kinds.append(kind)
+            group_kinds.extend([None] * re.compile(pattern).groups)
+
+        for literal in sorted(self.literals, key=len, reverse=True):
+            # 命名单词也能匹配的字面量（关键字）后面不能紧跟字母数字，否则 'in' 会匹配标识符 'index' 的前缀
+            keyword = re.match(r'\w', literal[-1]) and any(
+                re.fullmatch(pattern, literal) for _, pattern in self.token_patterns)
+            add_group(re.escape(literal) + (r'(?!\w)' if keyword else ''), kinds[literal])
+        for token, pattern in self.token_patterns:
+            add_group(pattern, kinds[token])
+        kind_names = self.terminals + ('$', '?')
+        add_group(r'\S', len(kind_names) - 1)
+        return Lexer('|'.join(parts), group_kinds, kind_names)
+
+    def format_production(self, prod_idx):
+        lhs, rhs = self.rules[prod_idx]
+        return f"{lhs} -> {' '.join(rhs)}"
+
+    def parser(self, kind='lr', cache_dir=None, stats=None):
+        """
+        返回使用本文法、已构造好分析表的分析器（kind 为 GRAMMAR_PARSER_KINDS 中的一种）
+        分析表只构造一次，之后每次返回它的浅复制，分析表在各副本间共享
+        """
+        if kind not in GRAMMAR_PARSER_KINDS:
+            raise ValueError(f"未知的分析器: {kind!r}，可选值为 {', '.join(GRAMMAR_PARSER_KINDS)}")
+        template = self._parsers.get((kind, cache_dir))
+        if template is None:
+            if kind == 'lr':
+                template = LRParser(verbose=False, cache_dir=cache_dir, grammar=self)
+                template.construct_table()
+            elif kind == 'll1':
+                template = LL1Parser(verbose=False, cache_dir=cache_dir, grammar=self)
+                template.construct_table()
+            else:
+                template = GeneratedRDParser(self, self.parser('lr', cache_dir))
+            self._parsers[(kind, cache_dir)] = template
+        parser = copy.copy(template)
+        parser.stats = stats
+        return parser
+
+    def rd_source(self):
+        """生成的递归下降分析程序的源代码"""
+        if self._rd_source is None:
+            self._rd_source = _RDGenerator(self).generate()
+        return self._rd_source
+
+    def rd_module(self):
+        """在内存中加载生成的递归下降分析程序，返回模块"""
+        if self._rd_module is None:
+            module = types.ModuleType('generated_rd_parser')
+            module.RDMismatch = RDMismatch
+            exec(compile(self.rd_source(), f"<rd_parser {self.name}>", 'exec'), module.__dict__)
+            self._rd_module = module
+        return self._rd_module
+
+
+class _RDGenerator:
+    """
+    由文法生成递归下降分析程序。每个非终结符 A 生成一个函数：
+      A -> A α1 | ... | β1 | ...   先按预测集选择一个 β 分析，再循环：下一个单词在 FIRST(αi) 中时分析 αi
+    β 的预测集为 FIRST(β)，β 可空时再加上 FOLLOW(A)。预测集相交（不是LL(1)文法）时记录冲突，
+    先出现的候选式优先。分析完一个候选式后立即记录其产生式编号，得到的就是语法树的后序
+    """
+
+    def __init__(self, grammar):
+        self.grammar = grammar
+        self.kinds = {name: kind for kind, name in enumerate(grammar.terminals)}
+        self.functions = {nt: f"_parse_{i}" for i, nt in enumerate(grammar.non_terminals)}
+        self.lines = []
+
+    def emit(self, indent, line):
+        self.lines.append('    ' * indent + line)
+
+    def check_left_recursion(self):
+        """直接左递归改为循环；经过其他非终结符（或可空的前缀）的左递归无法改写，抛出 ValueError"""
+        grammar = self.grammar
+        first = grammar.first
+        edges = {nt: set() for nt in grammar.non_terminals}
+        for lhs, rhs in grammar.rules[1:]:
+            if rhs[0] == lhs:
+                if _sequence_first(first, rhs[1:])[1]:
+                    raise ValueError(f"左递归产生式 {lhs} -> {' '.join(rhs)} 的其余部分不能为空")
+                continue
+            for symbol in rhs:
+                if symbol in edges:
+                    edges[lhs].add(symbol)
+                if EPSILON not in first[symbol]:
+                    break
+        # 深度优先搜索，state 为 1 表示正在访问
+        state = {}
+        for root in grammar.non_terminals:
+            if root in state:
+                continue
+            state[root] = 1
+            path = [root]
+            stack = [iter(sorted(edges[root]))]
+            while stack:
+                nt = next(stack[-1], None)
+                if nt is None:
+                    state[path.pop()] = 2
+                    stack.pop()
+                elif state.get(nt) == 1:
+                    cycle = path[path.index(nt):] + [nt]
+                    raise ValueError(f"文法含有间接左递归 {' -> '.join(cycle)}，不能生成递归下降分析程序")
+                elif nt not in state:
+                    state[nt] = 1
+                    path.append(nt)
+                    stack.append(iter(sorted(edges[nt])))
+
+    def predict(self, lhs, alternatives):
+        """[(产生式编号, 右部, 预测集)]，预测集为单词种别码集合，与前面的候选式重复的单词记为冲突"""
+        grammar = self.grammar
+        result = []
+        seen = set()
+        for prod_idx, rhs in alternatives:
+            terminals, nullable = _sequence_first(grammar.first, rhs)
+            if nullable:
+                terminals |= grammar.follow[lhs]
+            kinds = {self.kinds[t] if t != '$' else grammar.lexer.end for t in terminals}
+            for kind in sorted(kinds & seen):
+                grammar.rd_conflicts.append((lhs, grammar.lexer.kind_names[kind]))
+            result.append((prod_idx, rhs, kinds - seen))
+            seen |= kinds
+        return result
+
+    def emit_body(self, indent, prod_idx, symbols, dispatched):
+        """分析符号串 symbols 后记录产生式 prod_idx；dispatched 为 True 时第一个终结符已由分派检查过"""
+        for pos, symbol in enumerate(s for s in symbols if s != EPSILON):
+            if symbol in self.functions:
+                self.emit(indent, f"i = {self.functions[symbol]}(kinds, i, emit)")
+                continue
+            kind = self.kinds[symbol]
+            if not (pos == 0 and dispatched):
+                self.emit(indent, f"if kinds[i] != {kind}:")
+                self.emit(indent + 1, f"raise RDMismatch(i, ({kind},))")
+            self.emit(indent, "i += 1")
+        self.emit(indent, f"emit({prod_idx})")
+
+    def emit_dispatch(self, indent, nt, alternatives):
+        """按预测集选择候选式的 if/elif 链，最后留下 else: 由调用者填写，返回所有预测集的并"""
+        expected = set()
+        keyword = 'if'
+        for prod_idx, rhs, kinds in self.predict(nt, alternatives):
+            if not kinds:
+                continue
+            expected |= kinds
+            self.emit(indent, f"{keyword} {_kind_test(kinds)}:")
+            self.emit_body(indent + 1, prod_idx, rhs, True)
+            keyword = 'elif'
+        self.emit(indent, "else:" if keyword == 'elif' else "if True:")
+        return expected
+
+    def emit_function(self, nt):
+        grammar = self.grammar
+        alternatives = [(p, rhs) for p, (lhs, rhs) in enumerate(grammar.rules) if lhs == nt and p]
+        loops = [(p, rhs[1:]) for p, rhs in alternatives if rhs[0] == nt]
+        bases = [(p, rhs) for p, rhs in alternatives if rhs[0] != nt]
+        if not bases:
+            raise ValueError(f"非终结符 {nt} 只有左递归产生式")
+
+        self.emit(0, f"def {self.functions[nt]}(kinds, i, emit):")
+        for p, _ in alternatives:
+            self.emit(1, f"# {grammar.format_production(p)}")
+        if len(bases) == 1:
+            # 只有一个候选式时不必分派，出错由其中的检查发现
+            p, rhs = bases[0]
+            self.emit_body(1, p, rhs, False)
+        else:
+            self.emit(1, "k = kinds[i]")
+            expected = self.emit_dispatch(1, nt, bases)
+            self.emit(2, f"raise RDMismatch(i, {tuple(sorted(expected))!r})")
+
+        if loops:
+            self.emit(1, "while True:")
+            self.emit(2, "k = kinds[i]")
+            self.emit_dispatch(2, nt, loops)
+            self.emit(3, "return i")
+        else:
+            self.emit(1, "return i")
+        self.emit(0, "")
+        self.emit(0, "")
+
+    def generate(self):
+        self.check_left_recursion()
+        grammar = self.grammar
+        self.lines.extend([
+            '"""',
+            f"由 grammar_loader 根据文法 {grammar.name} 生成的递归下降分析程序，请勿手工修改",
+            '"""',
+            "# RDMismatch 由 grammar_loader 加载本模块时提供",
+            "",
+            f"END = {grammar.lexer.end}",
+            "",
+            "",
+        ])
+        for nt in grammar.non_terminals:
+            self.emit_function(nt)
+        self.lines.extend([
+            "def parse(kinds, emit):",
+            '    """分析整个单词序列，规约使用的产生式编号依次传给 emit，出错时抛出 RDMismatch"""',
+            f"    i = {self.functions[grammar.start]}(kinds, 0, emit)",
+            "    if kinds[i] != END:",
+            "        raise RDMismatch(i, ())",
+            "    return i",
+            "",
+        ])
+        return '\n'.join(self.lines)
+
+
+class GeneratedRDParser:
+    """
+    由文法生成的递归下降分析器，通过 Grammar.parser('rd') 构造。production_ids 与LR分析的规约序列相同；
+    嵌套过深超出 Python 的递归深度限制时，改用同一文法的LR分析表（lr_parser 为已构造分析表的 LRParser）
+    分析这个输入，产生式编号相同，结果一致
+    """
+
+    def __init__(self, grammar, lr_parser, stats=None):
+        self.grammar = grammar
+        self.lr_parser = lr_parser
+        self.stats = stats
+        self._parse = grammar.rd_module().parse
+        self.production_ids = array('H')
+        self.error = None
+        self.error_pos = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_parse']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._parse = self.grammar.rd_module().parse
+
+    def parse(self, expr, trace=TRACE_PRINT):
+        # 没有分析过程表，trace 只决定是否打印结果
+        trace = check_trace_mode(trace)
+        stats = self.stats
+        if stats is not None:
+            started = clock()
+        tokens = self.grammar.lexer.scan(expr)
+        if stats is not None:
+            tokenized = clock()
+        production_ids = array('H')
+        self.production_ids = production_ids
+        self.error = None
+        self.error_pos = None
+        index = len(tokens) - 1
+        try:
+            self._parse(tokens.kinds, production_ids.append)
+        except RDMismatch as e:
+            index = e.index
+            self.error = self.format_error(tokens, e)
+        except RecursionError:
+            del production_ids[:]
+            table = self.lr_parser.table
+            index, self.error, _ = run_lr(table, self.lr_parser.grammar, tokens, [0], production_ids)
+        if self.error is not None:
+            self.error_pos = tokens.starts[index]
+
+        if stats is not None:
+            stats.record(ParseRecord('rd', self.error is None, len(tokens) - 1, index, len(production_ids),
+                                     Counter(production_ids), 0, None,
+                                     tokenized - started, clock() - tokenized))
+
+        if trace == TRACE_PRINT:
+            if self.error is None:
+                print("分析成功!")
+                print("使用的产生式序列:")
+                for prod in self.productions:
+                    print(prod)
+            else:
+                print(self.error)
+                print("语法错误!")
+        return self.error is None
+
+    @staticmethod
+    def format_error(tokens, mismatch):
+        if not mismatch.expected:
+            return "语法错误: 输入未完全处理"
+        names = [tokens.kind_names[kind] for kind in mismatch.expected]
+        return f"语法错误: 期望 {' 或 '.join(names)}, 得到 {tokens.name(mismatch.index)}"
+
+    @property
+    def productions(self):
+        """按使用顺序给出产生式字符串"""
+        return [self.grammar.format_production(i) for i in self.production_ids]
+
+    def format_production(self, prod_idx):
+        return self.grammar.format_production(prod_idx)
+
+    def derivation(self):
+        """最近一次分析的推导（最右推导的逆序，见 derivation 模块）"""
+        return Derivation(self.grammar.rules, self.production_ids, REVERSE_RIGHTMOST)
+
+
+def _unescape_literal(text):
+    return re.sub(r'\\(.)', r'\1', text[1:-1])
+
+
+def parse_grammar(text, name='<grammar>'):
+    """由文法文件的内容构造 Grammar，格式错误时抛出 ValueError（信息中含行号）"""
+    line = 1
+    items = []  # (类别, 文本, 行号)
+    for m in _DSL_TOKEN_RE.finditer(text):
+        group = m.lastgroup
+        if group == 'newline':
+            line += 1
+        elif group == 'error':
+            raise ValueError(f"{name} 第 {line} 行: 无法识别的字符 {m.group()!r}")
+        elif group != 'space':
+            items.append((group, m.group(), line))
+    items.append(('end', '', line))
+
+    token_patterns = {}
+    skip_patterns = []
+    start = None
+    productions = []  # [(左部, 右部符号列表（名字或字面量）, 行号)]
+    pos = 0
+
+    def expect(*groups):
+        nonlocal pos
+        group, value, lineno = items[pos]
+        if group not in groups and value not in groups:
+            found = '文件结束' if group == 'end' else repr(value)
+            raise ValueError(f"{name} 第 {lineno} 行: 期望 {' 或 '.join(groups)}, 得到 {found}")
+        pos += 1
+        return value, lineno
+
+    def compile_pattern(value, lineno):
+        pattern = value[1:-1]
+        try:
+            compiled = re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"{name} 第 {lineno} 行: 正则表达式 {value} 有误: {e}") from None
+        if compiled.match(''):
+            raise ValueError(f"{name} 第 {lineno} 行: 正则表达式 {value} 不能匹配空串")
+        return pattern
+
+    while items[pos][0] != 'end':
+        group, value, lineno = items[pos]
+        if group == 'directive':
+            pos += 1
+            if value == '%token':
+                token, lineno = expect('name')
+                if token in token_patterns or token == EPSILON:
+                    raise ValueError(f"{name} 第 {lineno} 行: 单词 {token} 重复定义")
+                token_patterns[token] = compile_pattern(*expect('regex'))
+            elif value == '%skip':
+                skip_patterns.append(compile_pattern(*expect('regex')))
+            elif value == '%start':
+                start, _ = expect('name')
+            else:
+                raise ValueError(f"{name} 第 {lineno} 行: 未知的指令 {value}")
+            continue
+        lhs, lineno = expect('name')
+        if lhs == EPSILON:
+            raise ValueError(f"{name} 第 {lineno} 行: ε 不能作为产生式左部")
+        expect(':')
+        rhs = []
+        while True:
+            group, value, lineno = items[pos]
+            if value in ('|', ';'):
+                pos += 1
+                productions.append((lhs, [symbol for symbol in rhs if symbol != EPSILON], lineno))
+                rhs = []
+                if value == ';':
+                    break
+            elif group in ('name', 'literal'):
+                pos += 1
+                rhs.append(value)
+            else:
+                expect('|', ';')
+
+    if not productions:
+        raise ValueError(f"{name}: 文法中没有产生式")
+    non_terminals = {lhs for lhs, _, _ in productions}
+    for lhs, _, lineno in productions:
+        if lhs in token_patterns:
+            raise ValueError(f"{name} 第 {lineno} 行: {lhs} 已定义为单词，不能作为产生式左部")
+    if start is None:
+        start = productions[0][0]
+    elif start not in non_terminals:
+        raise ValueError(f"{name}: 开始符号 {start} 没有产生式")
+
+    # 名字是单词或非终结符，引号中的是字面量
+    literals = {}
+    resolved = []
+    for lhs, rhs, lineno in productions:
+        symbols = []
+        for symbol in rhs:
+            if symbol[0] in '\'"':
+                symbol = _unescape_literal(symbol)
+                if symbol in token_patterns or symbol in non_terminals:
+                    raise ValueError(f"{name} 第 {lineno} 行: 字面量 {symbol!r} 与单词或非终结符同名")
+                literals.setdefault(symbol, None)
+            elif symbol not in token_patterns and symbol not in non_terminals:
+                raise ValueError(f"{name} 第 {lineno} 行: 未定义的符号 {symbol}")
+            symbols.append(symbol)
+        resolved.append((lhs, symbols))
+    return Grammar(list(token_patterns.items()), list(literals), skip_patterns, resolved, start, name)
+
+
+def load_grammar(path):
+    """读入文法文件，返回 Grammar"""
+    with open(path, encoding='utf-8') as f:
+        return parse_grammar(f.read(), path)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="载入文法文件，显示文法或用它分析表达式")
+    arg_parser.add_argument('grammar', help="文法文件")
+    arg_parser.add_argument('expressions', nargs='*', help="要分析的表达式")
+    arg_parser.add_argument('--parser', choices=GRAMMAR_PARSER_KINDS, default='lr', help="使用的分析器")
+    arg_parser.add_argument('--rd-source', action='store_true', help="输出生成的递归下降分析程序")
+    arg_parser.add_argument('--cache-dir', default=None, help="分析表缓存目录")
+    args = arg_parser.parse_intermixed_args(argv)
+
+    grammar = load_grammar(args.grammar)
+    if args.rd_source:
+        sys.stdout.write(grammar.rd_source())
+        return 0
+    if not args.expressions:
+        print(f"终结符: {' '.join(grammar.terminals)}")
+        print(f"非终结符: {' '.join(grammar.non_terminals)}")
+        for prod_idx in range(len(grammar.rules)):
+            print(f"{prod_idx}. {grammar.format_production(prod_idx)}")
+        return 0
+    parser = grammar.parser(args.parser, args.cache_dir)
+    status = 0
+    for expr in args.expressions:
+        print(f"\n{expr}")
+        if not parser.parse(expr, trace='off'):
+            print(f"{parser.error}（位置 {parser.error_pos}）")
+            status = 1
+        else:
+            print("分析成功!")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
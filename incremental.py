@@ -0,0 +1,278 @@
+"""
+增量LR分析
+
+编辑器中每次只改动长表达式的一小段，从头重新分析太浪费。IncrementalLRParser 在分析时
+每隔 checkpoint_interval 个单词保存一个检查点：读入该单词之前的状态栈和已经使用的产生式个数。
+状态栈用不可变的链表表示，结点为 (状态, 下一结点, 深度)，保存检查点只需记住栈顶结点，
+不复制整个栈，各检查点之间共享公共的栈底部分。
+
+edit(start, end, text) 把源串的 [start, end) 替换为 text 后重新分析：
+  1. 只对改动附近重新做词法分析，直到新单词与旧单词在改动之后重新对齐；
+  2. 从改动之前最近的检查点恢复状态栈继续分析；
+  3. 越过改动部分后，每到一个旧检查点就比较状态栈，相同则说明之后的分析与上次完全一致，
+     直接沿用旧的产生式序列、检查点和分析结果，提前结束。
+分析程序的工作量与改动大小（加上一个检查点间隔）成正比，而不是与整个表达式的长度成正比。
+单词位置数组中改动之后的部分仍需整体平移，但这只是简单的数组运算。
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+
+from dense_table import ACCEPT
+from derivation import REVERSE_RIGHTMOST, Derivation
+from scanner import GROUP_KINDS, scan, token_pattern
+
+DEFAULT_CHECKPOINT_INTERVAL = 32
+
+# _run 的结束方式
+_ACCEPTED = 0
+_FAILED = 1
+_SYNCED = 2
+
+
+def _same_stack(a, b):
+    """比较两个链表状态栈，遇到共享的结点即可停止"""
+    if a[2] != b[2]:
+        return False
+    while a is not b:
+        if a[0] != b[0]:
+            return False
+        a = a[1]
+        b = b[1]
+    return True
+
+
+class IncrementalLRParser:
+    def __init__(self, parser, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+        """parser 为已构造分析表的 LRParser"""
+        if parser.table is None:
+            raise RuntimeError("请先调用 construct_table() 构造LR分析表")
+        if parser.lexer is not None:
+            raise ValueError("增量分析器只支持内置的表达式文法")
+        if checkpoint_interval < 1:
+            raise ValueError("checkpoint_interval 必须为正整数")
+        self.parser = parser
+        self.table = parser.table
+        self.checkpoint_interval = checkpoint_interval
+        self._root = (0, None, 1)
+
+        self.source = None
+        self.tokens = None
+        self.production_ids = array('H')
+        self.accepted = False
+        self.error = None
+        self.error_index = None  # 出错单词的下标
+        # 检查点按单词下标递增排列：单词下标、读入该单词前的栈顶结点、此前使用的产生式个数
+        self.checkpoint_index = []
+        self.checkpoint_stack = []
+        self.checkpoint_productions = []
+        # 最近一次分析的工作量，用于观察增量分析的效果
+        self.last_resumed_at = None
+        self.last_synced_at = None
+        self.last_tokens_parsed = 0
+
+    @property
+    def error_pos(self):
+        """出错单词在源串中的位置"""
+        if self.error_index is None:
+            return None
+        return self.tokens.starts[self.error_index]
+
+    @property
+    def productions_used(self):
+        return [self.parser.format_production(i) for i in self.production_ids]
+
+    def derivation(self):
+        """当前源串的推导，规约序列为最右推导的逆序（见 derivation 模块）"""
+        return Derivation(self.parser.grammar, self.production_ids, REVERSE_RIGHTMOST)
+
+    def parse(self, source):
+        """完整分析 source，并建立检查点，返回是否分析成功"""
+        self.source = source
+        self.tokens = scan(source)
+        self.checkpoint_index = [0]
+        self.checkpoint_stack = [self._root]
+        self.checkpoint_productions = [0]
+        productions = array('H')
+        outcome, index, _ = self._run(self._root, 0, productions, ())
+        self.production_ids = productions
+        self._finish(outcome, index)
+        self.last_resumed_at = 0
+        self.last_synced_at = None
+        self.last_tokens_parsed = index
+        return self.accepted
+
+    def edit(self, start, end, text):
+        """把源串的 [start, end) 替换为 text，增量地重新分析，返回是否分析成功"""
+        if self.tokens is None:
+            raise RuntimeError("请先调用 parse() 完整分析一次")
+        source = self.source
+        if not 0 <= start <= end <= len(source):
+            raise ValueError(f"编辑范围 [{start}, {end}) 超出源串")
+        new_source = source[:start] + text + source[end:]
+        first, last, token_delta = self._relex(new_source, start, end, len(text))
+        self.source = new_source
+
+        # 从改动之前最近的检查点恢复
+        cp = bisect_right(self.checkpoint_index, first) - 1
+        resume_index = self.checkpoint_index[cp]
+        resume_productions = self.checkpoint_productions[cp]
+
+        # 位于改动之后的旧检查点可以用来判断是否重新同步，last 为旧单词中改动之后的第一个
+        old_cp = bisect_left(self.checkpoint_index, last)
+        sync_points = [(self.checkpoint_index[k] + token_delta, k, self.checkpoint_stack[k])
+                       for k in range(old_cp, len(self.checkpoint_index))]
+
+        old_index = self.checkpoint_index
+        old_stack = self.checkpoint_stack
+        old_productions = self.checkpoint_productions
+        self.checkpoint_index = old_index[:cp + 1]
+        self.checkpoint_stack = old_stack[:cp + 1]
+        self.checkpoint_productions = old_productions[:cp + 1]
+
+        new_productions = array('H')
+        outcome, index, synced = self._run(old_stack[cp], resume_index, new_productions, sync_points,
+                                           resume_productions)
+        self.last_resumed_at = resume_index
+        self.last_tokens_parsed = index - resume_index
+
+        if outcome == _SYNCED:
+            # 之后的分析与上次相同：拼接产生式序列，平移旧检查点，沿用旧的分析结果
+            synced_productions = old_productions[synced]
+            production_delta = resume_productions + len(new_productions) - synced_productions
+            self.production_ids[resume_productions:synced_productions] = new_productions
+            self.checkpoint_index.extend(i + token_delta for i in old_index[synced:])
+            self.checkpoint_stack.extend(old_stack[synced:])
+            self.checkpoint_productions.extend(p + production_delta for p in old_productions[synced:])
+            if self.error_index is not None:
+                self.error_index += token_delta
+            self.last_synced_at = index
+        else:
+            del self.production_ids[resume_productions:]
+            self.production_ids.extend(new_productions)
+            self._finish(outcome, index)
+            self.last_synced_at = None
+        return self.accepted
+
+    def _finish(self, outcome, index):
+        self.accepted = outcome == _ACCEPTED
+        if self.accepted:
+            self.error = None
+            self.error_index = None
+        else:
+            self.error_index = index
+
+    def _relex(self, new_source, start, end, inserted):
+        """
+        对改动附近重新做词法分析并更新单词数组
+        返回 (第一个重新分析的单词下标, 旧单词中改动之后重新对齐的第一个单词下标, 单词个数的变化)
+        """
+        tokens = self.tokens
+        kinds, starts, ends = tokens.kinds, tokens.starts, tokens.ends
+        char_delta = inserted - (end - start)
+
+        # 在 start 之前结束的单词不受影响（它们的结束由 start 之前的字符决定）；
+        # 与改动相邻的数字可能与插入的数字连在一起，因此从结束位置不小于 start 的单词开始
+        first = bisect_left(ends, start)
+        new_end = start + inserted
+        mid_kinds, mid_starts, mid_ends = [], [], []
+        last = len(kinds) - 1  # 一直没有对齐时，旧的 END 单词与新的 END 单词对齐
+        for m in token_pattern(new_source).finditer(new_source, min(starts[first], start)):
+            token_start, token_end = m.span()
+            if token_start >= new_end:
+                # 在改动之后从同一位置开始的单词，其后的单词序列必然与旧的相同
+                old_start = token_start - char_delta
+                k = bisect_left(starts, old_start, first)
+                if k < last and starts[k] == old_start:
+                    last = k
+                    break
+            mid_kinds.append(GROUP_KINDS[m.lastindex])
+            mid_starts.append(token_start)
+            mid_ends.append(token_end)
+
+        offset_type = 'I' if len(new_source) < 2 ** 32 else 'Q'
+        if starts.typecode != offset_type:
+            starts = array(offset_type, starts)
+            ends = array(offset_type, ends)
+        kinds[first:last] = array('B', mid_kinds)
+        starts[first:last] = array(starts.typecode, mid_starts)
+        ends[first:last] = array(ends.typecode, mid_ends)
+        tail = first + len(mid_kinds)
+        if char_delta:
+            starts[tail:] = array(starts.typecode, [s + char_delta for s in starts[tail:]])
+            ends[tail:] = array(ends.typecode, [e + char_delta for e in ends[tail:]])
+        tokens.source = new_source
+        tokens.starts = starts
+        tokens.ends = ends
+        return first, last, len(mid_kinds) - (last - first)
+
+    def _run(self, node, token_index, productions, sync_points, base_productions=0):
+        """
+        从单词 token_index、栈顶结点 node 开始分析，规约使用的产生式追加到 productions，
+        每隔 checkpoint_interval 个单词保存检查点。
+        sync_points 为 (新单词下标, 旧检查点序号, 旧状态栈) 列表，到达这些位置时与旧检查点比较状态栈。
+        返回 (结束方式, 结束时的单词下标, 同步的旧检查点序号)
+        """
+        table = self.table
+        action = table.action
+        goto = table.goto
+        prod_lhs = table.prod_lhs
+        prod_len = table.prod_len
+        n_terminals = table.n_terminals
+        n_non_terminals = len(table.non_terminals)
+        kinds = self.tokens.kinds
+        interval = self.checkpoint_interval
+        add_production = productions.append
+        checkpoint_index = self.checkpoint_index
+        checkpoint_stack = self.checkpoint_stack
+        checkpoint_productions = self.checkpoint_productions
+        sync_iter = iter(sync_points)
+        next_sync, sync_cp, sync_stack = next(sync_iter, (None, None, None))
+        next_checkpoint = (token_index // interval + 1) * interval
+        if next_sync == token_index and _same_stack(node, sync_stack):
+            if checkpoint_index and checkpoint_index[-1] == token_index:
+                # 恢复用的检查点本身就是同步点，与循环中相同，由旧检查点提供
+                checkpoint_index.pop()
+                checkpoint_stack.pop()
+                checkpoint_productions.pop()
+            return _SYNCED, token_index, sync_cp
+
+        state = node[0]
+        kind = kinds[token_index]
+        while True:
+            code = action[state * n_terminals + kind]
+            if code > 0:
+                state = code - 1
+                node = (state, node, node[2] + 1)
+                token_index += 1
+                kind = kinds[token_index]
+                # 读入新单词之前的位置：保存检查点、检查是否与旧分析重新同步
+                if token_index == next_checkpoint:
+                    checkpoint_index.append(token_index)
+                    checkpoint_stack.append(node)
+                    checkpoint_productions.append(base_productions + len(productions))
+                    next_checkpoint += interval
+                while next_sync is not None and next_sync < token_index:
+                    next_sync, sync_cp, sync_stack = next(sync_iter, (None, None, None))
+                if next_sync == token_index:
+                    if _same_stack(node, sync_stack):
+                        if checkpoint_index[-1] == token_index:
+                            # 同步点本身由旧检查点提供
+                            checkpoint_index.pop()
+                            checkpoint_stack.pop()
+                            checkpoint_productions.pop()
+                        return _SYNCED, token_index, sync_cp
+            elif code < ACCEPT:
+                prod_idx = ~code
+                for _ in range(prod_len[prod_idx]):
+                    node = node[1]
+                state = goto[node[0] * n_non_terminals + prod_lhs[prod_idx]]
+                if state < 0:
+                    self.error = f"语法错误: GOTO[{node[0]},{self.parser.grammar[prod_idx][0]}]未定义"
+                    return _FAILED, token_index, None
+                node = (state, node, node[2] + 1)
+                add_production(prod_idx)
+            elif code == ACCEPT:
+                return _ACCEPTED, token_index, None
+            else:
+                self.error = f"语法错误: 状态 {state} 没有对 {self.tokens.name(token_index)} 的动作定义"
+                return _FAILED, token_index, None
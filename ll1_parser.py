@@ -1,23 +1,191 @@
+from array import array
+from collections import Counter, namedtuple
+
+from dense_table import DenseLL1Table
+from derivation import LEFTMOST, Derivation
+from first_follow import FirstFollow
+from parse_stats import ParseRecord, clock, max_depth
+from scanner import KIND_NAMES, scan
+from step_trace import TRACE_OFF, TRACE_PRINT, check_trace_mode
+from table_cache import default_cache_dir, grammar_key, load_tables, store_tables
+
+# 步骤日志中匹配终结符记为 -1，展开非终结符记为所用产生式的编号
+MATCH_STEP = -1
+
+
+# 语义动作使用的表（见 LL1Parser.compile_semantic_rhs）
+SemanticTables = namedtuple('SemanticTables', ['reduce_productions', 'rhs_reversed', 'reduce_lengths'])
+
+
+def run_ll1(table, tokens, stack, production_ids, steps=None, actions=None, semantic=None):
+    """
+    LL(1)预测分析主循环，只读取分析表 table（DenseLL1Table），分析状态都在参数中，可以在多个线程中同时调用
+    stack 为符号栈（调用时为 [table.end, table.start]），展开使用的产生式追加到 production_ids，
+    steps 不为 None 时追加每一步的编码；使用语义动作 actions 时 semantic 为 SemanticTables。
+    返回 (结束时的单词下标, 错误信息, 开始符号的语义值, 是否因表项为空而出错)
+    """
+    kinds = tokens.kinds
+    token_index = 0
+    error = None
+    semantic_value = None
+    cells = table.table
+    rhs_reversed = table.rhs_reversed
+    
+    # 使用语义动作时改用带规约标记的产生式右部，标记在栈中为负数
+    values = None
+    if actions is not None:
+        actions.bind(semantic.reduce_productions)
+        values = []
+        starts = tokens.starts
+        ends = tokens.ends
+        rhs_reversed = semantic.rhs_reversed
+        reduce_lengths = semantic.reduce_lengths
+    symbols = table.symbols
+    n_terminals = table.n_terminals
+    end = table.end
+    
+    table_error = False
+    kind = kinds[0]
+    while True:
+        top = stack.pop()
+        
+        # 如果栈顶是终结符
+        if top < n_terminals:
+            if top < 0:
+                # 规约标记
+                reduce_idx = ~top
+                length = reduce_lengths[reduce_idx]
+                rhs_values = values[len(values) - length:]
+                del values[len(values) - length:]
+                values.append(actions.reduce(reduce_idx, rhs_values))
+                continue
+            if top != kind:
+                stack.append(top)
+                if top == end:
+                    error = "语法错误: 输入未完全处理"
+                else:
+                    error = f"语法错误: 期望 {symbols[top]}, 得到 {tokens.name(token_index)}"
+                break
+            if top == end:
+                # 栈和输入同时到达 $，分析结束
+                if values is not None:
+                    semantic_value = values[-1]
+                break
+            if values is not None:
+                values.append(actions.shift(kind, starts[token_index], ends[token_index]))
+            token_index += 1
+            kind = kinds[token_index]
+            if steps is not None:
+                steps.append(MATCH_STEP)
+        
+        # 如果栈顶是非终结符
+        else:
+            prod_id = cells[(top - n_terminals) * n_terminals + kind] - 1
+            if prod_id < 0:
+                stack.append(top)
+                error = f"语法错误: 在 M[{symbols[top]},{tokens.name(token_index)}] 中没有产生式"
+                table_error = True
+                break
+            production_ids.append(prod_id)
+            
+            # 反向压入产生式右部（ε 产生式右部为空）
+            stack.extend(rhs_reversed[prod_id])
+            if steps is not None:
+                steps.append(prod_id)
+    
+    return token_index, error, semantic_value, table_error
+
+
 class LL1Parser:
-    def __init__(self):
-        # 初始化文法
-        self.grammar = {
-            'E': [['E', '+', 'T'], ['E', '-', 'T'], ['T']],
-            'T': [['T', '*', 'F'], ['T', '/', 'F'], ['F']],
-            'F': [['(', 'E', ')'], ['num']]
-        }
+    def __init__(self, verbose=True, cache_dir=None, stats=None, grammar=None):
+        # verbose 控制是否打印文法变换、FIRST/FOLLOW集和预测分析表；
+        # cache_dir 为分析表缓存目录，默认取环境变量 SYNTAX_ANALYZER_CACHE_DIR（见 table_cache 模块）；
+        # stats 为 ParseStats 对象时每次分析结束后记录统计信息（见 parse_stats 模块）；
+        # grammar 为文法文件载入的 grammar_loader.Grammar，默认使用内置的表达式文法
+        self.verbose = verbose
+        self.cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+        self.stats = stats
         
-        # 消除左递归
-        self.eliminate_left_recursion()
+        # 初始化文法
+        if grammar is None:
+            self.grammar = {
+                'E': [['E', '+', 'T'], ['E', '-', 'T'], ['T']],
+                'T': [['T', '*', 'F'], ['T', '/', 'F'], ['F']],
+                'F': [['(', 'E', ')'], ['num']]
+            }
+            self.terminals = set(['+', '-', '*', '/', '(', ')', 'num', '$'])
+            self.lexer = None
+        else:
+            self.grammar = {nt: [list(rhs) for rhs in prods] for nt, prods in grammar.bnf.items()}
+            self.terminals = set(grammar.terminals) | {'$'}
+            self.lexer = grammar.lexer
+        self.kind_names = KIND_NAMES if self.lexer is None else self.lexer.kind_names
+        self.source_grammar = self.grammar  # 消除左递归之前的文法，语义动作按它的产生式规约
+        self.cache_key = grammar_key('ll1', self.grammar, sorted(self.terminals))
         
         # 初始化FIRST集和FOLLOW集
         self.first = {}
         self.follow = {}
-        self.terminals = set(['+', '-', '*', '/', '(', ')', 'num', '$'])
-        self.non_terminals = set(self.grammar.keys())
+        self.sets = None  # FirstFollow 对象，保存位集形式的FIRST/FOLLOW集
         
         # 构造预测分析表
         self.parse_table = {}
+        self.conflicts = []
+        self.table = None
+        self._depth_deltas = None  # 由步骤编码求栈深度变化的表，统计时才构造
+        
+        # 缓存命中时直接得到消除左递归后的文法、FIRST/FOLLOW集和预测分析表
+        self.from_cache = self.load_cached_tables()
+        if not self.from_cache:
+            # 消除左递归
+            self.eliminate_left_recursion()
+        self.non_terminals = set(self.grammar.keys())
+        
+        # 按非终结符顺序展开的产生式列表，产生式编号 = 非终结符的起始偏移 + 序号
+        self.productions = []
+        self.production_offsets = {}
+        for nt, prods in self.grammar.items():
+            self.production_offsets[nt] = len(self.productions)
+            self.productions.extend((nt, prod) for prod in prods)
+        
+        # 最近一次分析的结果
+        self.production_ids = array('H')
+        self.steps = None
+        self.error = None
+        self.error_pos = None  # 出错单词在源串中的位置
+        self.semantic_value = None
+        self._trace_tokens = None
+    
+    def load_cached_tables(self):
+        """从缓存加载分析表，未命中时返回 False"""
+        tables = load_tables(self.cache_dir, 'll1', self.cache_key)
+        if tables is None:
+            return False
+        
+        self.grammar = tables['grammar']
+        self.first = tables['first']
+        self.follow = tables['follow']
+        self.conflicts = tables['conflicts']
+        # 缓存中分析表只存产生式序号，这里还原为 (序号, 产生式) 的形式
+        self.parse_table = {}
+        for nt, row in tables['parse_table'].items():
+            self.parse_table[nt] = {term: None if i is None else (i, self.grammar[nt][i])
+                                    for term, i in row.items()}
+        
+        if self.verbose:
+            print("已从缓存加载预测分析表")
+        return True
+    
+    def store_cached_tables(self):
+        parse_table = {nt: {term: None if entry is None else entry[0] for term, entry in row.items()}
+                       for nt, row in self.parse_table.items()}
+        return store_tables(self.cache_dir, 'll1', self.cache_key, {
+            'grammar': self.grammar,
+            'first': self.first,
+            'follow': self.follow,
+            'conflicts': self.conflicts,
+            'parse_table': parse_table,
+        })
         
     def eliminate_left_recursion(self):
         # 消除直接左递归
@@ -39,10 +207,10 @@ class LL1Parser:
                 # 引入新的非终结符 A'
                 new_nt = nt + "'"
                 
-                # 对于每个β, 添加 A -> βA'
+                # 对于每个β, 添加 A -> βA'（β 为 ε 时即 A -> A'）
                 new_prods = []
                 for beta in beta_prods:
-                    new_prod = beta.copy()
+                    new_prod = [s for s in beta if s != 'ε']
                     new_prod.append(new_nt)
                     new_prods.append(new_prod)
                 
@@ -60,12 +228,34 @@ class LL1Parser:
                 new_grammar[new_nt] = new_prods
         
         self.grammar = new_grammar
-        print("消除左递归后的文法:")
-        for nt, prods in self.grammar.items():
-            for prod in prods:
-                print(f"{nt} -> {' '.join(prod)}")
+        if self.verbose:
+            print("消除左递归后的文法:")
+            for nt, prods in self.grammar.items():
+                for prod in prods:
+                    print(f"{nt} -> {' '.join(prod)}")
     
     def compute_first(self):
+        # 用位集和依赖图计算FIRST集（见 first_follow 模块），同时缓存各产生式右部的FIRST
+        self.sets = FirstFollow(self.grammar, self.terminals)
+        self.first = self.sets.first_sets()
+        
+        if self.verbose:
+            print("\nFIRST集:")
+            for symbol, first_set in self.first.items():
+                if symbol in self.non_terminals:
+                    print(f"FIRST({symbol}) = {first_set}")
+    
+    def compute_follow(self):
+        # 需要先调用 compute_first
+        self.follow = self.sets.follow_sets()
+        
+        if self.verbose:
+            print("\nFOLLOW集:")
+            for nt, follow_set in self.follow.items():
+                print(f"FOLLOW({nt}) = {follow_set}")
+    
+    def compute_first_naive(self):
+        """原来的不动点迭代算法，每轮重新扫描全部产生式，只用于正确性检查和性能对比"""
         # 初始化FIRST集
         for symbol in self.terminals:
             self.first[symbol] = set([symbol])
@@ -124,13 +314,9 @@ class LL1Parser:
             
             if not updated:
                 break
-        
-        print("\nFIRST集:")
-        for symbol, first_set in self.first.items():
-            if symbol in self.non_terminals:
-                print(f"FIRST({symbol}) = {first_set}")
     
-    def compute_follow(self):
+    def compute_follow_naive(self):
+        """原来的不动点迭代算法，只用于正确性检查和性能对比，需要先计算FIRST集"""
         # 初始化FOLLOW集
         for nt in self.non_terminals:
             self.follow[nt] = set()
@@ -195,12 +381,13 @@ class LL1Parser:
             
             if not updated:
                 break
-        
-        print("\nFOLLOW集:")
-        for nt, follow_set in self.follow.items():
-            print(f"FOLLOW({nt}) = {follow_set}")
     
     def construct_table(self):
+        # 缓存命中时分析表已经就绪，只需编译成紧凑分析表
+        if self.from_cache:
+            self.compile_table()
+            return
+        
         # 计算FIRST和FOLLOW集
         self.compute_first()
         self.compute_follow()
@@ -214,139 +401,192 @@ class LL1Parser:
         # 构造预测分析表
         for nt, productions in self.grammar.items():
             for i, prod in enumerate(productions):
-                # 计算FIRST(α)
-                first_of_prod = set()
-                can_derive_epsilon = True
-                
-                for symbol in prod:
-                    if symbol == 'ε':
-                        first_of_prod.add('ε')
-                        break
-                    
-                    if symbol in self.terminals:
-                        first_of_prod.add(symbol)
-                        can_derive_epsilon = False
-                        break
-                    
-                    # 将FIRST(X)中除ε外的所有符号加入FIRST(α)
-                    for term in self.first[symbol] - set(['ε']):
-                        first_of_prod.add(term)
-                    
-                    # 如果X不能推导出ε，则停止
-                    if 'ε' not in self.first[symbol]:
-                        can_derive_epsilon = False
-                        break
+                # FIRST(α) 及 α 是否可空，已在计算FIRST集时缓存
+                first_of_prod, can_derive_epsilon = self.sets.production_first(nt, i)
                 
                 # 对于FIRST(α)中的每个终结符a，将产生式A->α加入M[A,a]
-                for term in first_of_prod - set(['ε']):
+                for term in first_of_prod:
                     if term != '$':  # 排除$
                         if self.parse_table[nt][term] is None:
                             self.parse_table[nt][term] = (i, prod)
                         else:
-                            print(f"文法不是LL(1)文法! 冲突在 M[{nt},{term}]")
+                            self.report_conflict(nt, term)
                 
                 # 如果ε在FIRST(α)中，对于FOLLOW(A)中的每个终结符b，将A->α加入M[A,b]
-                if 'ε' in first_of_prod or can_derive_epsilon:
+                if can_derive_epsilon:
                     for term in self.follow[nt]:
                         actual_term = term if term != '$' else '$'
                         if actual_term in self.terminals and self.parse_table[nt][actual_term] is None:
                             self.parse_table[nt][actual_term] = (i, prod)
                         elif actual_term in self.terminals:
-                            print(f"文法不是LL(1)文法! 冲突在 M[{nt},{actual_term}]")
+                            self.report_conflict(nt, actual_term)
         
-        print("\n预测分析表:")
-        for nt in self.non_terminals:
-            for term in self.terminals:
-                if term != '$' and self.parse_table[nt][term] is not None:
-                    prod_idx, prod = self.parse_table[nt][term]
-                    print(f"M[{nt},{term}] = {nt} -> {' '.join(prod)}")
+        if self.verbose:
+            print("\n预测分析表:")
+            for nt in self.non_terminals:
+                for term in self.terminals:
+                    if term != '$' and self.parse_table[nt][term] is not None:
+                        prod_idx, prod = self.parse_table[nt][term]
+                        print(f"M[{nt},{term}] = {nt} -> {' '.join(prod)}")
+        
+        self.store_cached_tables()
+        self.compile_table()
     
-    def tokenize(self, expr):
-        tokens = []
-        i = 0
-        while i < len(expr):
-            # 跳过空白
-            if expr[i].isspace():
-                i += 1
-                continue
-            
-            # 检查数字
-            if expr[i].isdigit():
-                start = i
-                while i < len(expr) and expr[i].isdigit():
-                    i += 1
-                tokens.append(('num', expr[start:i]))
+    def compile_table(self):
+        """把预测分析表编译为整数编码的紧凑分析表，分析程序直接使用它"""
+        start_symbol = list(self.grammar.keys())[0]
+        self.table = DenseLL1Table(self.productions, self.parse_table, start_symbol, self.kind_names)
+        self.compile_semantic_rhs()
+    
+    def compile_semantic_rhs(self):
+        """
+        为语义动作准备带规约标记的产生式右部：在消除左递归后的产生式中插入
+        "按原文法某产生式规约"的标记（编码为 ~原产生式编号），使语义动作的调用顺序与LR分析相同
+          A  -> β A'   在 β 之后按 A -> β 规约
+          A' -> α A'   在 α 之后按 A -> A α 规约
+          A  -> γ      （没有左递归）在 γ 之后按 A -> γ 规约
+        引入的 A' -> ε 不对应原文法的产生式，不插入标记；原文法中的 ε 产生式规约时右部长度为 0
+        """
+        self.reduce_productions = [(nt, prod) for nt, prods in self.source_grammar.items() for prod in prods]
+        index = {(nt, tuple(prod)): i for i, (nt, prod) in enumerate(self.reduce_productions)}
+        symbol_id = self.table.symbol_id
+        
+        def reduce_index(nt, body):
+            return index[(nt, tuple(body) if body else ('ε',))]
+        
+        semantic_rhs = []
+        for nt, prod in self.productions:
+            if prod[0] == 'ε':
+                semantic_rhs.append(() if nt not in self.source_grammar else (~reduce_index(nt, []),))
                 continue
-            
-            # 检查符号
-            if expr[i] in ['+', '-', '*', '/', '(', ')']:
-                tokens.append((expr[i], expr[i]))
-            
-            i += 1
+            if nt not in self.source_grammar and prod[-1] == nt:
+                body, tail = prod[:-1], prod[-1:]
+                reduce_idx = reduce_index(nt[:-1], [nt[:-1]] + body)
+            elif prod[-1] == nt + "'" and nt + "'" not in self.source_grammar:
+                body, tail = prod[:-1], prod[-1:]
+                reduce_idx = reduce_index(nt, body)
+            else:
+                body, tail = prod, []
+                reduce_idx = reduce_index(nt, prod)
+            symbols = [symbol_id[s] for s in body] + [~reduce_idx] + [symbol_id[s] for s in tail]
+            semantic_rhs.append(tuple(reversed(symbols)))
         
-        tokens.append(('$', '$'))  # 结束符号
-        return tokens
+        self.semantic_rhs_reversed = tuple(semantic_rhs)
+        self.reduce_lengths = tuple(len([s for s in prod if s != 'ε']) for _, prod in self.reduce_productions)
+        self.semantic_tables = SemanticTables(self.reduce_productions, self.semantic_rhs_reversed,
+                                              self.reduce_lengths)
+    
+    def report_conflict(self, nt, term):
+        self.conflicts.append((nt, term))
+        if self.verbose:
+            print(f"文法不是LL(1)文法! 冲突在 M[{nt},{term}]")
     
-    def parse(self, expr):
+    def tokenize(self, expr):
+        """词法分析，返回共用词法分析器（或文法文件定义的词法分析器）产生的单词序列"""
+        return scan(expr) if self.lexer is None else self.lexer.scan(expr)
+    
+    def parse(self, expr, trace=TRACE_PRINT, actions=None):
+        """
+        LL(1)预测分析过程
+        trace 选择分析过程的记录方式（见 step_trace 模块），关闭时不再逐步拼接栈和输入串。
+        分析结束后 productions_used 为使用的产生式序列，error 为错误信息（成功时为 None）。
+        actions 为语义动作（接口见 expr_tree 模块），按消除左递归之前的文法规约，
+        调用顺序与LR分析相同，分析成功后开始符号的语义值保存在 semantic_value 中。
+        """
+        if self.table is None:
+            raise RuntimeError("请先调用 construct_table() 构造预测分析表")
+        trace = check_trace_mode(trace)
+        stats = self.stats
+        if stats is not None:
+            started = clock()
         tokens = self.tokenize(expr)
-        token_index = 0
-        stack = ['$', list(self.grammar.keys())[0]]  # 栈底添加$和起始符号
-        productions_used = []
+        if stats is not None:
+            tokenized = clock()
+        production_ids = array('H')
+        # 统计栈的最大深度时也需要步骤日志
+        record = trace != TRACE_OFF or (stats is not None and stats.track_depth)
+        steps = array('i') if record else None
         
-        print("\n分析过程:")
-        print(f"{'步骤':<5}{'符号栈':<20}{'输入串':<20}{'产生式':<30}")
+        self.error_pos = None
+        self.production_ids = production_ids
+        self.steps = steps if trace != TRACE_OFF else None
+        self._trace_tokens = tokens if trace != TRACE_OFF else None
+        # 栈底添加$和起始符号，符号均为整数编号（见 dense_table 模块）
+        token_index, self.error, self.semantic_value, table_error = run_ll1(
+            self.table, tokens, [self.table.end, self.table.start], production_ids, steps, actions, self.semantic_tables)
         
-        step = 1
-        while stack[-1] != '$':
-            top = stack[-1]
-            token_type, token_value = tokens[token_index]
-            
-            # 打印当前状态
+        if self.error is not None:
+            self.error_pos = tokens.starts[token_index]
+        
+        if stats is not None:
+            self.record_stats(stats, len(tokens) - 1, token_index, steps, table_error,
+                              tokenized - started, clock() - tokenized)
+        
+        if trace == TRACE_PRINT:
+            print("\n分析过程:")
+            print(self.format_trace())
+            if self.error is None:
+                print("\n分析成功!")
+                print("\n使用的产生式序列:")
+                for i, prod in enumerate(self.productions_used):
+                    print(f"{i+1}. {prod}")
+        
+        return self.error is None
+    
+    def record_stats(self, stats, n_tokens, matches, steps, table_error, tokenize_seconds, parse_seconds):
+        """由最近一次分析的结果计算统计信息并记录到 stats，预测分析中规约次数即展开次数"""
+        expansions = len(self.production_ids)
+        # 每次展开查一次预测分析表，因表项为空而出错时也查了一次
+        lookups = expansions + (1 if table_error else 0)
+        depth = None
+        if steps is not None:
+            if self._depth_deltas is None:
+                # 匹配（编码 -1，用负下标）弹出一个终结符；展开产生式 p 弹出左部、压入右部（不计语义动作的规约标记）
+                deltas = [len(rhs) - 1 for rhs in self.table.rhs_reversed] + [-1]
+                self._depth_deltas = deltas
+            depth = max_depth(steps, self._depth_deltas, 2)
+        stats.record(ParseRecord('ll1', self.error is None, n_tokens, matches, expansions,
+                                 Counter(self.production_ids), lookups, depth, tokenize_seconds, parse_seconds))
+    
+    @property
+    def productions_used(self):
+        """按推导顺序给出使用的产生式，用到时才格式化为字符串"""
+        return [self.format_production(i) for i in self.production_ids]
+    
+    def derivation(self):
+        """最近一次分析的推导（消除左递归之后的文法的最左推导，见 derivation 模块）"""
+        return Derivation(self.productions, self.production_ids, LEFTMOST)
+    
+    def format_production(self, prod_id):
+        nt, prod = self.productions[prod_id]
+        return f"{nt} -> {' '.join(prod)}"
+    
+    def format_trace(self):
+        """根据最近一次分析记录的步骤日志重放符号栈，生成分析过程表"""
+        if self.steps is None:
+            raise ValueError("最近一次分析没有记录分析过程，请使用 trace='record' 或 trace='print'")
+        
+        tokens = self._trace_tokens
+        names = tokens.names()
+        token_index = 0
+        stack = ['$', list(self.grammar.keys())[0]]
+        lines = [f"{'步骤':<5}{'符号栈':<20}{'输入串':<20}{'产生式':<30}"]
+        
+        for step, code in enumerate(self.steps, 1):
             stack_str = ' '.join(stack)
-            input_str = ' '.join([t[0] for t in tokens[token_index:]])
+            input_str = ' '.join(names[token_index:])
+            top = stack.pop()
             
-            # 如果栈顶是终结符
-            if top in self.terminals:
-                if top == token_type:
-                    stack.pop()
-                    token_index += 1
-                    print(f"{step:<5}{stack_str:<20}{input_str:<20}匹配终结符: {top}")
-                else:
-                    print(f"语法错误: 期望 {top}, 得到 {token_type}")
-                    return False
-            # 如果栈顶是非终结符
-            elif top in self.non_terminals:
-                entry = self.parse_table[top][token_type]
-                
-                if entry is not None:
-                    prod_idx, production = entry
-                    production_str = f"{top} -> {' '.join(production)}"
-                    productions_used.append(production_str)
-                    
-                    stack.pop()  # 弹出非终结符
-                    
-                    # 反向压入产生式右部（除了ε）
-                    if production[0] != 'ε':
-                        for symbol in reversed(production):
-                            stack.append(symbol)
-                    
-                    print(f"{step:<5}{stack_str:<20}{input_str:<20}{production_str:<30}")
-                else:
-                    print(f"语法错误: 在 M[{top},{token_type}] 中没有产生式")
-                    return False
+            if code == MATCH_STEP:
+                token_index += 1
+                lines.append(f"{step:<5}{stack_str:<20}{input_str:<20}匹配终结符: {top}")
             else:
-                print(f"未知符号: {top}")
-                return False
-            
-            step += 1
-        
-        # 检查输入是否全部处理完
-        if tokens[token_index][0] == '$':
-            print("\n分析成功!")
-            print("\n使用的产生式序列:")
-            for i, prod in enumerate(productions_used):
-                print(f"{i+1}. {prod}")
-            return True
-        else:
-            print("\n语法错误: 输入未完全处理")
-            return False
+                production = self.productions[code][1]
+                if production[0] != 'ε':
+                    stack.extend(reversed(production))
+                production_str = f"{top} -> {' '.join(production)}"
+                lines.append(f"{step:<5}{stack_str:<20}{input_str:<20}{production_str:<30}")
+        
+        if self.error is not None:
+            lines.append(self.error)
+        return '\n'.join(lines)
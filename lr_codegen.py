@@ -0,0 +1,322 @@
+"""
+LR分析程序生成器
+
+LRParser.parse 是表驱动的：每一步都要计算下标查ACTION表、判断编码的种类、规约时再查
+产生式长度、左部和GOTO表。本模块读取构造好的分析表，生成一个专用的 Python 模块：
+
+  - 每个状态一段代码，状态分派用按状态编号二分的 if 语句，每步只做几次整数比较；
+  - 状态内按单词种别分支，动作相同的单词合并为一个条件；
+  - 移进的目标状态写成常数，规约时弹栈个数、产生式编号都是常数，
+    GOTO 目标只有一个时也写成常数，否则按栈顶状态比较或查元组；
+  - 移进或规约后的状态能静态确定时，直接内联该状态的代码（深度由 inline_depth 控制），
+    不必回到循环开头分派。
+
+生成的类继承 LRParser，parse(expr, trace='off') 走生成的代码，产生式序列、错误信息和
+出错位置与表驱动的分析程序完全相同；需要分析过程、语义动作或统计信息时退回 LRParser.parse。
+
+    python lr_codegen.py -o generated_lr_parser.py
+    from generated_lr_parser import GeneratedLRParser
+"""
+import argparse
+import sys
+import types
+
+from dense_table import ACCEPT, ERROR
+from lr_parser import LRParser
+from scanner import KIND_NAMES
+
+DEFAULT_CLASS_NAME = 'GeneratedLRParser'
+DEFAULT_INLINE_DEPTH = 2
+
+# 状态数不超过该值时不再二分，直接顺序比较
+_LINEAR_DISPATCH = 3
+
+# GOTO 目标的例外状态不超过该值时按栈顶状态分支，否则查元组
+_MAX_GOTO_EXCEPTIONS = 2
+
+
+def _kind_condition(kinds):
+    """单词种别集合对应的条件表达式"""
+    kinds = sorted(kinds)
+    if len(kinds) == 1:
+        return f"kind == {kinds[0]}"
+    if kinds[-1] - kinds[0] == len(kinds) - 1:
+        return f"{kinds[0]} <= kind <= {kinds[-1]}"
+    return f"kind in {{{', '.join(map(str, kinds))}}}"
+
+
+class _Generator:
+    def __init__(self, parser, class_name, inline_depth):
+        table = parser.table
+        if table is None:
+            raise RuntimeError("请先调用 construct_table() 构造LR分析表")
+        if parser.lexer is not None:
+            raise ValueError("只能为内置的表达式文法生成分析程序")
+        self.parser = parser
+        self.table = table
+        self.class_name = class_name
+        self.inline_depth = inline_depth
+        self.n_terminals = table.n_terminals
+        self.n_non_terminals = len(table.non_terminals)
+        self.lines = []
+        self.goto_tables = {}  # 非终结符编号 -> 需要查元组时的局部变量名
+
+    def action_groups(self, state):
+        """[(ACTION 编码, 单词种别列表)]，移进在前，出错的单词不列出"""
+        n_t = self.n_terminals
+        groups = {}
+        for kind in range(n_t):
+            code = self.table.action[state * n_t + kind]
+            if code != ERROR:
+                groups.setdefault(code, []).append(kind)
+        return sorted(groups.items(), key=lambda item: (item[0] <= 0, -len(item[1]), item[1]))
+
+    def goto_column(self, nt):
+        """{栈顶状态: 目标状态}，只含有定义的项"""
+        n_nt = self.n_non_terminals
+        goto = self.table.goto
+        return {s: goto[s * n_nt + nt] for s in range(self.table.n_states) if goto[s * n_nt + nt] >= 0}
+
+    def goto_branches(self, nt):
+        """
+        规约到 nt 后按栈顶状态区分的新状态：返回 (默认目标, [(栈顶状态, 目标), ...])，
+        例外过多时返回 None，改为查元组
+        """
+        column = self.goto_column(nt)
+        counts = {}
+        for target in column.values():
+            counts[target] = counts.get(target, 0) + 1
+        default = max(counts, key=lambda t: (counts[t], -t))
+        exceptions = [(s, t) for s, t in sorted(column.items()) if t != default]
+        if len(exceptions) > _MAX_GOTO_EXCEPTIONS:
+            self.goto_tables[nt] = f"goto_{self.table.non_terminals[nt].replace(chr(39), '_')}"
+            return None
+        return default, exceptions
+
+    def emit(self, indent, text):
+        self.lines.append('    ' * indent + text)
+
+    def emit_dispatch(self, states, indent):
+        if len(states) <= _LINEAR_DISPATCH:
+            for i, state in enumerate(states):
+                if i == len(states) - 1:
+                    self.emit(indent, "else:" if i else "if True:")
+                else:
+                    self.emit(indent, f"{'if' if i == 0 else 'elif'} state == {state}:")
+                self.emit_state(state, indent + 1, self.inline_depth)
+            return
+        mid = len(states) // 2
+        self.emit(indent, f"if state < {states[mid]}:")
+        self.emit_dispatch(states[:mid], indent + 1)
+        self.emit(indent, "else:")
+        self.emit_dispatch(states[mid:], indent + 1)
+
+    def emit_state(self, state, indent, depth):
+        """状态 state 的代码，进入时 kind 为当前单词种别，栈顶为 state"""
+        self.emit(indent, f"# 状态 {state}")
+        groups = self.action_groups(state)
+        for i, (code, kinds) in enumerate(groups):
+            self.emit(indent, f"{'if' if i == 0 else 'elif'} {_kind_condition(kinds)}:")
+            if code > 0:
+                self.emit_shift(code - 1, indent + 1, depth)
+            elif code == ACCEPT:
+                self.emit(indent + 1, "accepted = True")
+                self.emit(indent + 1, "break")
+            else:
+                self.emit_reduce(state, ~code, indent + 1, depth)
+        self.emit(indent, "else:" if groups else "if True:")
+        self.emit(indent + 1, f"error_state = {state}")
+        self.emit(indent + 1, "break")
+
+    def emit_shift(self, target, indent, depth):
+        self.emit(indent, f"push({target})")
+        self.emit(indent, "i += 1")
+        self.emit(indent, "kind = kinds[i]")
+        self.emit_goto_state(target, indent, depth)
+
+    def emit_reduce(self, state, prod_idx, indent, depth):
+        table = self.table
+        length = table.prod_len[prod_idx]
+        nt = table.prod_lhs[prod_idx]
+        self.emit(indent, f"# {self.parser.format_production(prod_idx)}")
+        self.emit(indent, f"emit({prod_idx})")
+        if length == 0:
+            # 栈顶就是当前状态，GOTO 目标是常数
+            target = table.goto[state * self.n_non_terminals + nt]
+            self.emit(indent, f"push({target})")
+            self.emit_goto_state(target, indent, depth)
+            return
+        if length > 1:
+            self.emit(indent, f"del stack[{1 - length}:]")
+        branches = self.goto_branches(nt)
+        if branches is None:
+            self.emit(indent, f"stack[-1] = state = {self.goto_tables[nt]}[stack[-2]]")
+            return
+        default, exceptions = branches
+        if not exceptions:
+            self.emit(indent, f"stack[-1] = {default}")
+            self.emit_goto_state(default, indent, depth)
+            return
+        # 按栈顶状态分支，每个分支中新状态都是常数
+        self.emit(indent, "top = stack[-2]")
+        for i, (top, target) in enumerate(exceptions):
+            self.emit(indent, f"{'if' if i == 0 else 'elif'} top == {top}:")
+            self.emit(indent + 1, f"stack[-1] = {target}")
+            self.emit_goto_state(target, indent + 1, depth)
+        self.emit(indent, "else:")
+        self.emit(indent + 1, f"stack[-1] = {default}")
+        self.emit_goto_state(default, indent + 1, depth)
+
+    def emit_goto_state(self, state, indent, depth):
+        """转到静态已知的状态：还能内联时内联其代码，否则设置 state 后回到循环开头"""
+        if depth > 0:
+            self.emit_state(state, indent, depth - 1)
+        else:
+            self.emit(indent, f"state = {state}")
+
+    def generate(self):
+        table = self.table
+        body_start = len(self.lines)
+        self.emit(2, "while True:")
+        self.emit_dispatch(list(range(table.n_states)), 3)
+        body = self.lines[body_start:]
+        del self.lines[body_start:]
+
+        grammar = self.parser.grammar
+        self.lines.extend([
+            '"""',
+            f"由 lr_codegen 根据LR分析表生成的专用分析程序（{table.n_states} 个状态），请勿手工修改",
+            '"""',
+            "from array import array",
+            "",
+            "from lr_parser import LRParser",
+            "from scanner import scan",
+            "from step_trace import TRACE_OFF",
+            "",
+            f"GRAMMAR = {grammar!r}",
+            f"NON_TERMINALS = {sorted(self.parser.non_terminals)!r}",
+            f"TERMINALS = {sorted(self.parser.terminals)!r}",
+            f"KIND_NAMES = {KIND_NAMES!r}",
+        ])
+        for nt, name in sorted(self.goto_tables.items()):
+            column = self.goto_column(nt)
+            values = tuple(column.get(s, -1) for s in range(table.n_states))
+            self.lines.append(f"{name.upper()} = {values!r}")
+        self.lines.extend([
+            "",
+            "",
+            f"class {self.class_name}(LRParser):",
+            "    def __init__(self, verbose=False, cache_dir=None, stats=None):",
+            "        super().__init__(verbose, cache_dir, stats)",
+            "        self.grammar = list(GRAMMAR)",
+            "        self.non_terminals = set(NON_TERMINALS)",
+            "        self.terminals = set(TERMINALS)",
+            "",
+            "    def parse(self, expr, trace=TRACE_OFF, actions=None):",
+            "        if trace != TRACE_OFF or actions is not None or self.stats is not None:",
+            "            # 分析过程、语义动作和统计信息由表驱动的分析程序提供",
+            "            if self.table is None:",
+            "                self.construct_table()",
+            "            return super().parse(expr, trace, actions)",
+            "        tokens = scan(expr)",
+            "        kinds = tokens.kinds",
+            "        stack = [0]",
+            "        push = stack.append",
+            "        production_ids = array('H')",
+            "        emit = production_ids.append",
+        ])
+        for nt, name in sorted(self.goto_tables.items()):
+            self.lines.append(f"        {name} = {name.upper()}")
+        self.lines.extend([
+            "        i = 0",
+            "        kind = kinds[0]",
+            "        state = 0",
+            "        accepted = False",
+            "        error_state = None",
+        ])
+        self.lines.extend(body)
+        self.lines.extend([
+            "        self.production_ids = production_ids",
+            "        self.steps = None",
+            "        self._trace_tokens = None",
+            "        self.semantic_value = None",
+            "        if accepted:",
+            "            self.error = None",
+            "            self.error_pos = None",
+            "        else:",
+            "            self.error = f\"语法错误: 状态 {error_state} 没有对 {tokens.name(i)} 的动作定义\"",
+            "            self.error_pos = tokens.starts[i]",
+            "        return accepted",
+            "",
+        ])
+        return '\n'.join(self.lines)
+
+
+def generate_source(parser, class_name=DEFAULT_CLASS_NAME, inline_depth=DEFAULT_INLINE_DEPTH):
+    """由已构造分析表的 LRParser 生成分析程序模块的源代码"""
+    return _Generator(parser, class_name, inline_depth).generate()
+
+
+# 生成的源代码 -> 在内存中加载的类，同一进程中反序列化多个实例时只编译一次
+_loaded_classes = {}
+
+
+def _load_class(source, class_name):
+    cls = _loaded_classes.get((source, class_name))
+    if cls is None:
+        module = types.ModuleType(f"generated_{class_name.lower()}")
+        exec(compile(source, f"<{module.__name__}>", 'exec'), module.__dict__)
+        cls = getattr(module, class_name)
+        # 内存中的模块不能 import，序列化时带上源代码，反序列化时重新加载
+        cls._generated_source = source
+        cls.__reduce__ = _reduce_generated
+        _loaded_classes[(source, class_name)] = cls
+    return cls
+
+
+def _reduce_generated(self):
+    return _restore_generated, (type(self)._generated_source, type(self).__name__, self.__dict__)
+
+
+def _restore_generated(source, class_name, state):
+    cls = _load_class(source, class_name)
+    parser = cls.__new__(cls)
+    parser.__dict__.update(state)
+    return parser
+
+
+def build_class(parser, class_name=DEFAULT_CLASS_NAME, inline_depth=DEFAULT_INLINE_DEPTH):
+    """
+    生成分析程序并在内存中加载，返回生成的分析器类
+    类的实例可以序列化（如在 spawn 方式启动的工作进程中使用），反序列化时由源代码重新加载类
+    """
+    return _load_class(generate_source(parser, class_name, inline_depth), class_name)
+
+
+def write_module(parser, path, class_name=DEFAULT_CLASS_NAME, inline_depth=DEFAULT_INLINE_DEPTH):
+    """把生成的分析程序写入 path，之后可以直接 import"""
+    source = generate_source(parser, class_name, inline_depth)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(source)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="由LR分析表生成专用的分析程序模块")
+    arg_parser.add_argument('-o', '--output', default='-', help="输出文件，默认为标准输出")
+    arg_parser.add_argument('--method', choices=('lalr', 'slr'), default='lalr', help="分析表构造方法")
+    arg_parser.add_argument('--class-name', default=DEFAULT_CLASS_NAME, help="生成的类名")
+    arg_parser.add_argument('--inline-depth', type=int, default=DEFAULT_INLINE_DEPTH,
+                            help="静态可知的后继状态内联的层数")
+    args = arg_parser.parse_args(argv)
+
+    parser = LRParser(verbose=False)
+    parser.construct_table(args.method)
+    if args.output == '-':
+        sys.stdout.write(generate_source(parser, args.class_name, args.inline_depth))
+    else:
+        write_module(parser, args.output, args.class_name, args.inline_depth)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,188 +1,309 @@
+from array import array
+from collections import Counter
+
+from dense_table import ACCEPT, DenseLRTable
+from derivation import REVERSE_RIGHTMOST, Derivation
+from incremental import DEFAULT_CHECKPOINT_INTERVAL, IncrementalLRParser
+from lr_table import Conflict, LRTableBuilder, format_conflict
+from parse_stats import ParseRecord, clock, max_depth
+from push_parser import LRPushParser
+from scanner import KIND_NAMES, scan
+from step_trace import TRACE_OFF, TRACE_PRINT, check_trace_mode
+from table_cache import default_cache_dir, grammar_key, load_tables, store_tables
+
+# 步骤日志直接记录每一步的 ACTION 编码（见 dense_table 模块）
+
+
+def run_lr(table, grammar, tokens, stack, production_ids, steps=None, actions=None):
+    """
+    LR分析主循环，只读取分析表 table（DenseLRTable），分析状态都在参数中，可以在多个线程中同时调用
+    stack 为状态栈（调用时只含状态 0），使用的产生式追加到 production_ids，
+    steps 不为 None 时追加每一步的 ACTION 编码；actions 为语义动作（接口见 expr_tree 模块）。
+    返回 (结束时的单词下标, 错误信息, 开始符号的语义值)，分析成功时错误信息为 None
+    """
+    kinds = tokens.kinds
+    token_index = 0
+    error = None
+    semantic_value = None
+    
+    # 语义值栈与状态栈同步（不含栈底状态 0）
+    values = None
+    if actions is not None:
+        actions.bind(grammar)
+        values = []
+        starts = tokens.starts
+        ends = tokens.ends
+    
+    action = table.action
+    goto = table.goto
+    prod_lhs = table.prod_lhs
+    prod_len = table.prod_len
+    n_terminals = table.n_terminals
+    n_non_terminals = len(table.non_terminals)
+    
+    state = 0
+    kind = kinds[0]
+    while True:
+        # 查询动作表，编码见 dense_table 模块
+        code = action[state * n_terminals + kind]
+        
+        if code > 0:
+            # 移进
+            state = code - 1
+            stack.append(state)
+            if values is not None:
+                values.append(actions.shift(kind, starts[token_index], ends[token_index]))
+            token_index += 1
+            kind = kinds[token_index]
+        
+        elif code < ACCEPT:
+            # 用产生式 prod_idx 规约，弹出|β|个状态
+            prod_idx = ~code
+            length = prod_len[prod_idx]
+            if length:
+                del stack[-length:]
+            
+            # 查找GOTO表，将GOTO[top_state, A]入栈
+            top_state = stack[-1]
+            state = goto[top_state * n_non_terminals + prod_lhs[prod_idx]]
+            if state < 0:
+                error = f"语法错误: GOTO[{top_state},{grammar[prod_idx][0]}]未定义"
+                break
+            stack.append(state)
+            
+            if values is not None:
+                rhs_values = values[len(values) - length:]
+                del values[len(values) - length:]
+                values.append(actions.reduce(prod_idx, rhs_values))
+            
+            # 记录使用的产生式
+            production_ids.append(prod_idx)
+        
+        elif code == ACCEPT:
+            if steps is not None:
+                steps.append(code)
+            if values is not None:
+                semantic_value = values[-1]
+            break
+        
+        else:
+            error = f"语法错误: 状态 {state} 没有对 {tokens.name(token_index)} 的动作定义"
+            break
+        
+        if steps is not None:
+            steps.append(code)
+    
+    return token_index, error, semantic_value
+
+
 class LRParser:
-    def __init__(self):
+    def __init__(self, verbose=True, cache_dir=None, stats=None, grammar=None):
+        # verbose 控制构造分析表时是否打印信息；
+        # cache_dir 为分析表缓存目录，默认取环境变量 SYNTAX_ANALYZER_CACHE_DIR（见 table_cache 模块）；
+        # stats 为 ParseStats 对象时每次分析结束后记录统计信息（见 parse_stats 模块）；
+        # grammar 为文法文件载入的 grammar_loader.Grammar，默认使用内置的表达式文法
+        self.verbose = verbose
+        self.cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+        self.stats = stats
+        
         # 初始化文法
-        self.grammar = [
-            ("S'", ["E"]),             # 扩展的起始产生式
-            ("E", ["E", "+", "T"]),    # E -> E+T
-            ("E", ["E", "-", "T"]),    # E -> E-T
-            ("E", ["T"]),              # E -> T
-            ("T", ["T", "*", "F"]),    # T -> T*F
-            ("T", ["T", "/", "F"]),    # T -> T/F
-            ("T", ["F"]),              # T -> F
-            ("F", ["(", "E", ")"]),    # F -> (E)
-            ("F", ["num"])             # F -> num
-        ]
-        
-        self.non_terminals = {"S'", "E", "T", "F"}
-        self.terminals = {"+", "-", "*", "/", "(", ")", "num", "$"}
+        if grammar is None:
+            self.grammar = [
+                ("S'", ["E"]),             # 扩展的起始产生式
+                ("E", ["E", "+", "T"]),    # E -> E+T
+                ("E", ["E", "-", "T"]),    # E -> E-T
+                ("E", ["T"]),              # E -> T
+                ("T", ["T", "*", "F"]),    # T -> T*F
+                ("T", ["T", "/", "F"]),    # T -> T/F
+                ("T", ["F"]),              # T -> F
+                ("F", ["(", "E", ")"]),    # F -> (E)
+                ("F", ["num"])             # F -> num
+            ]
+            
+            self.non_terminals = {"S'", "E", "T", "F"}
+            self.terminals = {"+", "-", "*", "/", "(", ")", "num", "$"}
+            self.lexer = None
+        else:
+            # 文法文件载入的产生式同样以扩展产生式为第 0 个
+            self.grammar = [(lhs, list(rhs)) for lhs, rhs in grammar.rules]
+            self.non_terminals = {lhs for lhs, _ in grammar.rules}
+            self.terminals = set(grammar.terminals) | {"$"}
+            self.lexer = grammar.lexer
+        self.kind_names = KIND_NAMES if self.lexer is None else self.lexer.kind_names
         
         # LR分析表
         self.action = {}
         self.goto = {}
+        self.states = []
+        self.conflicts = []
+        self.table = None  # 由 action/goto 编译得到的紧凑分析表，分析程序直接使用它
+        self._depth_deltas = None  # 由步骤编码求栈深度变化的表，统计时才构造
+        
+        # 最近一次分析的结果
+        self.production_ids = array('H')
+        self.steps = None
+        self.error = None
+        self.error_pos = None  # 出错单词在源串中的位置
+        self.semantic_value = None
+        self._trace_tokens = None
         
-    def construct_table(self):
+    def construct_table(self, method='lalr'):
         """
-        构造LR分析表（简化版）
-        直接硬编码表，而非动态构建
+        构造LR分析表
+        由 self.grammar 构造识别活前缀的DFA，再用LALR(1)（或 SLR(1)）方法求出ACTION和GOTO表，
+        文法存在冲突时记录冲突并按"优先移进、优先编号小的产生式"解决。
+        同一文法构造过的分析表会从缓存加载。
         """
-        # 初始化ACTION和GOTO表
-        self.action = {
-            0: {'(': ('shift', 4), 'num': ('shift', 5)},
-            1: {'+': ('shift', 6), '-': ('shift', 7), '$': ('accept', None)},
-            2: {'+': ('reduce', 3), '-': ('reduce', 3), '*': ('shift', 8), '/': ('shift', 9), 
-                ')': ('reduce', 3), '$': ('reduce', 3)},
-            3: {'+': ('reduce', 6), '-': ('reduce', 6), '*': ('reduce', 6), '/': ('reduce', 6), 
-                ')': ('reduce', 6), '$': ('reduce', 6)},
-            4: {'(': ('shift', 4), 'num': ('shift', 5)},
-            5: {'+': ('reduce', 8), '-': ('reduce', 8), '*': ('reduce', 8), '/': ('reduce', 8), 
-                ')': ('reduce', 8), '$': ('reduce', 8)},
-            6: {'(': ('shift', 4), 'num': ('shift', 5)},
-            7: {'(': ('shift', 4), 'num': ('shift', 5)},
-            8: {'(': ('shift', 4), 'num': ('shift', 5)},
-            9: {'(': ('shift', 4), 'num': ('shift', 5)},
-            10: {'+': ('reduce', 3), '-': ('reduce', 3), ')': ('shift', 15), '$': ('reduce', 3)},
-            11: {'+': ('shift', 6), '-': ('shift', 7), ')': ('shift', 13)},
-            12: {'+': ('reduce', 1), '-': ('reduce', 1), '*': ('shift', 8), '/': ('shift', 9), 
-                 ')': ('reduce', 1), '$': ('reduce', 1)},
-            13: {'+': ('reduce', 7), '-': ('reduce', 7), '*': ('reduce', 7), '/': ('reduce', 7), 
-                 ')': ('reduce', 7), '$': ('reduce', 7)},
-            14: {'+': ('reduce', 4), '-': ('reduce', 4), '*': ('reduce', 4), '/': ('reduce', 4), 
-                 ')': ('reduce', 4), '$': ('reduce', 4)},
-            15: {'+': ('reduce', 7), '-': ('reduce', 7), '*': ('reduce', 7), '/': ('reduce', 7), 
-                 ')': ('reduce', 7), '$': ('reduce', 7)},
-            16: {'+': ('reduce', 5), '-': ('reduce', 5), '*': ('reduce', 5), '/': ('reduce', 5), 
-                 ')': ('reduce', 5), '$': ('reduce', 5)},
-        }
-        
-        self.goto = {
-            0: {'E': 1, 'T': 2, 'F': 3},
-            4: {'E': 11, 'T': 2, 'F': 3},
-            6: {'T': 12, 'F': 3},
-            7: {'T': 13, 'F': 3},
-            8: {'F': 14},
-            9: {'F': 16},
-            10: {'E': 11, 'T': 2, 'F': 3},
-            11: {},
-            12: {},
-        }
-        
-        # 补充缺失的状态转换
-        # 状态6和状态7需要添加对非终结符T的处理
-        self.goto[6] = {'T': 12, 'F': 3}
-        self.goto[7] = {'T': 13, 'F': 3}
-        
-        # 补充E->E+T产生式对应的状态
-        # 当识别E+T后，需要规约为E
-        self.action[12] = {'+': ('reduce', 1), '-': ('reduce', 1), '*': ('shift', 8), '/': ('shift', 9), 
-                           ')': ('reduce', 1), '$': ('reduce', 1)}
-        
-        # 补充E->E-T产生式对应的状态
-        # 当识别E-T后，需要规约为E
-        self.action[13] = {'+': ('reduce', 2), '-': ('reduce', 2), '*': ('reduce', 2), '/': ('reduce', 2), 
-                           ')': ('reduce', 2), '$': ('reduce', 2)}
-        
-        print("LR分析表构造完成")
+        cache_key = grammar_key('lr', self.grammar, sorted(self.terminals), sorted(self.non_terminals), method)
+        tables = load_tables(self.cache_dir, 'lr', cache_key)
+        
+        if tables is not None:
+            self.action = tables['action']
+            self.goto = tables['goto']
+            self.states = tables['states']
+            self.conflicts = [Conflict(*c) for c in tables['conflicts']]
+        else:
+            builder = LRTableBuilder(self.grammar, self.terminals, self.non_terminals)
+            self.action, self.goto = builder.build(method)
+            self.states = builder.kernels
+            self.conflicts = builder.conflicts
+            store_tables(self.cache_dir, 'lr', cache_key, {
+                'action': self.action,
+                'goto': self.goto,
+                'states': self.states,
+                'conflicts': [tuple(c) for c in self.conflicts],
+            })
+        
+        self.table = DenseLRTable(self.grammar, self.action, self.goto, self.non_terminals, self.kind_names)
+        self._depth_deltas = None
+        
+        if self.verbose:
+            for conflict in self.conflicts:
+                print(f"文法不是{method.upper()}(1)文法! {format_conflict(conflict)}")
+            print("已从缓存加载LR分析表" if tables is not None else "LR分析表构造完成")
+    
+    def push_parser(self, record=False, on_reduce=None):
+        """返回使用本分析表的推式分析器，输入可以分块送入（见 push_parser 模块）"""
+        return LRPushParser(self, record, on_reduce)
+    
+    def incremental_parser(self, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+        """返回使用本分析表的增量分析器，源串改动后只重新分析改动附近（见 incremental 模块）"""
+        return IncrementalLRParser(self, checkpoint_interval)
     
     def tokenize(self, expr):
-        """词法分析，将表达式转换为token序列"""
-        tokens = []
-        i = 0
-        while i < len(expr):
-            # 跳过空白
-            if expr[i].isspace():
-                i += 1
-                continue
-            
-            # 检查数字
-            if expr[i].isdigit():
-                start = i
-                while i < len(expr) and expr[i].isdigit():
-                    i += 1
-                tokens.append(('num', expr[start:i]))
-                continue
-            
-            # 检查符号
-            if expr[i] in ['+', '-', '*', '/', '(', ')']:
-                tokens.append((expr[i], expr[i]))
-            
-            i += 1
-        
-        tokens.append(('$', '$'))  # 结束符号
-        return tokens
+        """词法分析，返回共用词法分析器（或文法文件定义的词法分析器）产生的单词序列"""
+        return scan(expr) if self.lexer is None else self.lexer.scan(expr)
     
-    def parse(self, expr):
-        """LR语法分析过程"""
+    def parse(self, expr, trace=TRACE_PRINT, actions=None):
+        """
+        LR语法分析过程
+        trace 选择分析过程的记录方式（见 step_trace 模块），关闭时每步只做一次查表，
+        分析时间与输入长度成线性关系。分析结束后 productions_used 为使用的产生式序列，
+        error 为错误信息（分析成功时为 None）。
+        actions 为语义动作（接口见 expr_tree 模块），移进和规约时调用，
+        分析成功后开始符号的语义值保存在 semantic_value 中。
+        """
+        if self.table is None:
+            raise RuntimeError("请先调用 construct_table() 构造LR分析表")
+        trace = check_trace_mode(trace)
+        stats = self.stats
+        if stats is not None:
+            started = clock()
         tokens = self.tokenize(expr)
-        token_index = 0
-        stack = [(0, '$')]  # 状态栈初始化为状态0和栈底标记
-        productions_used = []
+        if stats is not None:
+            tokenized = clock()
+        production_ids = array('H')
+        # 统计栈的最大深度时也需要步骤日志
+        record = trace != TRACE_OFF or (stats is not None and stats.track_depth)
+        steps = array('i') if record else None
         
-        print("\n分析过程:")
-        print(f"{'步骤':<5}{'状态栈':<20}{'符号栈':<20}{'输入串':<20}{'动作':<30}")
+        self.error_pos = None
+        self.production_ids = production_ids
+        self.steps = steps if trace != TRACE_OFF else None
+        self._trace_tokens = tokens if trace != TRACE_OFF else None
+        # 状态栈，符号栈只在格式化分析过程时由步骤日志重建
+        token_index, self.error, self.semantic_value = run_lr(
+            self.table, self.grammar, tokens, [0], production_ids, steps, actions)
         
-        step = 1
-        while True:
-            state = stack[-1][0]
-            token_type, token_value = tokens[token_index]
-            
-            # 打印当前状态
+        if self.error is not None:
+            self.error_pos = tokens.starts[token_index]
+        
+        if stats is not None:
+            self.record_stats(stats, len(tokens) - 1, token_index, steps, tokenized - started, clock() - tokenized)
+        
+        if trace == TRACE_PRINT:
+            print("\n分析过程:")
+            print(self.format_trace())
+            if self.error is None:
+                print("\n分析成功!")
+                print("\n使用的产生式序列:")
+                for i, prod in enumerate(self.productions_used):
+                    print(f"{i+1}. {prod}")
+        
+        return self.error is None
+    
+    def record_stats(self, stats, n_tokens, shifts, steps, tokenize_seconds, parse_seconds):
+        """由最近一次分析的结果计算统计信息并记录到 stats"""
+        reductions = len(self.production_ids)
+        # 每次移进、规约都查一次ACTION表，规约还要查一次GOTO表，最后接受或出错时再查一次ACTION表
+        lookups = shifts + 2 * reductions + 1
+        depth = None
+        if steps is not None:
+            if self._depth_deltas is None:
+                # 移进编码为正数，栈深度加 1；规约编码 ~p 用负下标，栈深度变化 1 - |β|；接受编码 -1 不变
+                table = self.table
+                deltas = [1] * (table.n_states + 1 + len(table.prod_len))
+                for p in range(1, len(table.prod_len)):
+                    deltas[~p] = 1 - table.prod_len[p]
+                deltas[ACCEPT] = 0
+                self._depth_deltas = deltas
+            depth = max_depth(steps, self._depth_deltas, 1)
+        stats.record(ParseRecord('lr', self.error is None, n_tokens, shifts, reductions,
+                                 Counter(self.production_ids), lookups, depth, tokenize_seconds, parse_seconds))
+    
+    @property
+    def productions_used(self):
+        """按规约顺序给出使用的产生式，用到时才格式化为字符串"""
+        return [self.format_production(i) for i in self.production_ids]
+    
+    def derivation(self):
+        """最近一次分析的推导，规约序列为最右推导的逆序（见 derivation 模块）"""
+        return Derivation(self.grammar, self.production_ids, REVERSE_RIGHTMOST)
+    
+    def format_production(self, prod_idx):
+        lhs, rhs = self.grammar[prod_idx]
+        return f"{lhs} -> {' '.join(rhs)}"
+    
+    def format_trace(self):
+        """根据最近一次分析记录的步骤日志重放栈变化，生成分析过程表"""
+        if self.steps is None:
+            raise ValueError("最近一次分析没有记录分析过程，请使用 trace='record' 或 trace='print'")
+        
+        tokens = self._trace_tokens
+        names = tokens.names()
+        token_index = 0
+        stack = [(0, '$')]
+        lines = [f"{'步骤':<5}{'状态栈':<20}{'符号栈':<20}{'输入串':<20}{'动作':<30}"]
+        
+        for step, code in enumerate(self.steps, 1):
             state_stack = ' '.join([str(s[0]) for s in stack])
             symbol_stack = ' '.join([str(s[1]) for s in stack])
-            input_str = ' '.join([t[0] for t in tokens[token_index:]])
+            input_str = ' '.join(names[token_index:])
+            prefix = f"{step:<5}{state_stack:<20}{symbol_stack:<20}{input_str:<20}"
             
-            # 查询动作表
-            if token_type not in self.action.get(state, {}):
-                print(f"语法错误: 状态 {state} 没有对 {token_type} 的动作定义")
-                return False
-                
-            action_entry = self.action[state][token_type]
-            action_type, action_value = action_entry
-            
-            if action_type == 'shift':
-                print(f"{step:<5}{state_stack:<20}{symbol_stack:<20}{input_str:<20}移进，转到状态 {action_value}")
-                stack.append((action_value, token_type))
+            if code == ACCEPT:
+                lines.append(f"{prefix}接受!")
+            elif code > 0:
+                lines.append(f"{prefix}移进，转到状态 {code - 1}")
+                stack.append((code - 1, names[token_index]))
                 token_index += 1
-            
-            elif action_type == 'reduce':
-                # 获取要规约的产生式
-                prod_idx = action_value
-                lhs, rhs = self.grammar[prod_idx]
-                
-                # 弹出|β|个符号
-                for _ in range(len(rhs)):
-                    stack.pop()
-                
-                # 查看栈顶状态
-                top_state = stack[-1][0]
-                
-                # 查找GOTO表
-                if lhs not in self.goto.get(top_state, {}):
-                    print(f"语法错误: GOTO[{top_state},{lhs}]未定义")
-                    return False
-                
-                # 将[A, GOTO[top_state, A]]入栈
-                goto_state = self.goto[top_state][lhs]
-                stack.append((goto_state, lhs))
-                
-                # 记录使用的产生式
-                prod_str = f"{lhs} -> {' '.join(rhs)}"
-                productions_used.append(prod_str)
-                
-                print(f"{step:<5}{state_stack:<20}{symbol_stack:<20}{input_str:<20}规约: {prod_str}")
-            
-            elif action_type == 'accept':
-                print(f"{step:<5}{state_stack:<20}{symbol_stack:<20}{input_str:<20}接受!")
-                break
-            
             else:
-                print(f"未知动作: {action_type}")
-                return False
-            
-            step += 1
-        
-        print("\n分析成功!")
-        print("\n使用的产生式序列:")
-        for i, prod in enumerate(productions_used):
-            print(f"{i+1}. {prod}")
+                prod_idx = ~code
+                lhs, rhs = self.grammar[prod_idx]
+                del stack[len(stack) - len(rhs):]
+                stack.append((self.goto[stack[-1][0]][lhs], lhs))
+                lines.append(f"{prefix}规约: {self.format_production(prod_idx)}")
         
-        return True
+        if self.error is not None:
+            lines.append(self.error)
+        return '\n'.join(lines)
@@ -0,0 +1,324 @@
+"""
+由文法自动构造LR分析表
+
+先构造识别活前缀的LR(0)项目集规范族（DFA），项目用整数编号、核心项目集用有序元组
+去重；再用 DeRemer-Pennello 方法在非终结符转移上传播LALR(1)向前看符号，
+终结符集合用整数位集表示。也可以选择 SLR(1)，此时规约的向前看符号直接取 FOLLOW 集。
+"""
+from collections import namedtuple
+
+from first_follow import compute_first, compute_follow, compute_nullable, compute_suffix_first, digraph
+
+# 冲突记录：state 状态，terminal 终结符，kind 为 'shift/reduce' 或 'reduce/reduce'，
+# chosen 为保留的动作，discarded 为舍弃的动作
+Conflict = namedtuple('Conflict', ['state', 'terminal', 'kind', 'chosen', 'discarded'])
+
+
+def format_conflict(conflict):
+    return (f"{conflict.kind} 冲突: 状态 {conflict.state} 遇到 {conflict.terminal}，"
+            f"保留 {conflict.chosen}，舍弃 {conflict.discarded}")
+
+
+def _ordered_symbols(grammar, symbols):
+    """按在文法中首次出现的顺序排列符号，保证每次构造出的状态编号相同"""
+    order = []
+    seen = set()
+    for lhs, rhs in grammar:
+        for symbol in [lhs] + list(rhs):
+            if symbol in symbols and symbol not in seen:
+                seen.add(symbol)
+                order.append(symbol)
+    order.extend(sorted(symbols - seen))
+    return order
+
+
+class LRTableBuilder:
+    """
+    grammar 为 (左部, 右部列表) 的产生式列表，第 0 个产生式必须是扩展的起始产生式 S' -> S。
+    构造完成后 action/goto 的格式与 LRParser 使用的分析表相同。
+    """
+
+    def __init__(self, grammar, terminals, non_terminals):
+        self.grammar = grammar
+        self.terminal_list = _ordered_symbols(grammar, set(terminals) | {'$'})
+        self.non_terminal_list = _ordered_symbols(grammar, set(non_terminals))
+        self.symbols = self.terminal_list + self.non_terminal_list
+        self.symbol_id = {s: i for i, s in enumerate(self.symbols)}
+        self.n_terminals = len(self.terminal_list)
+
+        self.action = {}
+        self.goto = {}
+        self.conflicts = []
+        self.kernels = []      # 每个状态的核心项目（项目编号的有序元组）
+        self.transitions = []  # 每个状态的转移 {符号编号: 目标状态}
+
+        self._prepare_items()
+        self._compute_first()
+
+    # ---------- 预处理 ----------
+
+    def _prepare_items(self):
+        """给每个产生式的每个点位置分配一个项目编号，项目 + 1 即为点右移后的项目"""
+        sid = self.symbol_id
+        n_t = self.n_terminals
+        self.prod_lhs = []
+        self.prod_rhs = []
+        self.prods_of = [[] for _ in self.symbols]
+        self.item_base = []
+        self.item_prod = []
+        self.item_next = []  # 点后面的符号编号，归约项目为 -1
+
+        for p, (lhs, rhs) in enumerate(self.grammar):
+            rhs = [s for s in rhs if s != 'ε']
+            ids = tuple(sid[s] for s in rhs)
+            self.prod_lhs.append(sid[lhs])
+            self.prod_rhs.append(ids)
+            self.prods_of[sid[lhs]].append(p)
+            self.item_base.append(len(self.item_prod))
+            for dot in range(len(ids) + 1):
+                self.item_prod.append(p)
+                self.item_next.append(ids[dot] if dot < len(ids) else -1)
+
+        # closure_items[A]: 从 A 出发沿产生式最左符号可以到达的所有非终结符（含 A 本身）
+        # 的全部初始项目，求闭包时直接整体加入
+        self.initial_items = [[self.item_base[p] for p in self.prods_of[a]] for a in range(len(self.symbols))]
+        self.closure_items = {}
+        for a in range(n_t, len(self.symbols)):
+            reached = {a}
+            work = [a]
+            while work:
+                b = work.pop()
+                for p in self.prods_of[b]:
+                    rhs = self.prod_rhs[p]
+                    if rhs and rhs[0] >= n_t and rhs[0] not in reached:
+                        reached.add(rhs[0])
+                        work.append(rhs[0])
+            items = []
+            for b in sorted(reached):
+                items.extend(self.initial_items[b])
+            self.closure_items[a] = items
+
+    def _compute_first(self):
+        """用位集计算各非终结符的 FIRST 集和可空性，以及每个项目点后第二个符号起的串的 FIRST"""
+        n = len(self.symbols)
+        nullable = compute_nullable(n, self.n_terminals, self.prod_lhs, self.prod_rhs)
+        first = compute_first(n, self.n_terminals, self.prod_lhs, self.prod_rhs, nullable)
+
+        self.first = first
+        self.nullable = nullable
+
+        # beta_first[item]: 对项目 A -> α . B β 求 FIRST(β)，beta_nullable[item] 表示 β 可空
+        self.beta_first = [0] * len(self.item_prod)
+        self.beta_nullable = [True] * len(self.item_prod)
+        for p, rhs in enumerate(self.prod_rhs):
+            base = self.item_base[p]
+            acc = 0
+            acc_nullable = True
+            for dot in range(len(rhs) - 1, -1, -1):
+                self.beta_first[base + dot] = acc
+                self.beta_nullable[base + dot] = acc_nullable
+                s = rhs[dot]
+                if nullable[s]:
+                    acc |= first[s]
+                else:
+                    acc = first[s]
+                    acc_nullable = False
+
+    # ---------- LR(0) 项目集规范族 ----------
+
+    def _closure0(self, kernel):
+        n_t = self.n_terminals
+        items = list(kernel)
+        in_closure = set(kernel)
+        expanded = set()
+        for it in kernel:
+            s = self.item_next[it]
+            if s >= n_t and s not in expanded:
+                expanded.add(s)
+                for extra in self.closure_items[s]:
+                    if extra not in in_closure:
+                        in_closure.add(extra)
+                        items.append(extra)
+        return items
+
+    def build_lr0(self):
+        start_kernel = (self.item_base[0],)
+        self.kernels = [start_kernel]
+        self.closures = []
+        self.transitions = []
+        index = {start_kernel: 0}
+
+        i = 0
+        while i < len(self.kernels):
+            closure = self._closure0(self.kernels[i])
+            self.closures.append(closure)
+            moves = {}
+            for it in closure:
+                s = self.item_next[it]
+                if s >= 0:
+                    moves.setdefault(s, []).append(it + 1)
+            trans = {}
+            for s in sorted(moves):
+                kernel = tuple(sorted(moves[s]))
+                j = index.get(kernel)
+                if j is None:
+                    j = len(self.kernels)
+                    index[kernel] = j
+                    self.kernels.append(kernel)
+                trans[s] = j
+            self.transitions.append(trans)
+            i += 1
+
+    # ---------- LALR(1) 向前看符号 ----------
+
+    def _compute_lalr_lookaheads(self):
+        """
+        DeRemer-Pennello 方法：在非终结符转移 (p, A) 上定义
+          DR(p, A)     = goto(p, A) 状态上可以移进的终结符
+          reads        (p, A) reads (r, C)：r = goto(p, A)，C 可空
+          includes     (p, A) includes (p', B)：B -> β A γ，γ 可空，p' 经 β 到达 p
+          lookback     (q, A -> ω) lookback (p, A)：p 经 ω 到达 q
+        Read = DR 沿 reads 的并，Follow = Read 沿 includes 的并，
+        归约 A -> ω 在状态 q 的向前看集合为 lookback 到的各 Follow 之并。
+        返回每个状态的归约列表 [(产生式编号, 向前看位集)]。
+        """
+        n_t = self.n_terminals
+        trans = self.transitions
+        nullable = self.nullable
+        end_bit = 1 << self.symbol_id['$']
+
+        nt_trans = []
+        nt_index = {}
+        for p, tr in enumerate(trans):
+            for s in tr:
+                if s >= n_t:
+                    nt_index[(p, s)] = len(nt_trans)
+                    nt_trans.append((p, s))
+
+        direct_reads = []
+        reads = []
+        for p, a in nt_trans:
+            r = trans[p][a]
+            bits = 0
+            edges = []
+            for s in trans[r]:
+                if s < n_t:
+                    bits |= 1 << s
+                elif nullable[s]:
+                    edges.append(nt_index[(r, s)])
+            direct_reads.append(bits)
+            reads.append(edges)
+        # 扩展产生式 S' -> S 之后只能是输入结束符
+        direct_reads[nt_index[(0, self.prod_rhs[0][0])]] |= end_bit
+
+        includes = [[] for _ in nt_trans]
+        lookback = {}
+        for idx, (p, b) in enumerate(nt_trans):
+            for prod in self.prods_of[b]:
+                rhs = self.prod_rhs[prod]
+                path = [p]
+                state = p
+                for x in rhs:
+                    state = trans[state][x]
+                    path.append(state)
+                lookback.setdefault((state, prod), []).append(idx)
+                for i in range(len(rhs) - 1, -1, -1):
+                    x = rhs[i]
+                    if x >= n_t:
+                        includes[nt_index[(path[i], x)]].append(idx)
+                    if not nullable[x]:
+                        break
+
+        follow = digraph(includes, digraph(reads, direct_reads))
+
+        result = []
+        for q, closure in enumerate(self.closures):
+            state_reduces = []
+            for it in closure:
+                if self.item_next[it] >= 0:
+                    continue
+                prod = self.item_prod[it]
+                lookahead = end_bit if prod == 0 else 0
+                for idx in lookback.get((q, prod), ()):
+                    lookahead |= follow[idx]
+                state_reduces.append((prod, lookahead))
+            result.append(state_reduces)
+        return result
+
+    def _compute_slr_lookaheads(self):
+        """SLR(1)：归约项目的向前看符号取左部的 FOLLOW 集"""
+        suffix_first, suffix_nullable = compute_suffix_first(self.prod_rhs, self.first, self.nullable)
+        follow = compute_follow(len(self.symbols), self.n_terminals, self.prod_lhs, self.prod_rhs,
+                                suffix_first, suffix_nullable, self.prod_lhs[0], 1 << self.symbol_id['$'])
+
+        result = []
+        for closure in self.closures:
+            result.append([(self.item_prod[it], follow[self.prod_lhs[self.item_prod[it]]])
+                           for it in closure if self.item_next[it] < 0])
+        return result
+
+    # ---------- 填表 ----------
+
+    def _set_action(self, state, terminal, entry):
+        row = self.action[state]
+        old = row.get(terminal)
+        if old is None or old == entry:
+            row[terminal] = entry
+            return
+        # 移进-规约冲突优先移进，规约-规约冲突优先编号小的产生式
+        if old[0] == 'shift' or entry[0] == 'shift':
+            kind = 'shift/reduce'
+            chosen, discarded = (old, entry) if old[0] == 'shift' else (entry, old)
+        else:
+            kind = 'reduce/reduce'
+            # 接受即用扩展产生式（编号 0）规约
+            old_prod = 0 if old[0] == 'accept' else old[1]
+            new_prod = 0 if entry[0] == 'accept' else entry[1]
+            chosen, discarded = (old, entry) if old_prod <= new_prod else (entry, old)
+        row[terminal] = chosen
+        self.conflicts.append(Conflict(state, terminal, kind, chosen, discarded))
+
+    def build(self, method='lalr'):
+        if method not in ('lalr', 'slr'):
+            raise ValueError(f"未知的分析表构造方法: {method!r}，可选值为 lalr, slr")
+        self.build_lr0()
+        reduces = self._compute_lalr_lookaheads() if method == 'lalr' else self._compute_slr_lookaheads()
+
+        symbols = self.symbols
+        n_t = self.n_terminals
+        self.action = {state: {} for state in range(len(self.kernels))}
+        self.goto = {state: {} for state in range(len(self.kernels))}
+        self.conflicts = []
+
+        for state, trans in enumerate(self.transitions):
+            for s, target in trans.items():
+                if s < n_t:
+                    self.action[state][symbols[s]] = ('shift', target)
+                else:
+                    self.goto[state][symbols[s]] = target
+
+        for state, state_reduces in enumerate(reduces):
+            for prod, lookahead in state_reduces:
+                while lookahead:
+                    low = lookahead & -lookahead
+                    terminal = symbols[low.bit_length() - 1]
+                    lookahead ^= low
+                    if prod == 0:
+                        self._set_action(state, terminal, ('accept', None))
+                    else:
+                        self._set_action(state, terminal, ('reduce', prod))
+        return self.action, self.goto
+
+    def format_item(self, item):
+        p = self.item_prod[item]
+        dot = item - self.item_base[p]
+        lhs, _ = self.grammar[p]
+        rhs = [self.symbols[s] for s in self.prod_rhs[p]]
+        return f"{lhs} -> {' '.join(rhs[:dot] + ['·'] + rhs[dot:])}"
+
+
+def build_lr_table(grammar, terminals, non_terminals, method='lalr'):
+    """构造LR分析表，返回 (action, goto, conflicts)"""
+    builder = LRTableBuilder(grammar, terminals, non_terminals)
+    action, goto = builder.build(method)
+    return action, goto, builder.conflicts
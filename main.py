@@ -1,10 +1,22 @@
+import argparse
+import json
 import sys
+from batch import DEFAULT_CHUNKSIZE, PARSER_KINDS, iter_parse_many
+from grammar_loader import GRAMMAR_PARSER_KINDS, load_grammar
 from recursive_descent import RecursiveDescentParser
 from ll1_parser import LL1Parser
 from lr_parser import LRParser
+from mapped_file import parse_file, parse_lines
+from pratt_parser import PrattParser
 from simple_test import run_simple_test
 
+# 批处理模式输出缓冲区大小
+OUTPUT_BUFFER_SIZE = 1 << 20
+
 def main():
+    # 分析表只在第一次选择相应分析方法时构造
+    ll1_parser = None
+    lr_parser = None
     while True:
         print("\n语法分析程序 - 算术表达式分析器")
         print("============================")
@@ -16,10 +28,11 @@ def main():
         print("1. 递归下降分析")
         print("2. LL(1)分析")
         print("3. LR分析")
-        print("4. 运行简单测试")
+        print("4. 算符优先分析")
+        print("5. 运行简单测试")
         print("0. 退出程序")
         
-        choice = input("\n请输入选择(0-4): ")
+        choice = input("\n请输入选择(0-5): ")
         
         if choice == '1':
             expr = input("请输入算术表达式: ")
@@ -27,15 +40,20 @@ def main():
             parser.parse()
         elif choice == '2':
             expr = input("请输入算术表达式: ")
-            parser = LL1Parser()
-            parser.construct_table()  # 构造预测分析表
-            parser.parse(expr)
+            if ll1_parser is None:
+                ll1_parser = LL1Parser()
+                ll1_parser.construct_table()  # 构造预测分析表
+            ll1_parser.parse(expr)
         elif choice == '3':
             expr = input("请输入算术表达式: ")
-            parser = LRParser()
-            parser.construct_table()  # 构造LR分析表
-            parser.parse(expr)
+            if lr_parser is None:
+                lr_parser = LRParser()
+                lr_parser.construct_table()  # 构造LR分析表
+            lr_parser.parse(expr)
         elif choice == '4':
+            expr = input("请输入算术表达式: ")
+            PrattParser().parse(expr)
+        elif choice == '5':
             run_simple_test()
 
         elif choice == '0':
@@ -45,11 +63,105 @@ def main():
             print("无效的选择!")
         
         input("\n按Enter键继续...")
+
+def format_result(line_no, result, output_format, productions):
+    """把一行的分析结果格式化为输出行（含换行符）"""
+    if output_format == 'jsonl':
+        record = {'line': line_no, 'accepted': result.accepted}
+        if not result.accepted:
+            record['error_pos'] = result.error_pos
+            record['error'] = result.error
+            # 被预检查拒绝的结果（prevalidate.PrevalidatedResult）不记录产生式序列，标明错误信息的来源
+            error_source = getattr(result, 'error_source', None)
+            if error_source is not None:
+                record['error_source'] = error_source
+        if productions:
+            record['productions'] = list(result.productions)
+        return json.dumps(record, ensure_ascii=False) + '\n'
+    # tsv：行号、OK 或 ERROR、出错位置、错误信息
+    fields = [str(line_no), 'OK' if result.accepted else 'ERROR']
+    if not result.accepted:
+        fields.append(str(result.error_pos))
+        fields.append(result.error.replace('\t', ' '))
+    if productions:
+        fields.append(' '.join(map(str, result.productions)))
+    return '\t'.join(fields) + '\n'
+
+def run_batch(args):
+    """
+    批处理模式：每行一个表达式，分析表只构造一次，结果按行输出，不打印分析过程
+    """
+    use_mmap = args.mmap or args.whole
+    source = sys.stdin if args.input == '-' or use_mmap else open(args.input, encoding='utf-8')
+    output = (sys.stdout if args.output == '-'
+              else open(args.output, 'w', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE))
+    try:
+        if args.whole:
+            # 整个文件是一个表达式
+            results = [parse_file(args.input, record=args.productions, cache_dir=args.cache_dir)]
+        elif args.mmap:
+            results = parse_lines(args.input, args.parser, args.workers, args.chunksize, args.cache_dir)
+        else:
+            expressions = (line.rstrip('\r\n') for line in source)
+            grammar = load_grammar(args.grammar) if args.grammar is not None else None
+            results = iter_parse_many(expressions, args.parser, args.workers, args.chunksize, args.cache_dir,
+                                      grammar)
+        pending = []
+        for line_no, result in enumerate(results, 1):
+            pending.append(format_result(line_no, result, args.format, args.productions))
+            if len(pending) >= 4096:
+                output.write(''.join(pending))
+                pending.clear()
+        output.write(''.join(pending))
+        output.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+def parse_args(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="算术表达式语法分析程序；不带参数运行时进入交互菜单，指定 --parser 时批量分析")
+    arg_parser.add_argument('--parser', choices=PARSER_KINDS, help="批处理模式使用的分析器")
+    arg_parser.add_argument('--input', default='-', help="输入文件，每行一个表达式，默认为标准输入")
+    arg_parser.add_argument('--output', default='-', help="输出文件，默认为标准输出")
+    arg_parser.add_argument('--format', choices=('jsonl', 'tsv'), default='jsonl', help="输出格式")
+    arg_parser.add_argument('--productions', action='store_true', help="输出使用的产生式编号序列")
+    arg_parser.add_argument('--workers', type=int, default=None, help="工作进程数，0 表示使用全部CPU核心")
+    arg_parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help="每次分发给工作进程的行数")
+    arg_parser.add_argument('--cache-dir', default=None, help="分析表缓存目录")
+    arg_parser.add_argument('--grammar', default=None,
+                            help="文法文件（见 grammar_loader 模块），默认为内置的表达式文法，只支持 lr、ll1、rd 分析器")
+    arg_parser.add_argument('--mmap', action='store_true', help="用 mmap 按字节读取输入文件，出错位置为字节偏移")
+    arg_parser.add_argument('--whole', action='store_true',
+                            help="用 mmap 把整个输入文件作为一个表达式分析（只支持 lr 分析器）")
+    args = arg_parser.parse_args(argv)
+    if (args.mmap or args.whole) and args.input == '-':
+        arg_parser.error("--mmap 和 --whole 需要用 --input 指定输入文件")
+    if args.whole and args.parser not in (None, 'lr'):
+        arg_parser.error("--whole 只支持 --parser lr")
+    if args.grammar is not None:
+        if args.parser not in GRAMMAR_PARSER_KINDS:
+            arg_parser.error(f"--grammar 只支持 --parser {'、'.join(GRAMMAR_PARSER_KINDS)}")
+        if args.mmap or args.whole:
+            arg_parser.error("--grammar 不能与 --mmap 或 --whole 同时使用")
+    return args
             
 if __name__ == "__main__":
-    try:
-        main()
-    except KeyboardInterrupt:
-        print("\n程序已中断")
-    except Exception as e:
-        print(f"\n发生错误: {e}")
+    args = parse_args()
+    if args.parser is not None:
+        try:
+            run_batch(args)
+        except BrokenPipeError:
+            # 下游提前关闭管道（如 head），不再输出
+            sys.stderr.close()
+        except KeyboardInterrupt:
+            sys.exit(130)
+    else:
+        try:
+            main()
+        except KeyboardInterrupt:
+            print("\n程序已中断")
+        except Exception as e:
+            print(f"\n发生错误: {e}")
@@ -0,0 +1,109 @@
+"""
+用 mmap 分析很大的表达式文件
+
+文件按只读方式映射到内存，直接在映射上用字节正则扫描，不把整个文件读成 str：
+
+  parse_file(path)    把整个文件当作一个表达式，用LR推式分析器按窗口分段送入
+                      （窗口只是映射上的下标范围，不复制），内存占用只与括号嵌套深度有关；
+  iter_lines(path)    按换行符切分记录，每次只复制一行，供 parse_lines 等逐行分析；
+  parse_lines(path)   每行一个表达式，按输入顺序逐个产生 ParseResult（与 batch.iter_parse_many 相同）。
+
+映射的页面读过以后仍然算在进程的常驻内存中，因此每处理完一个窗口就用
+madvise(MADV_DONTNEED) 通知内核释放已经处理过的页面，常驻内存不随文件大小增长。
+出错位置是字节偏移（parse_lines 中是相对于该行开头的偏移）。
+"""
+import mmap
+import os
+
+from batch import DEFAULT_CHUNKSIZE, ParseResult, iter_parse_many, make_parser
+
+DEFAULT_WINDOW = 1 << 24  # 16 MiB
+
+_CR = ord('\r')
+
+
+class MappedFile:
+    """只读映射一个文件，data 为 mmap 对象（空文件为 b''）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        # 长度为 0 的文件不能映射
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self._released = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file.close()
+
+    def discard(self, upto):
+        """[0, upto) 已经处理完，释放这部分映射占用的物理页面（不支持 madvise 时什么也不做）"""
+        if not isinstance(self.data, mmap.mmap) or not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        start = self._released
+        end = upto - upto % mmap.PAGESIZE
+        if end > start:
+            self.data.madvise(mmap.MADV_DONTNEED, start, end - start)
+            self._released = end
+
+
+def parse_file(path, parser=None, window=DEFAULT_WINDOW, record=False, cache_dir=None):
+    """
+    把整个文件作为一个表达式分析，返回 ParseResult
+    parser 为已构造分析表的 LRParser，为 None 时新建；record 为 True 时保存产生式序列
+    （序列长度与文件大小成正比），否则 ParseResult.productions 为空元组
+    """
+    if window < 1:
+        raise ValueError("window 必须为正整数")
+    if parser is None:
+        parser = make_parser('lr', cache_dir)
+    push = parser.push_parser(record)
+    with MappedFile(path) as mapped:
+        data = mapped.data
+        size = len(data)
+        for start in range(0, size, window):
+            end = min(start + window, size)
+            if not push.feed(data, start, end):
+                break
+            mapped.discard(end)
+        push.finish()
+    productions = tuple(push.production_ids) if record else ()
+    return ParseResult(push.accepted, push.error_pos, push.error, productions)
+
+
+def iter_lines(path, window=DEFAULT_WINDOW):
+    """按行产生文件中的记录（bytes，不含行尾的 \\n 或 \\r\\n），最后一行可以没有换行符"""
+    with MappedFile(path) as mapped:
+        data = mapped.data
+        size = len(data)
+        find = data.find
+        pos = 0
+        next_discard = window
+        while pos < size:
+            end = find(b'\n', pos)
+            next_pos = end + 1
+            if end < 0:
+                end = next_pos = size
+            stop = end - 1 if end > pos and data[end - 1] == _CR else end
+            yield data[pos:stop]
+            pos = next_pos
+            if pos >= next_discard:
+                mapped.discard(pos)
+                next_discard = pos + window
+
+
+def parse_lines(path, parser='lr', workers=None, chunksize=DEFAULT_CHUNKSIZE, cache_dir=None,
+                window=DEFAULT_WINDOW):
+    """文件每行一个表达式，按输入顺序逐个产生 ParseResult，参数含义见 batch.parse_many"""
+    return iter_parse_many(iter_lines(path, window), parser, workers, chunksize, cache_dir)
@@ -0,0 +1,139 @@
+"""
+分析结果缓存
+
+同一批公式反复出现时，可以在分析器前面加一层缓存，直接返回以前的分析结果。
+缓存键是规范化后的单词序列：每个数字换成 0，再删去空白，于是键的每个字符恰好对应一个单词。
+数字的值和空白不影响分析结果，因此 "1 + 2" 与 "30+4" 命中同一项。规范化只用两次正则替换，
+比完整的词法分析快得多。每项保存是否成功、出错单词的下标、错误信息和产生式编号序列（array('H')）；
+命中时不再运行分析程序，只有出错时才对本次输入做词法分析，把单词下标换算成出错位置。
+
+ParseCache 按最近最少使用（LRU）淘汰，可以同时限制项数和估计的内存字节数，
+并统计命中、未命中和淘汰次数。CachedParser 把缓存和三种分析器组合在一起。
+"""
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from batch import ParseResult, make_parser, parse_one
+from scanner import scan
+
+DEFAULT_MAX_ENTRIES = 4096
+
+# 每项除键和值本身以外的固定开销（OrderedDict 结点、元组等）的估计值
+_ENTRY_OVERHEAD = 160
+
+_NUMBER_RE = re.compile(r'\d+')
+_SPACE_RE = re.compile(r'\s+')
+_NUMBER_RE_BYTES = re.compile(rb'\d+')
+_SPACE_RE_BYTES = re.compile(rb'\s+')
+
+
+def token_key(expr):
+    """
+    计算表达式的缓存键（str 或字节串），如 " 12 +(3)" 的键为 "0+(0)"
+    先替换数字再删空白，"1 2" 的键为 "00"，与 "12" 不同
+    """
+    if isinstance(expr, str):
+        return _SPACE_RE.sub('', _NUMBER_RE.sub('0', expr))
+    return _SPACE_RE_BYTES.sub(b'', _NUMBER_RE_BYTES.sub(b'0', expr))
+
+
+class ParseCache:
+    """
+    max_entries 为最多保存的项数，max_bytes 为估计占用内存的上限，为 None 时不限制
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=None):
+        if max_entries is not None and max_entries < 1:
+            raise ValueError("max_entries 必须为正整数")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """返回 (accepted, 出错单词下标, error, 产生式编号数组)，未命中时返回 None"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, accepted, error_index, error, productions):
+        productions = array('H', productions)
+        size = (_ENTRY_OVERHEAD + sys.getsizeof(key) + sys.getsizeof(productions)
+                + (sys.getsizeof(error) if error is not None else 0))
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False  # 单项就超过上限，不缓存
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.current_bytes -= old[1]
+        self.entries[key] = ((accepted, error_index, error, productions), size)
+        self.current_bytes += size
+        self._evict()
+        return True
+
+    def _evict(self):
+        entries = self.entries
+        while ((self.max_entries is not None and len(entries) > self.max_entries)
+               or (self.max_bytes is not None and self.current_bytes > self.max_bytes)):
+            _, (_, size) = entries.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.current_bytes = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'bytes': self.current_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate,
+        }
+
+
+class CachedParser:
+    """
+    带结果缓存的分析器，parser 为 PARSER_KINDS 中的一种（见 batch 模块）
+    cache 可以传入多个 CachedParser 共享的 ParseCache，但不同种类的分析器不能共享（产生式编号不同）
+    """
+
+    def __init__(self, parser='lr', cache=None, cache_dir=None):
+        self.kind = parser
+        self.parser = make_parser(parser, cache_dir)
+        self.cache = cache if cache is not None else ParseCache()
+
+    def parse(self, expr):
+        """分析一个表达式，返回 ParseResult"""
+        key = token_key(expr)
+        entry = self.cache.get(key)
+        if entry is not None:
+            accepted, error_index, error, productions = entry
+            error_pos = scan(expr).starts[error_index] if error_index is not None else None
+            return ParseResult(accepted, error_pos, error, tuple(productions))
+
+        result = parse_one(self.parser, expr)
+        error_index = None
+        if result.error_pos is not None:
+            error_index = bisect_left(scan(expr).starts, result.error_pos)
+        self.cache.put(key, result.accepted, error_index, result.error, result.productions)
+        return result
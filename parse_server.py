@@ -0,0 +1,444 @@
+"""
+asyncio 语法分析服务
+
+ParseServer 在启动时构造一次分析表，之后通过 TCP 或 Unix 套接字提供分析服务：
+
+  协议    按行收发：每个请求是一行表达式（按字节分析，出错位置为字节偏移），每个响应是一行 JSON
+          {"accepted": ..., "error_pos": ..., "error": ...}，同一连接上的响应与请求顺序相同，
+          客户端可以连续发送多个请求而不必等待响应。请求 "#stats" 返回服务端统计信息。
+  批处理  所有连接的请求进入同一个队列，批处理任务把同时到达的请求凑成一批（最多 max_batch 个，
+          最多等待 max_delay 秒），交给线程池或进程池分析，事件循环本身不做分析；
+          同时在分析的批数不超过工作线程（进程）数。
+  背压    队列长度不超过 max_pending，队列满时服务端暂停读取该连接的后续请求，
+          由 TCP 流量控制让客户端减速；每个连接未发出的响应也不超过 max_pending 个。
+  统计    记录每个请求从进入队列到得到结果的延迟分位数、批数和平均批大小。
+
+ParseClient 是对应的 asyncio 客户端，run_load() 是负载生成器，可以在同一台机器上测试：
+
+    python parse_server.py serve --parser lr --workers 4
+    python parse_server.py bench --connections 16 --requests 50000
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import copy
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+from batch import PARSER_KINDS, make_parser, parse_one
+from compiled_grammar import COMPILED_KINDS, CompiledGrammar
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH = 256
+DEFAULT_MAX_DELAY = 0.002
+DEFAULT_MAX_PENDING = 4096
+DEFAULT_MAX_LINE = 1 << 20
+DEFAULT_PIPELINE = 32
+
+# 延迟分位数按最近这么多个请求计算
+LATENCY_WINDOW = 100000
+
+STATS_COMMAND = b'#stats'
+
+clock = time.perf_counter
+
+# 工作线程（进程）中的分析状态：所有线程共享同一个 CompiledGrammar，每个线程有自己的 ParseContext；
+# 不能编译的分析器（lrgen）每个线程一份浅拷贝，共享分析表，各自保存分析结果
+_worker_state = threading.local()
+
+
+def _init_worker(parser):
+    if isinstance(parser, CompiledGrammar):
+        _worker_state.grammar = parser
+        _worker_state.context = parser.new_context()
+    else:
+        _worker_state.grammar = None
+        _worker_state.parser = copy.copy(parser)
+
+
+def _parse_batch(expressions):
+    grammar = _worker_state.grammar
+    if grammar is not None:
+        context = _worker_state.context
+        return [grammar.parse(expr, context).result() for expr in expressions]
+    parser = _worker_state.parser
+    return [parse_one(parser, expr) for expr in expressions]
+
+
+def _percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def latency_summary(samples):
+    """延迟样本（秒）的分位数，单位为毫秒"""
+    if not samples:
+        return {'count': 0}
+    values = sorted(samples)
+    return {
+        'count': len(values),
+        'p50_ms': _percentile(values, 0.50) * 1000,
+        'p90_ms': _percentile(values, 0.90) * 1000,
+        'p99_ms': _percentile(values, 0.99) * 1000,
+        'max_ms': values[-1] * 1000,
+        'mean_ms': sum(values) / len(values) * 1000,
+    }
+
+
+def encode_result(result):
+    """把 ParseResult 编码为一行 JSON 响应"""
+    return json.dumps({'accepted': result.accepted, 'error_pos': result.error_pos, 'error': result.error},
+                      ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+class ParseServer:
+    """
+    parser 为 PARSER_KINDS 中的一种；executor 为 'process'（多进程，默认）或 'thread'；
+    workers 为工作进程（线程）数，None 表示 CPU 核心数
+    """
+
+    def __init__(self, parser='lr', executor='process', workers=None, max_batch=DEFAULT_MAX_BATCH,
+                 max_delay=DEFAULT_MAX_DELAY, max_pending=DEFAULT_MAX_PENDING, max_line=DEFAULT_MAX_LINE,
+                 cache_dir=None):
+        if executor not in ('process', 'thread'):
+            raise ValueError(f"未知的执行器: {executor!r}，可选值为 process, thread")
+        self.kind = parser
+        # 分析表只构造一次，随池初始化传给各工作进程（线程）
+        if parser in COMPILED_KINDS:
+            self.parser = CompiledGrammar(parser, cache_dir)
+        else:
+            self.parser = make_parser(parser, cache_dir)
+        self.executor_kind = executor
+        self.workers = workers or os.cpu_count() or 1
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_line = max_line
+
+        self.executor = None
+        self.server = None
+        self._queue = None
+        self._batcher = None
+        self._dispatches = set()
+        self._handlers = {}  # 连接处理任务 -> 该连接的 writer
+
+        self.requests = 0
+        self.batches = 0
+        self.connections = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+        """开始监听，path 不为 None 时使用 Unix 套接字"""
+        if self.executor_kind == 'process':
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                self.workers, initializer=_init_worker, initargs=(self.parser,))
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                self.workers, initializer=_init_worker, initargs=(self.parser,))
+        self._queue = asyncio.Queue(self.max_pending)
+        self._batcher = asyncio.create_task(self._run_batcher())
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._handle, path, limit=self.max_line)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port, limit=self.max_line)
+        return self.server
+
+    async def serve_forever(self):
+        await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+        # 断开各连接，等待已经排队的请求分析完
+        for writer in self._handlers.values():
+            writer.transport.abort()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+        if self._batcher is not None:
+            self._batcher.cancel()
+        if self.executor is not None:
+            # 等待工作进程（线程）退出会阻塞，放到默认的线程池中执行，不占用事件循环
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, functools.partial(self.executor.shutdown, wait=True,
+                                                               cancel_futures=True))
+
+    def stats(self):
+        return {
+            'parser': self.kind,
+            'requests': self.requests,
+            'batches': self.batches,
+            'mean_batch': self.requests / self.batches if self.batches else 0.0,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'connections': self.connections,
+            'latency': latency_summary(self.latencies),
+        }
+
+    async def _run_batcher(self):
+        """把同时到达的请求凑成一批交给执行器，同时在分析的批数不超过工作进程数"""
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.workers)
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await slots.acquire()
+            task = asyncio.create_task(self._dispatch(batch, slots))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch, slots):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, _parse_batch, [expr for expr, _, _ in batch])
+        except Exception as exc:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            slots.release()
+        finished = clock()
+        self.batches += 1
+        self.requests += len(batch)
+        record = self.latencies.append
+        for (_, future, queued), result in zip(batch, results):
+            record(finished - queued)
+            if not future.done():
+                future.set_result(encode_result(result))
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        # 本连接尚未发出的响应，按请求顺序排列
+        pending = asyncio.Queue(self.max_pending)
+        responder = asyncio.create_task(self._respond(writer, pending))
+        handler = asyncio.current_task()
+        self._handlers[handler] = writer
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # 单行超过 max_line，无法继续划分请求
+                    future = loop.create_future()
+                    future.set_result(json.dumps(
+                        {'accepted': False, 'error_pos': None, 'error': f"请求超过 {self.max_line} 字节"},
+                        ensure_ascii=False).encode('utf-8') + b'\n')
+                    await pending.put(future)
+                    break
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                expr = line.rstrip(b'\r\n')
+                future = loop.create_future()
+                if expr == STATS_COMMAND:
+                    future.set_result(json.dumps({'stats': self.stats()}).encode('utf-8') + b'\n')
+                else:
+                    await self._queue.put((expr, future, clock()))
+                await pending.put(future)
+        finally:
+            self.connections -= 1
+            await pending.put(None)
+            await responder
+            self._handlers.pop(handler, None)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _respond(self, writer, pending):
+        broken = False
+        while True:
+            future = await pending.get()
+            if future is None:
+                return
+            try:
+                response = await future
+            except Exception as exc:
+                response = json.dumps({'accepted': False, 'error_pos': None, 'error': f"服务端错误: {exc}"},
+                                      ensure_ascii=False).encode('utf-8') + b'\n'
+            if broken:
+                continue  # 客户端已断开，只消耗剩余的结果
+            try:
+                writer.write(response)
+                if pending.empty():
+                    await writer.drain()
+            except ConnectionError:
+                broken = True
+
+
+class ParseClient:
+    """ParseServer 的客户端，可以在多个协程中并发调用 parse，请求在同一连接上流水线发送"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self._waiting = collections.deque()
+        self._receiver = asyncio.create_task(self._receive())
+
+    @classmethod
+    async def connect(cls, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, limit=DEFAULT_MAX_LINE):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit=limit)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=limit)
+        return cls(reader, writer)
+
+    async def _receive(self):
+        try:
+            while self._waiting or not self.reader.at_eof():
+                line = await self.reader.readline()
+                if not line:
+                    break
+                self._waiting.popleft().set_result(json.loads(line))
+        finally:
+            while self._waiting:
+                future = self._waiting.popleft()
+                if not future.done():
+                    future.set_exception(ConnectionError("连接已关闭"))
+
+    async def request(self, line):
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+        if b'\n' in line:
+            raise ValueError("表达式中不能含有换行符")
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.append(future)
+        self.writer.write(line + b'\n')
+        await self.writer.drain()
+        return await future
+
+    async def parse(self, expr):
+        """返回 {'accepted': ..., 'error_pos': ..., 'error': ...}"""
+        return await self.request(expr)
+
+    async def stats(self):
+        return (await self.request(STATS_COMMAND))['stats']
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        self._receiver.cancel()
+
+
+async def run_load(expressions, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, connections=8,
+                   pipeline=DEFAULT_PIPELINE):
+    """
+    负载生成器：用 connections 个连接、每个连接最多 pipeline 个未完成请求，把 expressions 全部发送一遍，
+    返回吞吐量、客户端测得的延迟分位数和服务端统计信息
+    """
+    clients = [await ParseClient.connect(host, port, path) for _ in range(connections)]
+    work = iter(expressions)
+    latencies = []
+    accepted = 0
+
+    async def requester(client):
+        nonlocal accepted
+        for expr in work:
+            started = clock()
+            result = await client.parse(expr)
+            latencies.append(clock() - started)
+            accepted += result['accepted']
+
+    started = clock()
+    await asyncio.gather(*(requester(c) for c in clients for _ in range(pipeline)))
+    elapsed = clock() - started
+    server_stats = await clients[0].stats()
+    for client in clients:
+        await client.close()
+    return {
+        'requests': len(latencies),
+        'accepted': accepted,
+        'seconds': elapsed,
+        'requests_per_sec': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'latency': latency_summary(latencies),
+        'server': server_stats,
+    }
+
+
+async def _serve(args):
+    server = ParseServer(args.parser, args.executor, args.workers, args.max_batch, args.max_delay,
+                         args.max_pending, cache_dir=args.cache_dir)
+    await server.start(args.host, args.port, args.unix)
+    where = args.unix if args.unix else f"{args.host}:{args.port}"
+    unit = '工作进程' if args.executor == 'process' else '工作线程'
+    print(f"分析服务已启动: {where}（{args.parser} 分析器，{server.workers} 个{unit}）", flush=True)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+async def _bench(args):
+    from benchmark import latency_inputs
+    expressions = latency_inputs(args.requests)
+    report = await run_load(expressions, args.host, args.port, args.unix, args.connections, args.pipeline)
+    latency = report['latency']
+    server = report['server']
+    print(f"{report['requests']} 个请求，{report['seconds']:.2f} 秒，{report['requests_per_sec']:,.0f} 请求/秒")
+    print(f"客户端延迟  p50 {latency['p50_ms']:.2f} ms  p90 {latency['p90_ms']:.2f} ms  "
+          f"p99 {latency['p99_ms']:.2f} ms  max {latency['max_ms']:.2f} ms")
+    if server['latency']['count']:
+        print(f"服务端延迟  p50 {server['latency']['p50_ms']:.2f} ms  p99 {server['latency']['p99_ms']:.2f} ms  "
+              f"平均批大小 {server['mean_batch']:.1f}")
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="语法分析服务及负载生成器")
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('serve', "启动分析服务"), ('bench', "对运行中的分析服务做负载测试")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--host', default=DEFAULT_HOST)
+        command.add_argument('--port', type=int, default=DEFAULT_PORT)
+        command.add_argument('--unix', default=None, help="Unix 套接字路径，指定时不使用 TCP")
+
+    serve = commands.choices['serve']
+    serve.add_argument('--parser', choices=PARSER_KINDS, default='lr')
+    serve.add_argument('--executor', choices=('process', 'thread'), default='process')
+    serve.add_argument('--workers', type=int, default=None, help="工作进程（线程）数，默认为CPU核心数")
+    serve.add_argument('--max-batch', type=int, default=DEFAULT_MAX_BATCH, help="每批最多的请求数")
+    serve.add_argument('--max-delay', type=float, default=DEFAULT_MAX_DELAY, help="凑批最多等待的秒数")
+    serve.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING, help="排队请求数的上限")
+    serve.add_argument('--cache-dir', default=None, help="分析表缓存目录")
+
+    bench = commands.choices['bench']
+    bench.add_argument('--connections', type=int, default=8)
+    bench.add_argument('--pipeline', type=int, default=DEFAULT_PIPELINE, help="每个连接最多的未完成请求数")
+    bench.add_argument('--requests', type=int, default=20000)
+    bench.add_argument('--json', action='store_true', help="同时输出 JSON 格式的完整报告")
+
+    args = arg_parser.parse_args(argv)
+    try:
+        asyncio.run(_serve(args) if args.command == 'serve' else _bench(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""
+算符优先（优先级爬升）分析
+
+E/T/F 文法实际上只是两级左结合的二元运算符加括号，但LR分析对每个运算数都要查表做
+F -> num、T -> F、E -> T 这样的单规约，LL(1) 分析对每个运算数都要展开 E'、T'。
+PrattParser 只区分"期望运算数"和"期望运算符"两种情况，每个单词处理一次：
+
+  - 左括号和运算符压入运算符栈，运算数只记录它当前归约到的层次（F、T 或 E）；
+  - 读到运算符时，先把栈顶优先级不低于它的运算符归并，再把左运算数提升到该运算符的层次；
+  - 读到右括号或输入结束时归并到左括号（或栈底）为止。
+
+单产生式不需要分析步骤，提升层次时直接追加预先算好的产生式编号。产生式编号与 LRParser 相同，
+产生式序列也与LR分析完全相同（都是最右推导的逆序），语义动作（语法树、逆波兰指令）可以直接使用。
+出错的单词也与LR分析相同：两者都在第一个不能构成合法前缀的单词处报错，
+只是出错时已经记录的产生式序列可能不同。
+"""
+from array import array
+from collections import Counter
+
+from derivation import REVERSE_RIGHTMOST, Derivation
+from parse_stats import ParseRecord, clock
+from scanner import DIV, END, KIND_NAMES, LPAREN, MINUS, MUL, NUM, PLUS, RPAREN, scan
+from step_trace import TRACE_PRINT, check_trace_mode
+
+# 与 LRParser 相同的文法和产生式编号
+RULES = (("S'", ['E']), ('E', ['E', '+', 'T']), ('E', ['E', '-', 'T']), ('E', ['T']),
+         ('T', ['T', '*', 'F']), ('T', ['T', '/', 'F']), ('T', ['F']),
+         ('F', ['(', 'E', ')']), ('F', ['num']))
+P_E_ADD, P_E_SUB, P_E_T, P_T_MUL, P_T_DIV, P_T_F, P_F_PAREN, P_F_NUM = range(1, len(RULES))
+
+# 运算数的层次：E、T、F，层次 k 的运算符左运算数为层次 k、右运算数为层次 k + 1
+LEVEL_E, LEVEL_T, LEVEL_F = range(3)
+
+# 运算符的层次（按单词种别下标，不是运算符时为 -1）及归并时使用的产生式
+OPERATOR_LEVEL = [-1] * len(KIND_NAMES)
+BINARY_PRODUCTION = [0] * len(KIND_NAMES)
+for _kind, _level, _prod in ((PLUS, LEVEL_E, P_E_ADD), (MINUS, LEVEL_E, P_E_SUB),
+                             (MUL, LEVEL_T, P_T_MUL), (DIV, LEVEL_T, P_T_DIV)):
+    OPERATOR_LEVEL[_kind] = _level
+    BINARY_PRODUCTION[_kind] = _prod
+
+# PROMOTE[a][b]：把层次 a 的运算数提升到层次 b（b <= a）使用的单产生式序列
+_UNIT_PRODUCTIONS = (P_E_T, P_T_F)  # 层次 k + 1 -> k
+PROMOTE = tuple(tuple(tuple(_UNIT_PRODUCTIONS[k] for k in range(a - 1, b - 1, -1)) for b in range(a + 1))
+                for a in range(LEVEL_F + 1))
+
+
+def run_pratt(tokens, ops, production_ids, actions=None, track_depth=False):
+    """
+    算符优先分析主循环，不使用任何共享的可变状态，可以在多个线程中同时调用
+    ops 为运算符栈（调用时为空），使用的产生式追加到 production_ids，actions 为语义动作。
+    返回 (结束时的单词下标, 运算符栈的最大深度, 错误信息, 开始符号的语义值)，分析成功时错误信息为 None
+    """
+    kinds = tokens.kinds
+    starts = tokens.starts
+    ends = tokens.ends
+    emit = production_ids.append
+    extend = production_ids.extend
+    op_level = OPERATOR_LEVEL
+    binary = BINARY_PRODUCTION
+    promote = PROMOTE
+    push = ops.append  # 运算符栈保存单词种别，左括号作为标记
+    values = None  # 语义值栈，与运算符栈交错保存运算数、运算符和左括号的语义值
+    if actions is not None:
+        actions.bind(RULES)
+        values = []
+    nesting = 0  # 尚未匹配的左括号个数
+    max_ops = 0
+    i = 0
+
+    while True:
+        # 期望运算数
+        kind = kinds[i]
+        while kind == LPAREN:
+            push(LPAREN)
+            nesting += 1
+            if track_depth and len(ops) > max_ops:
+                max_ops = len(ops)
+            if values is not None:
+                values.append(actions.shift(kind, starts[i], ends[i]))
+            i += 1
+            kind = kinds[i]
+        if kind != NUM:
+            return i, max_ops, "语法错误：期望 '(' 或 'num'", None
+        emit(P_F_NUM)
+        if values is not None:
+            values.append(actions.reduce(P_F_NUM, [actions.shift(kind, starts[i], ends[i])]))
+        level = LEVEL_F
+        i += 1
+        kind = kinds[i]
+
+        # 期望运算符；右括号之后仍然期望运算符
+        while True:
+            target = op_level[kind]
+            if target < 0:
+                if kind == RPAREN:
+                    if not nesting:
+                        return i, max_ops, "语法错误：多余的右括号", None
+                elif kind == END:
+                    if nesting:
+                        return i, max_ops, "错误：缺少右括号", None
+                else:
+                    return i, max_ops, "语法错误：期望运算符或 ')'", None
+                target = LEVEL_E
+
+            # 归并栈顶优先级不低于 target 的运算符（左括号的层次为 -1，不会被归并）
+            while ops:
+                top_level = op_level[ops[-1]]
+                if top_level < target:
+                    break
+                op = ops.pop()
+                if level > top_level + 1:
+                    units = promote[level][top_level + 1]
+                    extend(units)
+                    if values is not None:
+                        for prod in units:
+                            values[-1] = actions.reduce(prod, [values[-1]])
+                emit(binary[op])
+                if values is not None:
+                    rhs_values = values[-3:]
+                    del values[-3:]
+                    values.append(actions.reduce(binary[op], rhs_values))
+                level = top_level
+            if level > target:
+                units = promote[level][target]
+                extend(units)
+                if values is not None:
+                    for prod in units:
+                        values[-1] = actions.reduce(prod, [values[-1]])
+                level = target
+
+            if kind == RPAREN:
+                # F -> (E)
+                ops.pop()
+                nesting -= 1
+                emit(P_F_PAREN)
+                if values is not None:
+                    rhs_values = values[-2:]
+                    del values[-2:]
+                    rhs_values.append(actions.shift(kind, starts[i], ends[i]))
+                    values.append(actions.reduce(P_F_PAREN, rhs_values))
+                level = LEVEL_F
+                i += 1
+                kind = kinds[i]
+                continue
+            if kind == END:
+                return i, max_ops, None, values[-1] if values is not None else None
+
+            # 运算符入栈，回到期望运算数
+            push(kind)
+            if track_depth and len(ops) > max_ops:
+                max_ops = len(ops)
+            if values is not None:
+                values.append(actions.shift(kind, starts[i], ends[i]))
+            i += 1
+            break
+
+
+class PrattParser:
+    def __init__(self, stats=None):
+        # 不需要分析表；stats 为 ParseStats 对象时每次分析结束后记录统计信息（见 parse_stats 模块）
+        self.stats = stats
+        self.grammar = RULES
+
+        # 最近一次分析的结果
+        self.production_ids = array('H')
+        self.error = None
+        self.error_pos = None  # 出错单词在源串中的位置
+        self.semantic_value = None
+
+    def parse(self, expr, trace=TRACE_PRINT, actions=None):
+        """
+        分析表达式 expr，返回是否分析成功
+        算符优先分析没有分析过程表，trace 只决定是否打印结果；
+        actions 为语义动作（接口见 expr_tree 模块），调用顺序与LR分析相同，结果保存在 semantic_value 中
+        """
+        trace = check_trace_mode(trace)
+        stats = self.stats
+        if stats is not None:
+            started = clock()
+        tokens = scan(expr)
+        if stats is not None:
+            tokenized = clock()
+
+        self.production_ids = array('H')
+        self.error_pos = None
+        track_depth = stats is not None and stats.track_depth
+
+        index, max_ops, self.error, self.semantic_value = run_pratt(tokens, [], self.production_ids, actions,
+                                                                    track_depth)
+
+        if self.error is not None:
+            self.error_pos = tokens.starts[index]
+
+        if stats is not None:
+            depth = max_ops + 1 if track_depth else None
+            stats.record(ParseRecord('pratt', self.error is None, len(tokens) - 1, index,
+                                     len(self.production_ids), Counter(self.production_ids), 0, depth,
+                                     tokenized - started, clock() - tokenized))
+
+        if trace == TRACE_PRINT:
+            if self.error is None:
+                print("分析成功!")
+                print("使用的产生式序列:")
+                for i, prod in enumerate(self.productions_used):
+                    print(f"{i+1}. {prod}")
+            else:
+                print(self.error)
+                print("语法错误!")
+
+        return self.error is None
+
+    @property
+    def productions_used(self):
+        return [self.format_production(i) for i in self.production_ids]
+
+    def derivation(self):
+        """最近一次分析的推导，与LR分析相同为最右推导的逆序（见 derivation 模块）"""
+        return Derivation(RULES, self.production_ids, REVERSE_RIGHTMOST)
+
+    def format_production(self, prod_idx):
+        lhs, rhs = RULES[prod_idx]
+        return f"{lhs} -> {' '.join(rhs)}"
@@ -0,0 +1,191 @@
+"""
+用 NumPy 批量预检查表达式
+
+被拒绝的输入大多错在很简单的结构上：括号不配对、两个运算符相连、以运算符开头或结尾。
+prevalidate() 把一批表达式拼成一个字节缓冲区，用偏移数组记录每个表达式的起止位置，
+整批只做几次数组运算：
+
+  1. 查 256 项的字符类别表，得到每个字节的类别（空白、数字、运算符、左右括号、其他）；
+  2. 非空白且不是数字串中间的字节是单词的开头，取出所有单词，按偏移数组求出所属的表达式；
+  3. 把单词序列错开一位比较：运算数（数字、右括号）之后必须是运算符或右括号，
+     其余单词（运算符、左括号、表达式开头）之后必须是数字或左括号；
+  4. 对左括号 +1、右括号 -1 求累加和，减去各表达式开头处的值得到括号深度，深度小于 0 的右括号多余；
+  5. 每个表达式取第一处违例；没有违例时再检查结尾：最后一个单词必须是运算数，深度必须回到 0。
+
+这些规则正好刻画了 E/T/F 文法的全部句子，所以预检查的结论与分析器相同，出错位置也与
+LRParser 相同（都是第一个不能构成合法前缀的单词），错误信息与 PrattParser 相同。
+parse_many() 先预检查，只把通过的表达式交给完整的分析器求产生式序列；
+被拒绝的表达式直接给出 PrevalidatedResult：出错位置与分析器相同，但错误信息是预检查的，
+不记录产生式序列（分析器会给出出错之前的部分产生式序列），error_source 为 'prevalidate'。
+
+str 输入中含有非 ASCII 字符时（Unicode 空白、数字的规则与字节不同）不做预检查，直接交给分析器；
+ASCII 范围内 str 的空白比字节串多出 0x1c-0x1f 四个控制字符，打包时把 str 中的这几个字符换成空格。
+没有安装 NumPy 时 prevalidate() 不可用，parse_many() 退化为 batch.parse_many()。
+"""
+from collections import namedtuple
+
+from batch import DEFAULT_CHUNKSIZE, ParseResult, iter_parse_many
+from batch import parse_many as parse_many_unchecked
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 是可选依赖
+    np = None
+
+# 字符类别
+CHAR_SPACE, CHAR_DIGIT, CHAR_OPERATOR, CHAR_LPAREN, CHAR_RPAREN, CHAR_OTHER = range(6)
+
+# 错误编码，0 表示通过（或未检查）
+ERROR_NONE, ERROR_EXPECT_OPERAND, ERROR_EXPECT_OPERATOR, ERROR_EXTRA_RPAREN, ERROR_MISSING_RPAREN = range(5)
+ERROR_MESSAGES = (None, "语法错误：期望 '(' 或 'num'", "语法错误：期望运算符或 ')'",
+                  "语法错误：多余的右括号", "错误：缺少右括号")
+
+# ok 为是否通过，error_pos 为出错单词在表达式中的位置（通过时为 -1），error_code 为错误编码
+Prevalidation = namedtuple('Prevalidation', ['ok', 'error_pos', 'error_code'])
+
+# 分析器对 str 用 Unicode 规则匹配空白，ASCII 中的 \x1c-\x1f 也是空白（对字节串则不是）
+_STR_SPACES = str.maketrans('\x1c\x1d\x1e\x1f', '    ')
+
+
+class PrevalidatedResult(ParseResult):
+    """
+    被预检查拒绝的表达式的结果，字段与 ParseResult 相同：error 为预检查的错误信息，
+    productions 总是空元组。由分析器给出的结果没有 error_source 属性
+    """
+    __slots__ = ()
+    error_source = 'prevalidate'
+
+
+if np is not None:
+    CHAR_CLASS = np.full(256, CHAR_OTHER, dtype=np.uint8)
+    CHAR_CLASS[list(b' \t\n\r\f\v')] = CHAR_SPACE
+    CHAR_CLASS[list(b'0123456789')] = CHAR_DIGIT
+    CHAR_CLASS[list(b'+-*/')] = CHAR_OPERATOR
+    CHAR_CLASS[ord('(')] = CHAR_LPAREN
+    CHAR_CLASS[ord(')')] = CHAR_RPAREN
+else:
+    CHAR_CLASS = None
+
+
+def pack(expressions):
+    """
+    把一批表达式（str 或字节串）拼成一个字节缓冲区
+    返回 (缓冲区 uint8 数组, 偏移数组 offsets, 需要跳过的表达式下标列表)，
+    第 i 个表达式为 buffer[offsets[i]:offsets[i + 1]]；跳过的表达式在缓冲区中为空
+    """
+    expressions = list(expressions)
+    skipped = []
+    if all(isinstance(e, str) for e in expressions):
+        joined = ''.join(expressions)
+        if joined.isascii():
+            data = joined.translate(_STR_SPACES).encode('ascii')
+            lengths = [len(e) for e in expressions]
+        else:
+            parts = []
+            for i, e in enumerate(expressions):
+                if e.isascii():
+                    parts.append(e.translate(_STR_SPACES).encode('ascii'))
+                else:
+                    skipped.append(i)
+                    parts.append(b'')
+            data = b''.join(parts)
+            lengths = [len(p) for p in parts]
+    else:
+        parts = []
+        for i, e in enumerate(expressions):
+            if isinstance(e, str):
+                if not e.isascii():
+                    skipped.append(i)
+                    e = ''
+                e = e.translate(_STR_SPACES).encode('ascii')
+            parts.append(e)
+        data = b''.join(parts)
+        lengths = [len(p) for p in parts]
+    offsets = np.zeros(len(expressions) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return np.frombuffer(data, dtype=np.uint8), offsets, skipped
+
+
+def prevalidate(expressions):
+    """预检查一批表达式，返回 Prevalidation（各字段为长度与输入相同的数组）"""
+    if np is None:
+        raise RuntimeError("prevalidate 需要安装 NumPy")
+    buffer, offsets, skipped = pack(expressions)
+    n = len(offsets) - 1
+    lengths = np.diff(offsets)
+    error_pos = np.full(n, -1, dtype=np.int64)
+    error_code = np.zeros(n, dtype=np.uint8)
+
+    # 单词的开头：非空白，且不是紧接在同一表达式中另一个数字之后的数字
+    classes = CHAR_CLASS[buffer]
+    is_digit = classes == CHAR_DIGIT
+    continues = np.zeros(len(buffer), dtype=bool)
+    continues[1:] = is_digit[1:] & is_digit[:-1]
+    continues[offsets[1:-1][offsets[1:-1] < len(buffer)]] = False
+    token_pos = np.flatnonzero((classes != CHAR_SPACE) & ~continues)
+    token_class = classes[token_pos]
+    token_expr = np.searchsorted(offsets, token_pos, side='right') - 1
+
+    is_operand = (token_class == CHAR_DIGIT) | (token_class == CHAR_RPAREN)  # 可以作为运算数的结尾
+    starts_operand = (token_class == CHAR_DIGIT) | (token_class == CHAR_LPAREN)
+    follows_operand = (token_class == CHAR_OPERATOR) | (token_class == CHAR_RPAREN)
+    first = np.ones(len(token_pos), dtype=bool)
+    first[1:] = token_expr[1:] != token_expr[:-1]
+
+    # 错开一位比较：前一个单词是运算数时期望运算符或右括号，否则期望运算数
+    expect_operator = np.zeros(len(token_pos), dtype=bool)
+    expect_operator[1:] = is_operand[:-1]
+    expect_operator[first] = False
+    bad_pair = np.where(expect_operator, ~follows_operand, ~starts_operand)
+
+    # 括号深度：整批的累加和减去本表达式开头之前的累加和
+    delta = (token_class == CHAR_LPAREN).astype(np.int64) - (token_class == CHAR_RPAREN)
+    running = np.cumsum(delta)
+    first_index = np.maximum.accumulate(np.where(first, np.arange(len(token_pos)), 0))
+    depth = running - (running - delta)[first_index]
+
+    violation = bad_pair | (depth < 0)
+    codes = np.where(bad_pair, np.where(expect_operator, ERROR_EXPECT_OPERATOR, ERROR_EXPECT_OPERAND),
+                     ERROR_EXTRA_RPAREN).astype(np.uint8)
+
+    # 结尾：最后一个单词必须是运算数，括号深度必须为 0；没有单词的表达式期望运算数
+    error_pos[:] = lengths
+    error_code[:] = ERROR_EXPECT_OPERAND
+    is_last = np.ones(len(token_pos), dtype=bool)
+    is_last[:-1] = first[1:]
+    last = np.flatnonzero(is_last)
+    last_expr = token_expr[last]
+    error_code[last_expr] = np.where(~is_operand[last], ERROR_EXPECT_OPERAND,
+                                     np.where(depth[last] != 0, ERROR_MISSING_RPAREN, ERROR_NONE))
+
+    # 单词处的违例在结尾之前，每个表达式取第一处
+    bad = np.flatnonzero(violation)
+    bad_expr, first_bad = np.unique(token_expr[bad], return_index=True)
+    bad = bad[first_bad]
+    error_pos[bad_expr] = token_pos[bad] - offsets[bad_expr]
+    error_code[bad_expr] = codes[bad]
+
+    error_code[skipped] = ERROR_NONE
+    ok = error_code == ERROR_NONE
+    error_pos[ok] = -1
+    return Prevalidation(ok, error_pos, error_code)
+
+
+def parse_many(expressions, parser='lr', workers=None, chunksize=DEFAULT_CHUNKSIZE, cache_dir=None):
+    """
+    与 batch.parse_many 相同，但先预检查，只有通过的表达式才交给分析器；
+    被拒绝的表达式的结果为 PrevalidatedResult（错误信息来自预检查，productions 为空元组），
+    需要分析器给出的错误信息和部分产生式序列时请对这些表达式再调用 batch.parse_many
+    """
+    expressions = list(expressions)
+    if np is None:
+        return parse_many_unchecked(expressions, parser, workers, chunksize, cache_dir)
+    check = prevalidate(expressions)
+    results = [None] * len(expressions)
+    for i in np.flatnonzero(~check.ok).tolist():
+        results[i] = PrevalidatedResult(False, int(check.error_pos[i]), ERROR_MESSAGES[check.error_code[i]], ())
+    survivors = np.flatnonzero(check.ok).tolist()
+    parsed = iter_parse_many((expressions[i] for i in survivors), parser, workers, chunksize, cache_dir)
+    for i, result in zip(survivors, parsed):
+        results[i] = result
+    return results
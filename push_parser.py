@@ -0,0 +1,131 @@
+"""
+推式（增量）LR分析
+
+输入分块到达时逐块调用 feed()，全部送完后调用 finish()。分析器只保存LR状态栈和
+跨块边界尚未结束的数字的起始位置，不保存已经读过的输入，内存占用与输入长度无关
+（只与括号嵌套深度有关）。一旦出错 feed() 立即返回 False，调用方可以不再读取后续输入。
+"""
+from array import array
+
+from dense_table import ACCEPT
+from scanner import END, GROUP_KINDS, KIND_NAMES, NUM, UNKNOWN, token_pattern
+
+
+class LRPushParser:
+    def __init__(self, parser, record=False, on_reduce=None):
+        """
+        parser 为已构造分析表的 LRParser；record 为 True 时在 production_ids 中保存规约序列，
+        on_reduce 为每次规约时调用的回调函数，参数为产生式编号
+        """
+        if parser.table is None:
+            raise RuntimeError("请先调用 construct_table() 构造LR分析表")
+        if parser.lexer is not None:
+            raise ValueError("推式分析器只支持内置的表达式文法")
+        self.table = parser.table
+        self.grammar = parser.grammar
+        self.stack = [0]
+        self.production_ids = array('H') if record else None
+        self.on_reduce = on_reduce
+        self.reductions = 0
+        self.accepted = False
+        self.error = None
+        self.error_pos = None
+        self._offset = 0           # 下一块第一个字符在整个输入中的位置
+        self._number_start = None  # 上一块末尾尚未结束的数字的起始位置
+        self._finished = False
+
+    def feed(self, chunk, start=0, end=None):
+        """
+        送入一块输入（str 或字节串），返回到目前为止是否仍未出错
+        只送入 chunk[start:end] 时不必切片复制，可以直接在 mmap 等大缓冲区上分段送入
+        """
+        if self._finished:
+            raise RuntimeError("分析已经结束，不能再送入输入")
+        if self.error is not None:
+            return False
+
+        pattern = token_pattern(chunk)
+        end_of_chunk = len(chunk) if end is None else end
+        # 匹配位置是相对于 chunk 开头的，offset 把它换算成在整个输入中的位置
+        offset = self._offset - start
+        self._offset += end_of_chunk - start
+        push = self._push
+        number_start = self._number_start
+
+        # 上一块以数字结尾，而这一块不以数字开头，说明那个数字已经结束
+        if number_start is not None and start < end_of_chunk:
+            first = pattern.match(chunk, start, end_of_chunk)
+            if first is None or GROUP_KINDS[first.lastindex] != NUM:
+                number_start = None
+                if not push(NUM, self._number_start):
+                    return False
+
+        for m in pattern.finditer(chunk, start, end_of_chunk):
+            kind = GROUP_KINDS[m.lastindex]
+            start, end = m.span()
+            if number_start is not None:
+                # 这是上一块末尾数字的后续部分
+                if end == end_of_chunk:
+                    continue
+                pos, number_start = number_start, None
+                if not push(NUM, pos):
+                    break
+                continue
+            if kind == NUM and end == end_of_chunk:
+                # 数字可能在下一块中继续，暂不送入分析器
+                number_start = offset + start
+                continue
+            if not push(kind, offset + start, m if kind == UNKNOWN else None):
+                break
+
+        self._number_start = number_start
+        return self.error is None
+
+    def finish(self):
+        """输入结束，返回分析是否成功"""
+        if not self._finished:
+            self._finished = True
+            if self.error is None and self._number_start is not None:
+                self._push(NUM, self._number_start)
+            if self.error is None:
+                self._push(END, self._offset)
+        return self.accepted
+
+    def _push(self, kind, pos, match=None):
+        """
+        把一个单词送入LR自动机，执行其引起的全部规约，出错时返回 False
+        match 仅对无法识别的字符给出，用于错误信息
+        """
+        table = self.table
+        action = table.action
+        n_terminals = table.n_terminals
+        stack = self.stack
+        while True:
+            state = stack[-1]
+            code = action[state * n_terminals + kind]
+            if code > 0:
+                stack.append(code - 1)
+                return True
+            if code < ACCEPT:
+                prod_idx = ~code
+                length = table.prod_len[prod_idx]
+                if length:
+                    del stack[-length:]
+                stack.append(table.goto[stack[-1] * len(table.non_terminals) + table.prod_lhs[prod_idx]])
+                self.reductions += 1
+                if self.production_ids is not None:
+                    self.production_ids.append(prod_idx)
+                if self.on_reduce is not None:
+                    self.on_reduce(prod_idx)
+                continue
+            if code == ACCEPT:
+                self.accepted = True
+                return True
+            if match is not None:
+                name = match.group()
+                name = name if isinstance(name, str) else name.decode('ascii', 'replace')
+            else:
+                name = KIND_NAMES[kind]
+            self.error = f"语法错误: 状态 {state} 没有对 {name} 的动作定义"
+            self.error_pos = pos
+            return False
@@ -1,111 +1,253 @@
+from array import array
+from collections import Counter
+from itertools import accumulate
+
+from derivation import REVERSE_RIGHTMOST, Derivation, ReductionRecorder
+from parse_stats import ParseRecord, clock
+from scanner import DIV, END, LPAREN, MINUS, MUL, NUM, PLUS, RPAREN, scan
+from step_trace import TRACE_PRINT, check_trace_mode
+
+# 递归下降分析使用的产生式，下标即产生式编号
+PRODUCTIONS = ("E -> T", "E -> E+T", "E -> E-T", "T -> F", "T -> T*F", "T -> T/F", "F -> (E)", "F -> num")
+P_E_T, P_E_ADD, P_E_SUB, P_T_F, P_T_MUL, P_T_DIV, P_F_PAREN, P_F_NUM = range(len(PRODUCTIONS))
+
+# 产生式的左部和右部，供语义动作使用
+RULES = (('E', ['T']), ('E', ['E', '+', 'T']), ('E', ['E', '-', 'T']),
+         ('T', ['F']), ('T', ['T', '*', 'F']), ('T', ['T', '/', 'F']),
+         ('F', ['(', 'E', ')']), ('F', ['num']))
+
+# 分析引擎中要进入的过程
+_CALL_E, _CALL_T, _CALL_F = range(3)
+
+
+def run_rd(tokens, returns, productions, actions=None, values=None, i=0, call=_CALL_E):
+    """
+    从单词下标 i 处进入过程 call 分析，与递归实现的 E/T/F 过程使用完全相同的产生式序列，
+    不使用任何共享的可变状态，可以在多个线程中同时调用。
+    returns 为返回栈（调用时为空），记录每个调用者在被调过程返回后应当继续执行的位置，
+    位置编码就是返回后要规约的产生式编号（供语义动作使用）；
+    任何过程失败时所有调用者都直接返回失败，所以失败时不必逐层展开返回栈。
+    values 为语义动作 actions 使用的语义值栈。返回 (是否成功, 结束时的单词下标, 错误信息)
+    """
+    kinds = tokens.kinds
+    starts = tokens.starts
+    ends = tokens.ends
+    kind = kinds[i]
+    error = None
+    ok = True
+    
+    while True:
+        # 进入过程 call
+        if call == _CALL_E:
+            productions.append(P_E_T)
+            returns.append(P_E_T)
+            call = _CALL_T
+            continue
+        if call == _CALL_T:
+            productions.append(P_T_F)
+            returns.append(P_T_F)
+            call = _CALL_F
+            continue
+        if call == _CALL_F:
+            if kind == LPAREN:
+                productions.append(P_F_PAREN)
+                if values is not None:
+                    values.append(actions.shift(kind, starts[i], ends[i]))
+                i += 1
+                kind = kinds[i]
+                returns.append(P_F_PAREN)
+                call = _CALL_E
+                continue
+            if kind == NUM:
+                productions.append(P_F_NUM)
+                if values is not None:
+                    values.append(actions.reduce(P_F_NUM, [actions.shift(kind, starts[i], ends[i])]))
+                i += 1
+                kind = kinds[i]
+            else:
+                error = "语法错误：期望 '(' 或 'num'"
+                ok = False
+                break
+        
+        # 当前过程成功返回，回到调用者的继续位置
+        call = None
+        if not returns:
+            break
+        ret = returns.pop()
+        if ret == P_F_PAREN:
+            if kind != RPAREN:
+                error = "错误：缺少右括号"
+                ok = False
+                break
+            if values is not None:
+                values.append(actions.shift(kind, starts[i], ends[i]))
+                _reduce(actions, values, P_F_PAREN, 3)
+            i += 1
+            kind = kinds[i]
+            continue
+        
+        # 被调用的 T 或 F 已经完成，先按 E -> T、E -> E+T 等规约
+        if values is not None:
+            _reduce(actions, values, ret, 1 if ret == P_E_T or ret == P_T_F else 3)
+        if ret <= P_E_SUB:
+            if kind == PLUS or kind == MINUS:
+                ret = P_E_ADD if kind == PLUS else P_E_SUB
+                call = _CALL_T
+        elif kind == MUL or kind == DIV:
+            ret = P_T_MUL if kind == MUL else P_T_DIV
+            call = _CALL_F
+        if call is not None:
+            productions.append(ret)
+            if values is not None:
+                values.append(actions.shift(kind, starts[i], ends[i]))
+            i += 1
+            kind = kinds[i]
+            returns.append(ret)
+    
+    return ok, i, error
+
+
+def _reduce(actions, values, prod_idx, length):
+    rhs_values = values[len(values) - length:]
+    del values[len(values) - length:]
+    values.append(actions.reduce(prod_idx, rhs_values))
+
+
 class RecursiveDescentParser:
-    def __init__(self, expr):
+    def __init__(self, expr, stats=None):
+        # stats 为 ParseStats 对象时分析结束后记录统计信息（见 parse_stats 模块）
         self.expr = expr
-        self.pos = 0
+        self.stats = stats
+        if stats is not None:
+            started = clock()
+        self.tokens = scan(expr)
+        self._tokenize_seconds = clock() - started if stats is not None else 0.0
+        self.pos = 0  # 下一个单词在单词序列中的下标
         self.current_token = None
-        self.productions = []
+        self.production_ids = array('H')
+        self.error = None
+        self.error_pos = None  # 出错单词在源串中的位置
+        self.semantic_value = None
+        self._actions = None
+        self._values = None
     
     def get_next_token(self):
-        if self.pos >= len(self.expr):
+        # 单词序列由共用的词法分析器一次性产生，这里只移动下标
+        if self.tokens.kinds[self.pos] == END:
             return None
-        
-        # 跳过空白字符
-        while self.pos < len(self.expr) and self.expr[self.pos].isspace():
-            self.pos += 1
-            
-        if self.pos >= len(self.expr):
-            return None
-            
-        # 检查数字
-        if self.expr[self.pos].isdigit():
-            start = self.pos
-            while self.pos < len(self.expr) and self.expr[self.pos].isdigit():
-                self.pos += 1
-            return ('num', self.expr[start:self.pos])
-            
-        # 检查其他符号
-        c = self.expr[self.pos]
+        token = (self.tokens.name(self.pos), self.tokens.text(self.pos))
         self.pos += 1
-        return (c, c)
+        return token
     
-    def parse(self):
+    def parse(self, trace=TRACE_PRINT, actions=None):
+        # 递归下降分析没有分析过程表，trace 只决定是否打印结果；
+        # actions 为语义动作（接口见 expr_tree 模块），调用顺序与LR分析相同，结果保存在 semantic_value 中
+        trace = check_trace_mode(trace)
+        stats = self.stats
+        if stats is not None:
+            started = clock()
+        self.error = None
+        self.error_pos = None
+        self.semantic_value = None
+        self._actions = actions
+        self._values = None
+        if actions is not None:
+            actions.bind(RULES)
+            self._values = []
         self.current_token = self.get_next_token()
         result = self.parse_E()
+        if result and self._values:
+            self.semantic_value = self._values[-1]
+        accepted = self.current_token is None and result
+        
+        if not accepted:
+            if result and self.error is None:
+                self.error = "语法错误: 输入未完全处理"
+            # 当前单词之后的下标为 self.pos，到达输入末尾时 get_next_token 不再前进
+            current = self.pos - 1 if self.current_token is not None else self.pos
+            self.error_pos = self.tokens.starts[current]
+        
+        if stats is not None:
+            self.record_stats(stats, clock() - started)
         
-        if self.current_token is None and result:
-            print("分析成功!")
-            print("使用的产生式序列:")
-            for prod in self.productions:
-                print(prod)
+        if accepted:
+            if trace == TRACE_PRINT:
+                print("分析成功!")
+                print("使用的产生式序列:")
+                for prod in self.productions:
+                    print(prod)
             return True
         else:
-            print("语法错误!")
+            if trace == TRACE_PRINT:
+                if self.error is not None:
+                    print(self.error)
+                print("语法错误!")
             return False
     
+    def record_stats(self, stats, parse_seconds):
+        """
+        由最近一次分析的结果计算统计信息并记录到 stats。递归下降分析不查表；
+        返回栈在最外层有 E、T 两个调用者，每层括号再加 F、E、T 三个，
+        因此最大深度由读过的单词中括号的最大嵌套层数得到
+        """
+        kinds = self.tokens.kinds
+        consumed = self.pos - 1 if self.current_token is not None else self.pos
+        nesting = [0] * (END + 2)
+        nesting[LPAREN] = 1
+        nesting[RPAREN] = -1
+        depth = max(accumulate(map(nesting.__getitem__, kinds[:consumed]), initial=0))
+        stats.record(ParseRecord('rd', self.error is None, len(kinds) - 1, consumed, len(self.production_ids),
+                                 Counter(self.production_ids), 0, 2 + 3 * depth,
+                                 self._tokenize_seconds, parse_seconds))
+    
+    @property
+    def productions(self):
+        """按使用顺序给出产生式字符串"""
+        return [PRODUCTIONS[i] for i in self.production_ids]
+    
+    def derivation(self):
+        """
+        本表达式的推导（见 derivation 模块）。production_ids 中左递归产生式在左运算数之后才记录，
+        不是规范推导的顺序，因此用新的分析器重新分析一次，由语义动作得到规约序列
+        """
+        recorder = ReductionRecorder()
+        RecursiveDescentParser(self.expr).parse(trace='off', actions=recorder)
+        return Derivation(RULES, recorder.production_ids, REVERSE_RIGHTMOST)
+    
     def match(self, expected_token):
         if self.current_token and self.current_token[0] == expected_token:
             self.current_token = self.get_next_token()
             return True
         return False
     
+    # 以下三个分析过程共用一个显式栈实现的分析引擎 _run，
+    # 嵌套深度不受 Python 递归深度限制，每层嵌套只在返回栈中占一个字节
+    
     def parse_E(self):
         # E -> T E'
         # 其中 E' -> +T E' | -T E' | ε
-        self.productions.append("E -> T")
-        if not self.parse_T():
-            return False
-            
-        while self.current_token and self.current_token[0] in ['+', '-']:
-            op = self.current_token[0]
-            self.match(op)
-            
-            if op == '+':
-                self.productions.append("E -> E+T")
-            else:
-                self.productions.append("E -> E-T")
-                
-            if not self.parse_T():
-                return False
-                
-        return True
+        return self._run(_CALL_E)
     
     def parse_T(self):
         # T -> F T'
         # 其中 T' -> *F T' | /F T' | ε
-        self.productions.append("T -> F")
-        if not self.parse_F():
-            return False
-            
-        while self.current_token and self.current_token[0] in ['*', '/']:
-            op = self.current_token[0]
-            self.match(op)
-            
-            if op == '*':
-                self.productions.append("T -> T*F")
-            else:
-                self.productions.append("T -> T/F")
-                
-            if not self.parse_F():
-                return False
-                
-        return True
+        return self._run(_CALL_T)
     
     def parse_F(self):
         # F -> (E) | num
-        if self.current_token:
-            if self.current_token[0] == '(':
-                self.match('(')
-                self.productions.append("F -> (E)")
-                if not self.parse_E():
-                    return False
-                if not self.match(')'):
-                    print("错误：缺少右括号")
-                    return False
-                return True
-            elif self.current_token[0] == 'num':
-                self.match('num')
-                self.productions.append("F -> num")
-                return True
-        
-        print("语法错误：期望 '(' 或 'num'")
-        return False
+        return self._run(_CALL_F)
+    
+    def _run(self, call):
+        """从当前单词进入过程 call 分析（见 run_rd），返回是否成功"""
+        i = self.pos - 1 if self.current_token is not None else self.pos  # 当前单词下标
+        ok, i, error = run_rd(self.tokens, bytearray(), self.production_ids, self._actions, self._values, i, call)
+        if error is not None:
+            self.error = error
+        # 同步当前单词，使 parse 和 match 看到的状态与逐个读取单词时一致
+        if self.tokens.kinds[i] == END:
+            self.pos = i
+            self.current_token = None
+        else:
+            self.pos = i + 1
+            self.current_token = (self.tokens.name(i), self.tokens.text(i))
+        return ok
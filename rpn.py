@@ -0,0 +1,221 @@
+"""
+把表达式编译成逆波兰（后缀）指令序列并求值
+
+LR分析的规约顺序正好是后缀顺序：移进数字时压入常数，用 A -> A op B 规约时执行运算。
+RPNCompiler 实现分析器的语义动作接口（见 expr_tree 模块），在分析过程中直接生成指令，
+三种分析器都可以使用。编译结果 RPNProgram 只有两个紧凑数组：
+    ops     array('B')，每条指令一个字节，操作码与 expr_tree 的 OP_* 相同，OP_NUM 表示压入常数
+    consts  array('d')，按出现顺序存放 OP_NUM 指令压入的常数
+
+evaluate() 逐条解释执行一个程序；evaluate_batch() 用 NumPy 把一批程序排成矩阵，
+按列同时执行所有程序的第 k 条指令，Python 层的循环次数只与最长程序的长度有关，
+与程序个数无关。没有安装 NumPy 时 evaluate_batch() 退化为逐个调用 evaluate()。
+运算按 IEEE 754 双精度浮点数进行，除以零得到 inf 或 nan，与 NumPy 的结果一致。
+"""
+import math
+from array import array
+
+from expr_tree import OP_ADD, OP_MUL, OP_NUM, OP_SUB, OP_SYMBOLS, PLAN_BINARY, plan_productions
+from scanner import NUM
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 是可选依赖
+    np = None
+
+
+class RPNProgram:
+    __slots__ = ('ops', 'consts', 'max_depth')
+
+    def __init__(self):
+        self.ops = array('B')
+        self.consts = array('d')
+        self.max_depth = 0  # 执行时操作数栈的最大深度
+
+    def __len__(self):
+        return len(self.ops)
+
+    def format(self):
+        """转换为可读的指令文本，如 "2 3 4 * +" """
+        consts = iter(self.consts)
+        return ' '.join(_format_const(next(consts)) if op == OP_NUM else OP_SYMBOLS[op] for op in self.ops)
+
+
+def _format_const(value):
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class RPNCompiler:
+    """在分析过程中生成逆波兰指令的语义动作，分析成功后程序保存在 program 中"""
+
+    def __init__(self, source):
+        self.source = source
+        self.program = RPNProgram()
+        self.plans = ()
+        self._depth = 0
+
+    def bind(self, productions):
+        self.plans = plan_productions(productions)
+
+    def shift(self, kind, start, end):
+        if kind == NUM:
+            program = self.program
+            program.ops.append(OP_NUM)
+            program.consts.append(float(self.source[start:end]))
+            self._depth += 1
+            if self._depth > program.max_depth:
+                program.max_depth = self._depth
+        return None
+
+    def reduce(self, prod_idx, values):
+        plan, op = self.plans[prod_idx]
+        if plan == PLAN_BINARY:
+            self.program.ops.append(op)
+            self._depth -= 1
+        return None
+
+
+def compile_tree(tree, i=None):
+    """把 ExprTree（或其子树）编译为逆波兰程序"""
+    program = RPNProgram()
+    depth = 0
+    work = [(tree.root if i is None else i, False)]
+    while work:
+        node, expanded = work.pop()
+        op = tree.op[node]
+        if op == OP_NUM:
+            program.ops.append(OP_NUM)
+            program.consts.append(float(tree.text(node)))
+            depth += 1
+            program.max_depth = max(program.max_depth, depth)
+        elif expanded:
+            program.ops.append(op)
+            depth -= 1
+        else:
+            work.append((node, True))
+            work.append((tree.right[node], False))
+            work.append((tree.left[node], False))
+    return program
+
+
+def compile_expression(parser, expr):
+    """
+    用已构造分析表的 LRParser 或 LL1Parser 分析并编译一个表达式，语法错误时返回 None
+    """
+    compiler = RPNCompiler(expr)
+    if not parser.parse(expr, trace='off', actions=compiler):
+        return None
+    return compiler.program
+
+
+def _divide(a, b):
+    """IEEE 754 除法：除以零得到带符号的无穷大或 nan，而不是抛出异常"""
+    if b == 0.0:
+        if a == 0.0 or math.isnan(a):
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+    return a / b
+
+
+def evaluate(program):
+    """逐条解释执行一个逆波兰程序，返回浮点数结果"""
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    consts = iter(program.consts)
+    for op in program.ops:
+        if op == OP_NUM:
+            push(next(consts))
+            continue
+        b = pop()
+        a = stack[-1]
+        if op == OP_ADD:
+            stack[-1] = a + b
+        elif op == OP_SUB:
+            stack[-1] = a - b
+        elif op == OP_MUL:
+            stack[-1] = a * b
+        else:
+            stack[-1] = _divide(a, b)
+    return stack[0]
+
+
+class RPNBatch:
+    """
+    按列打包的一批逆波兰程序（需要 NumPy）
+    打包只做一次，之后可以反复调用 evaluate()，适合同一批公式多次求值的场合
+    """
+
+    def __init__(self, programs):
+        if np is None:
+            raise RuntimeError("RPNBatch 需要安装 NumPy")
+        programs = list(programs)
+        self.size = n = len(programs)
+        lengths = np.fromiter((len(p.ops) for p in programs), dtype=np.int64, count=n)
+        width = int(lengths.max()) if n else 0
+        depth = max((p.max_depth for p in programs), default=0)
+
+        # 按程序长度从长到短排列，执行第 k 条指令时只有前 active[k] 行还有指令，直接切片而不必用掩码
+        self.order = order = np.argsort(-lengths, kind='stable')
+        self.active = np.searchsorted(-lengths[order], -np.arange(width), side='left')
+
+        # 列式存放：ops[r, k] 为第 r 个程序的第 k 条指令，consts[r, k] 为该指令压入的常数。
+        # 先把所有程序首尾相接，再一次性按 (行, 列) 下标散布到矩阵中
+        flat_ops = np.frombuffer(b''.join([p.ops for p in programs]), dtype=np.uint8)
+        flat_consts = np.frombuffer(b''.join([p.consts for p in programs]), dtype=np.float64)
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n)
+        rows = np.repeat(rank, lengths)
+        cols = np.arange(len(flat_ops)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        self.ops = np.zeros((n, width), dtype=np.uint8)
+        self.ops[rows, cols] = flat_ops
+        self.consts = np.zeros((n, width))
+        is_const = flat_ops == OP_NUM
+        self.consts[rows[is_const], cols[is_const]] = flat_consts
+        self.depth = depth
+
+    def __len__(self):
+        return self.size
+
+    def evaluate(self):
+        """执行全部程序，按打包时的顺序返回 float64 数组"""
+        n = self.size
+        ops, consts, active = self.ops, self.consts, self.active
+        stack = np.zeros((n, max(self.depth, 1)))
+        sp = np.zeros(n, dtype=np.int64)  # 各程序的栈顶指针（下一个空位）
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            for k in range(ops.shape[1]):
+                m = active[k]
+                column = ops[:m, k]
+                is_push = column == OP_NUM
+                rows = np.flatnonzero(is_push)
+                if rows.size:
+                    stack[rows, sp[rows]] = consts[rows, k]
+                    sp[rows] += 1
+                rows = np.flatnonzero(~is_push)
+                if rows.size:
+                    top = sp[rows] - 1
+                    b = stack[rows, top]
+                    a = stack[rows, top - 1]
+                    op = column[rows]
+                    result = np.where(op == OP_ADD, a + b,
+                                      np.where(op == OP_SUB, a - b,
+                                               np.where(op == OP_MUL, a * b, a / b)))
+                    stack[rows, top - 1] = result
+                    sp[rows] = top
+
+        results = np.empty(n)
+        results[self.order] = stack[:, 0]
+        return results
+
+
+def evaluate_batch(programs):
+    """
+    同时执行一批逆波兰程序（RPNProgram 的序列或已打包的 RPNBatch），按输入顺序返回结果
+    有 NumPy 时返回 float64 数组，否则返回 float 列表
+    """
+    if isinstance(programs, RPNBatch):
+        return programs.evaluate()
+    if np is None:
+        return [evaluate(p) for p in programs]
+    return RPNBatch(programs).evaluate()
@@ -0,0 +1,155 @@
+"""
+三种分析器共用的词法分析器
+
+scan() 用一个预编译的正则表达式扫描整个输入，结果保存在 TokenStream 的三个平行数组中：
+单词种别码 kinds 以及单词在源串中的起止位置 starts/ends，不再为每个单词创建
+('num', '123') 元组和子串。输入可以是 str，也可以是 bytes/bytearray/mmap 等字节串。
+
+由文法文件定义的语言（见 grammar_loader 模块）使用 Lexer，单词的表示方式与 scan() 相同，
+只是种别码和终结符名由单词定义决定。
+"""
+import re
+from array import array
+
+# 单词种别码
+NUM = 0
+PLUS = 1
+MINUS = 2
+MUL = 3
+DIV = 4
+LPAREN = 5
+RPAREN = 6
+END = 7       # 输入结束符 $
+UNKNOWN = 8   # 无法识别的字符，交给分析器报错，而不是悄悄丢弃
+
+# 种别码对应的文法终结符
+KIND_NAMES = ('num', '+', '-', '*', '/', '(', ')', '$', '?')
+
+# 空白字符不会被任何分组匹配，finditer 自动跳过；GROUP_KINDS[k] 为第 k 个分组的种别码
+_PATTERN = r'(\d+)|(\+)|(-)|(\*)|(/)|(\()|(\))|(\S)'
+GROUP_KINDS = (None, NUM, PLUS, MINUS, MUL, DIV, LPAREN, RPAREN, UNKNOWN)
+_TOKEN_RE = re.compile(_PATTERN)
+_TOKEN_RE_BYTES = re.compile(_PATTERN.encode('ascii'))
+
+
+def token_pattern(source):
+    """返回适用于 source 类型（str 或字节串）的单词正则"""
+    return _TOKEN_RE if isinstance(source, str) else _TOKEN_RE_BYTES
+
+
+class TokenStream:
+    """
+    单词序列，末尾总有一个输入结束符单词
+    kind_names 为种别码对应的终结符名，倒数第二个是 $，最后一个表示无法识别的字符
+    """
+    __slots__ = ('source', 'kinds', 'starts', 'ends', 'kind_names')
+
+    def __init__(self, source, kinds, starts, ends, kind_names=KIND_NAMES):
+        self.source = source
+        self.kinds = kinds
+        self.starts = starts
+        self.ends = ends
+        self.kind_names = kind_names
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def text(self, i):
+        """第 i 个单词在源串中的文本"""
+        text = self.source[self.starts[i]:self.ends[i]]
+        return text if isinstance(text, str) else bytes(text).decode('ascii', 'replace')
+
+    def name(self, i):
+        """第 i 个单词对应的终结符，无法识别的字符返回其本身"""
+        kind = self.kinds[i]
+        kind_names = self.kind_names
+        if kind == len(kind_names) - 1:
+            return self.text(i)
+        if kind == len(kind_names) - 2:
+            return '$'
+        return kind_names[kind]
+
+    def names(self, start=0):
+        return [self.name(i) for i in range(start, len(self.kinds))]
+
+    def pairs(self):
+        """旧接口的 (类型, 值) 列表，仅用于调试和展示"""
+        end = len(self.kind_names) - 2
+        return [(self.name(i), self.text(i) if self.kinds[i] != end else '$')
+                for i in range(len(self.kinds))]
+
+
+def scan(source):
+    """对整个输入做词法分析，返回 TokenStream"""
+    offset_type = 'I' if len(source) < 2 ** 32 else 'Q'
+    kinds = array('B')
+    starts = array(offset_type)
+    ends = array(offset_type)
+    add_kind = kinds.append
+    add_start = starts.append
+    add_end = ends.append
+    group_kinds = GROUP_KINDS
+
+    for m in token_pattern(source).finditer(source):
+        start, end = m.span()
+        add_kind(group_kinds[m.lastindex])
+        add_start(start)
+        add_end(end)
+
+    add_kind(END)
+    add_start(len(source))
+    add_end(len(source))
+    return TokenStream(source, kinds, starts, ends)
+
+
+class Lexer:
+    """
+    由单词定义构造的词法分析器，scan() 的结果与模块级的 scan() 形式相同
+    pattern 为所有单词的正则（str），第 k 个分组匹配时单词种别码为 group_kinds[k]，
+    不属于任何单词的匹配（空白、注释等）group_kinds 中为 None，扫描时跳过；
+    kind_names 为种别码对应的终结符名，最后两个必须是 '$' 和 '?'（输入结束符和无法识别的字符）
+    """
+
+    def __init__(self, pattern, group_kinds, kind_names):
+        if tuple(kind_names[-2:]) != ('$', '?'):
+            raise ValueError("kind_names 的最后两个必须是 '$' 和 '?'")
+        if len(kind_names) > 256:
+            raise ValueError("单词种类不能超过 254 种")
+        self.pattern = pattern
+        self.group_kinds = tuple(group_kinds)
+        self.kind_names = tuple(kind_names)
+        self.end = len(kind_names) - 2
+        self.unknown = len(kind_names) - 1
+        self._re = re.compile(pattern)
+        self._re_bytes = None  # 扫描字节串时才编译
+
+    def token_pattern(self, source):
+        if isinstance(source, str):
+            return self._re
+        if self._re_bytes is None:
+            self._re_bytes = re.compile(self.pattern.encode('utf-8'))
+        return self._re_bytes
+
+    def scan(self, source):
+        """对整个输入做词法分析，返回 TokenStream"""
+        offset_type = 'I' if len(source) < 2 ** 32 else 'Q'
+        kinds = array('B')
+        starts = array(offset_type)
+        ends = array(offset_type)
+        add_kind = kinds.append
+        add_start = starts.append
+        add_end = ends.append
+        group_kinds = self.group_kinds
+
+        for m in self.token_pattern(source).finditer(source):
+            kind = group_kinds[m.lastindex or 0]
+            if kind is not None:
+                start, end = m.span()
+                add_kind(kind)
+                add_start(start)
+                add_end(end)
+
+        add_kind(self.end)
+        add_start(len(source))
+        add_end(len(source))
+        return TokenStream(source, kinds, starts, ends, self.kind_names)
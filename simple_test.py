@@ -52,6 +52,9 @@ def run_simple_test():
     print(f"{'表达式':<20} | {'预期结果':<10} | {'递归下降':<10} | {'LL(1)':<10} | {'LR':<10} | {'说明'}")
     print("-" * 90)
     
+    # 保存每个分析器的分析结果，结果分析时直接使用，不再重复分析
+    results = {'rd': [], 'll1': [], 'lr': []}
+    
     for expr, expected, description in test_expressions:
         # 初始化结果
         rd_result = "未测试"
@@ -62,19 +65,22 @@ def run_simple_test():
         if choice in ['1', '4']:
             print(f"\n测试递归下降分析: {expr}")
             parser = RecursiveDescentParser(expr)
-            rd_result = "成功" if parser.parse() else "失败"
+            results['rd'].append(parser.parse())
+            rd_result = "成功" if results['rd'][-1] else "失败"
             print("----------------------------------------")
         
         # 测试LL(1)分析器
         if choice in ['2', '4'] and ll1_parser:
             print(f"\n测试LL(1)分析: {expr}")
-            ll1_result = "成功" if ll1_parser.parse(expr) else "失败"
+            results['ll1'].append(ll1_parser.parse(expr))
+            ll1_result = "成功" if results['ll1'][-1] else "失败"
             print("----------------------------------------")
         
         # 测试LR分析器
         if choice in ['3', '4'] and lr_parser:
             print(f"\n测试LR分析: {expr}")
-            lr_result = "成功" if lr_parser.parse(expr) else "失败"
+            results['lr'].append(lr_parser.parse(expr))
+            lr_result = "成功" if results['lr'][-1] else "失败"
             print("----------------------------------------")
         
         # 打印结果
@@ -89,22 +95,10 @@ def run_simple_test():
     total_valid = sum(1 for _, expected, _ in test_expressions if expected)
     total_invalid = sum(1 for _, expected, _ in test_expressions if not expected)
     
-    for expr, expected, _ in test_expressions:
-        if choice in ['1', '4']:
-            parser = RecursiveDescentParser(expr)
-            result = parser.parse()
-            if (result and expected) or (not result and not expected):
-                success_count['rd'] += 1
-                
-        if choice in ['2', '4'] and ll1_parser:
-            result = ll1_parser.parse(expr)
-            if (result and expected) or (not result and not expected):
-                success_count['ll1'] += 1
-                
-        if choice in ['3', '4'] and lr_parser:
-            result = lr_parser.parse(expr)
-            if (result and expected) or (not result and not expected):
-                success_count['lr'] += 1
+    for name, parser_results in results.items():
+        for result, (_, expected, _) in zip(parser_results, test_expressions):
+            if result == expected:
+                success_count[name] += 1
     
     if choice in ['1', '4']:
         print(f"递归下降分析器: {success_count['rd']}/{len(test_expressions)} 正确 "
@@ -0,0 +1,173 @@
+"""
+按顶层加减号切分，多进程并行分析一个很大的表达式
+
+表达式 E = T0 op1 T1 op2 T2 ... 中，括号深度为 0 的 + 和 - 把输入分成互相独立的若干项 T。
+LRParser 对整个表达式给出的产生式序列是：T0 的产生式、E -> T，然后对每个 i >= 1 依次是
+Ti 的产生式、E -> E op_i T。把若干相邻的项作为一段，第 k 段（k >= 1）在前面加上 "0" 和它之前的
+运算符单独分析，得到的序列是 F -> num、T -> F、E -> T 再接上该段在整体序列中对应的部分，
+去掉前三个产生式后按顺序拼接，就是整体分析的产生式序列。
+
+  1. 切分：在大致等分的位置计算括号深度（str.count 统计此前的左右括号个数，C 实现），
+     再从该位置向后找第一个深度为 0 的 + 或 -；
+  2. 各段在进程池中并行做词法分析和LR分析；
+  3. 拼接产生式序列。某一段出错时，它之前的各段都正确，说明整体分析到这一段开头时的状态与
+     单独分析这一段时相同，因此只需把出错的段连同其后的运算符在当前进程中重新分析一次，
+     得到与整体分析完全相同的出错位置和错误信息。
+
+输入括号不配对时切分位置可能落在括号内，但只要前面各段都分析成功，切分点之前就是一个完整的
+合法表达式，切分点必然在顶层，所以上面的结论对非法输入同样成立。
+产生式序列用 array('H') 保存，ParseResult.productions 即为该数组。
+"""
+import multiprocessing
+import os
+import re
+from array import array
+
+from batch import ParseResult, make_parser
+
+DEFAULT_CHUNKS_PER_WORKER = 4
+
+# 输入短于该长度时不切分，直接在当前进程中分析
+DEFAULT_MIN_SPLIT = 1 << 20
+
+# 单独分析第 k 段（k >= 1）时前面加上的 "0 op" 产生的产生式：F -> num、T -> F、E -> T
+_PREFIX_PRODUCTIONS = 3
+
+_BRACKET_OR_ADD_RE = re.compile(r'[()+\-]')
+_BRACKET_OR_ADD_RE_BYTES = re.compile(rb'[()+\-]')
+
+
+def find_splits(source, n_parts):
+    """
+    返回切分位置（顶层 + 或 - 的下标）的列表，最多 n_parts - 1 个，按位置递增
+    找不到顶层运算符的区间不切分
+    """
+    size = len(source)
+    text = isinstance(source, str)
+    lparen, rparen = ('(', ')') if text else (b'(', b')')
+    pattern = _BRACKET_OR_ADD_RE if text else _BRACKET_OR_ADD_RE_BYTES
+    plus, minus = ('+', '-') if text else (ord('+'), ord('-'))
+    open_bracket = '(' if text else ord('(')
+    splits = []
+    depth = 0
+    counted = 0  # depth 为 source[:counted] 中左括号个数减右括号个数
+    for j in range(1, n_parts):
+        boundary = max(size * j // n_parts, counted)
+        if boundary >= size:
+            break
+        if boundary > counted:
+            depth += source.count(lparen, counted, boundary) - source.count(rparen, counted, boundary)
+            counted = boundary
+        for m in pattern.finditer(source, counted):
+            ch = source[m.start()]
+            if ch == plus or ch == minus:
+                if depth == 0:
+                    splits.append(m.start())
+                    break
+            elif ch == open_bracket:
+                depth += 1
+            else:
+                depth -= 1
+        else:
+            # 之后再没有顶层运算符
+            break
+        counted = splits[-1] + 1  # 运算符本身不改变深度
+    return splits
+
+
+# 工作进程中的分析器，由 _init_worker 设置
+_worker_parser = None
+
+
+def _init_worker(parser):
+    global _worker_parser
+    _worker_parser = parser
+
+
+def _parse_segment(text):
+    parser = _worker_parser
+    accepted = parser.parse(text, trace='off')
+    return accepted, parser.production_ids
+
+
+class SplitParser:
+    """
+    并行分析单个大表达式的LR分析器，进程池在第一次分析时创建并在多次分析之间复用
+    workers 为进程数，None 或 0 表示使用全部CPU核心
+    """
+
+    def __init__(self, workers=None, chunks_per_worker=DEFAULT_CHUNKS_PER_WORKER,
+                 min_split=DEFAULT_MIN_SPLIT, cache_dir=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunks_per_worker = chunks_per_worker
+        self.min_split = min_split
+        self.parser = make_parser('lr', cache_dir)
+        self._pool = None
+        # 最近一次分析切分出的段数，1 表示没有切分
+        self.last_segments = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def parse(self, source):
+        """分析 source（str 或字节串），返回 ParseResult，结果与 LRParser 完全相同"""
+        splits = []
+        if self.workers > 1 and len(source) >= self.min_split:
+            splits = find_splits(source, self.workers * self.chunks_per_worker)
+        self.last_segments = len(splits) + 1
+        if not splits:
+            return self._parse_sequential(source)
+
+        zero = '0' if isinstance(source, str) else b'0'
+        bounds = [0] + splits + [len(source)]
+        # 第 k 段为 source[bounds[k] + 1 : bounds[k + 1]]，其前的运算符在 bounds[k]
+        segments = [source[:splits[0]]]
+        segments.extend(zero + source[bounds[k]:bounds[k + 1]] for k in range(1, len(bounds) - 1))
+
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self.parser,))
+        productions = array('H')
+        for k, (accepted, segment_productions) in enumerate(self._pool.imap(_parse_segment, segments)):
+            if not accepted:
+                return self._segment_error(source, bounds, k, productions)
+            productions.extend(segment_productions[_PREFIX_PRODUCTIONS:] if k else segment_productions)
+        return ParseResult(True, None, None, productions)
+
+    def _parse_sequential(self, source):
+        parser = self.parser
+        accepted = parser.parse(source, trace='off')
+        return ParseResult(accepted, parser.error_pos, parser.error, parser.production_ids)
+
+    def _segment_error(self, source, bounds, k, productions):
+        """
+        第 k 段分析出错：把这一段连同其后的运算符重新分析一次，
+        出错位置和错误信息与整体分析相同，产生式序列接在前面各段之后
+        """
+        start = bounds[k] if k else 0
+        end = bounds[k + 1] + 1 if k + 1 < len(bounds) - 1 else len(source)
+        zero = '0' if isinstance(source, str) else b'0'
+        text = zero + source[start:end] if k else source[start:end]
+        parser = self.parser
+        parser.parse(text, trace='off')
+        error_pos = parser.error_pos
+        if k:
+            error_pos += start - 1
+            productions.extend(parser.production_ids[_PREFIX_PRODUCTIONS:])
+        else:
+            productions.extend(parser.production_ids)
+        return ParseResult(False, error_pos, parser.error, productions)
+
+
+def parse_split(source, workers=None, cache_dir=None, **options):
+    """用临时进程池并行分析一个表达式，返回 ParseResult（参数见 SplitParser）"""
+    with SplitParser(workers, cache_dir=cache_dir, **options) as parser:
+        return parser.parse(source)
@@ -0,0 +1,25 @@
+"""
+分析过程的记录模式
+
+分析器的 parse 方法通过 trace 参数选择如何处理分析过程：
+- TRACE_PRINT: 记录步骤并打印分析过程表（原有行为）
+- TRACE_RECORD: 只记录紧凑的步骤日志，需要时再调用 format_trace() 格式化
+- TRACE_OFF: 不记录也不输出，只给出分析结果，适合批量校验
+"""
+
+TRACE_OFF = 'off'
+TRACE_RECORD = 'record'
+TRACE_PRINT = 'print'
+
+TRACE_MODES = (TRACE_OFF, TRACE_RECORD, TRACE_PRINT)
+
+
+def check_trace_mode(trace):
+    """规范化 trace 参数，True/False 分别对应打印和关闭"""
+    if trace is True:
+        return TRACE_PRINT
+    if trace is False or trace is None:
+        return TRACE_OFF
+    if trace not in TRACE_MODES:
+        raise ValueError(f"未知的记录模式: {trace!r}，可选值为 {', '.join(TRACE_MODES)}")
+    return trace
@@ -0,0 +1,76 @@
+"""
+分析表的磁盘缓存
+
+分析器构造好分析表后，用 marshal 序列化写入缓存目录，文件名由文法的哈希值决定。
+下次创建分析器时如果哈希相同就直接加载，不再消除左递归、计算FIRST/FOLLOW集或构造项目集族。
+缓存目录由分析器的 cache_dir 参数或环境变量 SYNTAX_ANALYZER_CACHE_DIR 指定，都没有时不使用缓存。
+缓存只是加速手段，读写失败时一律按未命中处理。
+"""
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+
+CACHE_DIR_ENV = 'SYNTAX_ANALYZER_CACHE_DIR'
+
+# 分析表的存储格式或构造算法变化时递增，使旧缓存失效
+CACHE_FORMAT_VERSION = 1
+
+_MAGIC = b'SATC'
+
+
+def default_cache_dir():
+    return os.environ.get(CACHE_DIR_ENV) or None
+
+
+def grammar_key(kind, *parts):
+    """
+    由分析器类型、文法等内容计算缓存键
+    parts 中的集合需要先排序，保证同一文法总是得到相同的键
+    """
+    text = repr((CACHE_FORMAT_VERSION, sys.version_info[:2], kind) + parts)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _cache_path(cache_dir, kind, key):
+    return os.path.join(cache_dir, f"{kind}-{key[:32]}.bin")
+
+
+def load_tables(cache_dir, kind, key):
+    """读取缓存的分析表，未命中或文件损坏时返回 None"""
+    if not cache_dir:
+        return None
+    try:
+        with open(_cache_path(cache_dir, kind, key), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    header = _MAGIC + bytes.fromhex(key)
+    if not data.startswith(header):
+        return None
+    try:
+        return marshal.loads(data[len(header):])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+
+def store_tables(cache_dir, kind, key, tables):
+    """把分析表写入缓存，先写临时文件再原子替换，返回是否写入成功"""
+    if not cache_dir:
+        return False
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{kind}-", dir=cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_MAGIC + bytes.fromhex(key))
+                f.write(marshal.dumps(tables))
+            os.replace(tmp_path, _cache_path(cache_dir, kind, key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except (OSError, ValueError):
+        return False
+    return True